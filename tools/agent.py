@@ -5,7 +5,7 @@ import xml.etree.ElementTree as ET
 import time
 import io
 from datetime import datetime, timedelta # Added timedelta
-from typing import Tuple, List, Dict, Optional, Callable, Union # Added Optional, Callable, and Union
+from typing import Tuple, List, Dict, Optional, Callable, Union, Iterable # Added Optional, Callable, and Union
 import PyPDF2 # type: ignore
 import google.generativeai as genai
 import inspect
@@ -14,20 +14,30 @@ import json # For parsing LLM output for references
 import re
 import shutil
 import random # Added for selecting a random paper for style
+import threading
+import multiprocessing
+import queue
+import hashlib
+import mmap
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor, Future, wait, as_completed, FIRST_COMPLETED
 
 # Import for specific Google API exceptions
 from google.api_core import exceptions as google_api_exceptions
 # Imports for Scopus integration
-from pdf2image import convert_from_path # type: ignore
 import pytesseract # type: ignore
-import tempfile # Added import for tempfile
+from tools.http_session import get_http_session
+from tools.arxiv_feed import ARXIV_FEED_CHUNK_SIZE, iter_arxiv_atom_entries
+from tools.pdf_ocr import ocr_pdf_page, convert_pdf_to_text_ocr
+
+_usage_metadata_lock = threading.Lock() # LLM calls may run on worker threads
 
 def save_usage_metadata(usage_metadata, function_name: str):
     """Save usage metadata to a file with timestamp and function name."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     metadata_file = "usage_metadata.txt"
     
-    with open(metadata_file, "a", encoding="utf-8") as f:
+    with _usage_metadata_lock, open(metadata_file, "a", encoding="utf-8") as f:
         f.write(f"\n[{timestamp}] Function: {function_name}\n")
         f.write(f"Usage Metadata: {usage_metadata}\n")
         f.write("-" * 80 + "\n")
@@ -39,6 +49,7 @@ YELLOW = '\033[93m' # For warnings
 RESET = '\033[0m' # Global Scopus API Key removed
 
 summary_model = None # Will be initialized after API key is configured
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-preview-05-20' # Also part of the summary cache key
 
 # Optional: If tesseract is not in PATH (for Scopus OCR)
 # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
@@ -68,6 +79,8 @@ NO_LLM_CONFIRMED_RELEVANT_PAPERS = "NO_LLM_CONFIRMED_RELEVANT_PAPERS" # New stat
 # --- Token for critical LLM API failures ---
 LLM_API_CRITICAL_FAILURE_TOKEN = "LLM_API_CRITICAL_FAILURE_TOKEN"
 LLM_ERROR_PREFIXES = ("% Error", "% Quota", "% MAX_TOKENS", LLM_API_CRITICAL_FAILURE_TOKEN)
+# Error strings returned by the summarization helpers (never cached in the paper store)
+SUMMARY_ERROR_PREFIXES = ("Error", "File upload error", "Summarization error", "Fallback summarization error")
 
 # --- Constants for Snowballing ---
 MAX_SNOWBALL_ITERATIONS = 1 # How many rounds of snowballing from relevant papers
@@ -83,16 +96,207 @@ def initialize_gemini_model(api_key: str):
         raise ValueError("Gemini API key is required.")
     try:
         genai.configure(api_key=api_key)
-        summary_model = genai.GenerativeModel('gemini-2.5-flash-preview-05-20') # Updated to a more recent model
+        summary_model = genai.GenerativeModel(GEMINI_MODEL_NAME) # Updated to a more recent model
         print(f"{BLUE}Gemini model initialized successfully.{RESET}")
     except Exception as e:
         print(f"{RED}Error initializing Gemini model. Please check model name and API key: {e}{RESET}")
         raise
 
+# --- Constants for the persistent paper store ---
+PAPER_STORE_FOLDER = "paper_store" # Survives runs; process_papers never wipes it
+PAPER_STORE_MAX_BYTES = 2 * 1024 ** 3 # Least recently used papers are evicted above this size
+
+# --- Constants for the summary cache ---
+SUMMARY_CACHE_FOLDER = "summary_cache" # Survives runs; process_papers never wipes it
+SUMMARY_CACHE_MAX_ENTRIES = 5000
+SUMMARY_CACHE_MAX_BYTES = 200 * 1024 ** 2
+SUMMARY_PROMPT_VERSION = "2" # Bump whenever the summarization prompts change to invalidate cached summaries
+
+# --- Constants for the LLM response cache ---
+LLM_RESPONSE_CACHE_ENABLED = False # Opt-in: replay identical generate_content_from_prompt calls from disk
+LLM_RESPONSE_CACHE_FOLDER = "llm_response_cache" # Survives runs; process_papers never wipes it
+LLM_RESPONSE_CACHE_MAX_ENTRIES = 2000
+LLM_RESPONSE_CACHE_MAX_BYTES = 100 * 1024 ** 2
+LLM_RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+# --- Constants for Gemini file uploads ---
+GEMINI_FILE_TTL_SECONDS = 48 * 3600 # Gemini deletes uploaded files after 48 hours
+GEMINI_FILE_EXPIRY_MARGIN_SECONDS = 600 # Re-upload instead of reusing a handle this close to expiry
+
+# --- Constants for arXiv API paging ---
+ARXIV_API_MIN_INTERVAL_SECONDS = 3.0 # arXiv asks for at least 3 seconds between API calls
+ARXIV_MIN_PAGE_SIZE = 10
+ARXIV_MAX_PAGE_SIZE = 100
+ARXIV_INITIAL_KEEP_RATIO = 0.5 # Assumed share of returned entries that are kept, until a page has been seen
+ARXIV_PAGE_SIZE_MARGIN = 1.5 # Request this many times the entries expected to be needed
+
+# --- Constants for concurrent PDF downloads ---
+PDF_DOWNLOAD_MAX_WORKERS = 6 # Total number of PDFs downloaded at the same time
+PDF_DOWNLOAD_PER_HOST_LIMIT = 2 # Politeness limit: simultaneous downloads from a single host (e.g. arxiv.org)
+PDF_DOWNLOAD_CHUNK_SIZE = 64 * 1024 # Bytes written to disk per streamed chunk
+
+# --- Constants for PDF-to-text conversion ---
+PDF_CONVERSION_MAX_WORKERS = os.cpu_count() or 1 # Worker processes for text extraction
+PDF_CONVERSION_TIMEOUT_SECONDS = 300 # Per-file limit (including OCR of sparse pages) so one pathological PDF cannot stall the batch
+PDF_CONVERSION_POLL_SECONDS = 0.2 # How often pending conversions are checked against their deadlines
+PDF_HYBRID_OCR_ENABLED = True # OCR individual pages whose text layer is missing or too sparse
+OCR_FALLBACK_MIN_CHARS_PER_PAGE = 100 # Pages with fewer extracted characters than this are OCRed
+CONVERSION_STATUS_SUCCESS = "success"
+CONVERSION_STATUS_EMPTY = "empty" # No text layer (image-based or blank PDF)
+CONVERSION_STATUS_ENCRYPTED = "encrypted"
+CONVERSION_STATUS_ERROR = "error"
+CONVERSION_STATUS_TIMEOUT = "timeout"
+
 # --- Global Rate Limiting for LLM Calls ---
-LLM_CALL_COUNT = 0
-LLM_CALLS_BEFORE_WAIT = 10
-LLM_WAIT_SECONDS = 60
+LLM_REQUESTS_PER_MINUTE = 10 # Gemini requests-per-minute budget; raise to match a paid tier
+LLM_TOKENS_PER_MINUTE = 250000 # Gemini tokens-per-minute budget
+LLM_FILE_PART_TOKEN_ESTIMATE = 8000 # Assumed input tokens for an uploaded non-text file (e.g. a paper PDF)
+LLM_MAX_PROMPT_TOKENS = 1000000 # Model input window; prompts estimated above it fail fast instead of being sent
+ESTIMATED_CHARS_PER_TOKEN = 4
+REFERENCE_TEXT_TOKEN_BUDGET = 18750 # Reference-section text sent for title extraction
+LLM_QUOTA_RETRY_SECONDS = 60 # Pause applied to all callers after a 429 quota error
+LLM_QUOTA_MAX_RETRIES = 3 # Retries of one call after 429 errors before the error is raised to the caller
+SUMMARY_MAX_WORKERS = 4 # Papers summarized concurrently by batch_summarize_papers
+PAPER_ANALYSIS_COMBINED = True # One JSON call per paper returns summary, relevance verdict and cited references
+COMBINED_ANALYSIS_MAX_REFERENCES = 30 # References kept from a combined analysis, most relevant first
+RELEVANCE_SCORE_THRESHOLD = 0.5 # Papers scored below this (0.0-1.0) by the structured verdict are excluded
+RELEVANCE_LABELS = ("relevant", "partially_relevant", "not_relevant")
+
+# --- Constants for the abstract pre-screen ---
+PRESCREEN_ENABLED = True # Score title + abstract before PDF conversion and full-document summarization
+LAZY_PDF_DOWNLOAD = True # Search arXiv and Scopus for metadata first; download PDFs only for papers kept by the pre-screen
+PRESCREEN_SCORE_THRESHOLD = 0.3 # Lenient on purpose: an abstract says less than the full paper
+PRESCREEN_LEXICAL_THRESHOLD = 0.15 # Threshold for the local keyword-overlap fallback scorer
+PRESCREEN_BATCH_SIZE = 25 # Abstracts scored per LLM call
+PRESCREEN_ABSTRACT_MAX_CHARS = 1500
+PRESCREEN_STOPWORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "into", "is", "it", "of",
+    "on", "or", "the", "their", "this", "to", "using", "via", "what", "with", "review", "systematic",
+    "literature", "study", "studies", "survey", "approach", "approaches", "based", "paper", "papers"
+))
+
+# --- Constants for section generation ---
+SECTION_GENERATION_MAX_WORKERS = 3 # Section and chart passes whose inputs are ready run concurrently
+INCREMENTAL_REFINEMENT = True # Refinement cycles regenerate only sections with new feedback or changed inputs
+SECTION_SUMMARIES_TOKEN_BUDGET = 200000 # Summary tokens packed into one section prompt; the lowest-ranked rest is left out
+SECTION_CONTEXT_FOCUS = { # Extra terms that rank summaries for each consumer of the packed summaries
+    "Outline": "",
+    "Bibliography": "authors venue journal conference published",
+    "Related Works": "approach method model framework comparison prior work",
+    "Research Methods": "methodology dataset experiment evaluation protocol study design",
+    "Review Findings": "results findings performance outcome evidence",
+    "Discussion_Conclusion": "limitations challenges implications future work",
+}
+MAP_REDUCE_SYNTHESIS_ENABLED = True # Large reviews: synthesize thematic clusters of summaries before the section prompts
+MAP_REDUCE_MIN_PAPERS = 40 # Below this many papers the summaries are sent to the sections directly
+MAP_REDUCE_CLUSTER_SIZE = 12 # Upper bound on summaries (or partial syntheses) merged by one call
+MAP_REDUCE_MAX_WORKERS = 4 # Cluster syntheses run concurrently
+
+class TokenBucketRateLimiter:
+    """
+    Thread-safe token-bucket limiter with a requests-per-minute and a tokens-per-minute
+    budget. Both buckets refill continuously, so callers only block when a budget is
+    actually exhausted. Token usage is reserved from an estimate and corrected once the
+    real usage is known.
+    """
+
+    def __init__(self, requests_per_minute: int = LLM_REQUESTS_PER_MINUTE, tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        self.requests_per_minute = max(1, requests_per_minute)
+        self.tokens_per_minute = max(1, tokens_per_minute)
+        self._available_requests = float(self.requests_per_minute)
+        self._available_tokens = float(self.tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._available_requests = min(self.requests_per_minute, self._available_requests + elapsed * self.requests_per_minute / 60.0)
+        self._available_tokens = min(self.tokens_per_minute, self._available_tokens + elapsed * self.tokens_per_minute / 60.0)
+
+    def acquire(self, estimated_tokens: int = 0) -> None:
+        """Blocks until one request and estimated_tokens fit in the budgets, then reserves them."""
+        # A single request larger than the whole budget only waits for a full bucket
+        needed_tokens = min(max(0, estimated_tokens), self.tokens_per_minute)
+        with self._condition:
+            while True:
+                self._refill()
+                wait_seconds = self._paused_until - time.monotonic()
+                if wait_seconds <= 0:
+                    request_deficit = 1 - self._available_requests
+                    token_deficit = needed_tokens - self._available_tokens
+                    if request_deficit <= 0 and token_deficit <= 0:
+                        self._available_requests -= 1
+                        self._available_tokens -= needed_tokens
+                        return
+                    wait_seconds = max(request_deficit * 60.0 / self.requests_per_minute,
+                                       token_deficit * 60.0 / self.tokens_per_minute)
+                    print(f"LLM rate limit budget exhausted. Waiting {wait_seconds:.1f}s...")
+                self._condition.wait(timeout=wait_seconds)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Corrects the token bucket once the real usage of a reserved request is known."""
+        with self._condition:
+            self._available_tokens -= (actual_tokens - min(max(0, estimated_tokens), self.tokens_per_minute))
+            self._condition.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Blocks every caller for the given time, e.g. after the API reports a quota error."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+
+llm_rate_limiter = TokenBucketRateLimiter()
+
+def estimate_prompt_tokens(contents) -> int:
+    """Rough input-token estimate (ESTIMATED_CHARS_PER_TOKEN characters per token) for a prompt or list of prompt parts."""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    estimate = 0
+    for part in parts:
+        if isinstance(part, str):
+            estimate += len(part) // ESTIMATED_CHARS_PER_TOKEN
+        elif str(getattr(part, 'mime_type', '')).startswith('text/') and getattr(part, 'size_bytes', None):
+            estimate += int(part.size_bytes) // ESTIMATED_CHARS_PER_TOKEN
+        else:
+            estimate += LLM_FILE_PART_TOKEN_ESTIMATE
+    return estimate
+
+def is_quota_error(error: Exception) -> bool:
+    """True for Gemini 429 / quota-exhausted errors."""
+    error_str = str(error)
+    return isinstance(error, google_api_exceptions.ResourceExhausted) or ("429" in error_str and "quota" in error_str.lower())
+
+def generate_with_rate_limit(contents, generation_config=None):
+    """
+    Calls summary_model.generate_content through the shared llm_rate_limiter.
+    Every Gemini generation in this module goes through here. Prompts estimated above
+    LLM_MAX_PROMPT_TOKENS raise ValueError before any quota is spent on them.
+    A 429 quota error pauses the shared limiter for every caller and the call is retried
+    up to LLM_QUOTA_MAX_RETRIES times before the error is raised.
+    """
+    estimated_tokens = estimate_prompt_tokens(contents)
+    if estimated_tokens > LLM_MAX_PROMPT_TOKENS:
+        raise ValueError(f"Prompt of about {estimated_tokens} tokens exceeds LLM_MAX_PROMPT_TOKENS ({LLM_MAX_PROMPT_TOKENS}); not sent")
+    attempt = 0
+    while True:
+        llm_rate_limiter.acquire(estimated_tokens)
+        try:
+            response = summary_model.generate_content(contents, generation_config=generation_config)
+            break
+        except Exception as e:
+            if not is_quota_error(e) or attempt >= LLM_QUOTA_MAX_RETRIES:
+                raise
+            attempt += 1
+            print(f"{YELLOW}Quota error (429). Pausing all LLM calls for {LLM_QUOTA_RETRY_SECONDS}s... (Retry {attempt}/{LLM_QUOTA_MAX_RETRIES}){RESET}")
+            llm_rate_limiter.pause(LLM_QUOTA_RETRY_SECONDS)
+    usage_metadata = getattr(response, 'usage_metadata', None)
+    actual_tokens = getattr(usage_metadata, 'total_token_count', 0) if usage_metadata else 0
+    if actual_tokens:
+        llm_rate_limiter.record_usage(estimated_tokens, actual_tokens)
+    return response
 
 TABLE_RULES = r"""
 **TABLE-SPECIFIC RULES:**
@@ -901,21 +1105,660 @@ def parse_usage_metadata_file(metadata_file: str = "usage_metadata.txt") -> Dict
     return parsed_data
 
 
+# --- Paper Record ---
+TEXT_EMPTINESS_PROBE_BYTES = 4096 # Files smaller than this are read to rule out whitespace-only content
+
+def text_file_has_content(txt_path: Optional[str]) -> bool:
+    """
+    True if the text file exists and holds non-whitespace text. Decided from the file size;
+    only files under TEXT_EMPTINESS_PROBE_BYTES are actually read.
+    """
+    if not txt_path or not os.path.isfile(txt_path):
+        return False
+    size = os.path.getsize(txt_path)
+    if size == 0:
+        return False
+    if size >= TEXT_EMPTINESS_PROBE_BYTES:
+        return True
+    with open(txt_path, 'rb') as f:
+        return bool(f.read().strip())
+
+
+def normalize_published_year(value) -> Optional[int]:
+    """Returns a publication year as an int ('2021', 2021, '2021-05-01'), or None if unknown."""
+    if isinstance(value, int):
+        return value
+    match = re.match(r'\s*(\d{4})', str(value or ''))
+    return int(match.group(1)) if match else None
+
+
+class Paper(MutableMapping):
+    """
+    Compact record for one candidate paper. Common fields live in __slots__ with
+    normalized types (published_year is an int or None, authors a list, id_primary
+    always set); any other key goes to `extra`. It reads and writes like the metadata
+    dicts it replaces, so meta.get('title') and meta['summary_text'] = ... keep working.
+    Heavy attributes are lazy: 'text' is read from local_txt_path on access and
+    'summary_text' from summary_filepath when it is not held in memory. Neither is
+    cached, so a list of Papers never holds full paper texts.
+    """
+    __slots__ = (
+        'id_primary', 'source', 'title', 'authors', 'published_year', 'doi', 'arxiv_id',
+        'scopus_id', 'id_url', 'pdf_url', 'journal_ref', 'abstract_api', 'local_pdf_path',
+        'local_txt_path', 'filename', 'summary_filepath', '_summary_text', '_text', 'extra'
+    )
+    FIELDS = __slots__[:-3]
+    HEAVY_FIELDS = ('summary_text', 'text')
+    KEY_ALIASES = {'summary': 'abstract_api'} # arXiv's Atom <summary> is the abstract
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, None)
+        self.extra = {}
+        for key, value in fields.items():
+            self[key] = value
+        if not self.id_primary:
+            self.id_primary = self._derive_id_primary()
+
+    @classmethod
+    def from_mapping(cls, meta: Mapping) -> 'Paper':
+        """Returns meta itself if it already is a Paper, else a Paper built from its items."""
+        return meta if isinstance(meta, Paper) else cls(**meta)
+
+    def _derive_id_primary(self) -> str:
+        if self.arxiv_id:
+            return sanitize_filename(f"arxiv_{self.arxiv_id}")
+        if self.scopus_id:
+            return sanitize_filename(f"scopus_{self.scopus_id}")
+        if self.doi:
+            return sanitize_filename(f"doi_{self.doi}")
+        source_path = self.local_pdf_path or self.local_txt_path or self.title or 'unknown'
+        return sanitize_filename(os.path.splitext(os.path.basename(str(source_path)))[0])
+
+    def __getitem__(self, key: str):
+        key = self.KEY_ALIASES.get(key, key)
+        if key == 'text':
+            if self._text is not None:
+                return self._text
+            if self.local_txt_path and os.path.exists(self.local_txt_path):
+                with open(self.local_txt_path, 'r', encoding='utf-8') as f:
+                    return f.read()
+            raise KeyError(key)
+        if key == 'summary_text':
+            if self._summary_text is None and self.summary_filepath and os.path.exists(self.summary_filepath):
+                with open(self.summary_filepath, 'r', encoding='utf-8') as f:
+                    return f.read()
+            if self._summary_text is None:
+                raise KeyError(key)
+            return self._summary_text
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value) -> None:
+        key = self.KEY_ALIASES.get(key, key)
+        if key == 'text':
+            self._text = value
+        elif key == 'summary_text':
+            self._summary_text = value
+        elif key == 'published_year':
+            self.published_year = normalize_published_year(value)
+        elif key == 'authors':
+            self.authors = [value] if isinstance(value, str) else list(value or [])
+        elif key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        key = self.KEY_ALIASES.get(key, key)
+        if key in self.HEAVY_FIELDS or key in self.FIELDS:
+            if key not in self:
+                raise KeyError(key)
+            setattr(self, '_' + key if key in self.HEAVY_FIELDS else key, None)
+        else:
+            del self.extra[key]
+
+    def __contains__(self, key) -> bool:
+        key = self.KEY_ALIASES.get(key, key)
+        if key in self.HEAVY_FIELDS:
+            # Only what is held in memory; membership checks never touch the disk
+            return getattr(self, '_' + key) is not None
+        if key in self.FIELDS:
+            return getattr(self, key) is not None
+        return key in self.extra
+
+    def __iter__(self):
+        # Heavy fields are listed only when held in memory, so dict(paper) never reads files
+        for name in self.FIELDS:
+            if getattr(self, name) is not None:
+                yield name
+        for name in self.HEAVY_FIELDS:
+            if getattr(self, '_' + name) is not None:
+                yield name
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Paper(id_primary={self.id_primary!r}, title={(self.title or '')[:50]!r})"
+
+    def copy(self) -> 'Paper':
+        duplicate = Paper(**self.to_dict(include_heavy=False))
+        duplicate._summary_text, duplicate._text = self._summary_text, self._text
+        return duplicate
+
+    def to_dict(self, include_heavy: bool = False) -> Dict[str, any]:
+        """Plain dict of the record for caching or JSON; heavy fields only if include_heavy."""
+        record = {name: getattr(self, name) for name in self.FIELDS if getattr(self, name) is not None}
+        if include_heavy and self._summary_text is not None:
+            record['summary_text'] = self._summary_text
+        if include_heavy and self._text is not None:
+            record['text'] = self._text
+        record.update(self.extra)
+        return record
+
+
+# --- Persistent Paper Store ---
+def file_sha256(file_path: str) -> str:
+    """Returns the hex SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_subject(subject: str) -> str:
+    """Lowercases and collapses whitespace so equivalent subjects share cached summaries."""
+    return re.sub(r'\s+', ' ', (subject or '').strip().lower())
+
+def paper_store_keys(paper_meta: Dict[str, any]) -> List[str]:
+    """Returns the store keys ('arxiv:<id>', 'doi:<doi>') that identify a paper's metadata dict."""
+    keys = []
+    arxiv_id = paper_meta.get('arxiv_id')
+    if arxiv_id:
+        keys.append(f"arxiv:{arxiv_id.strip()}")
+    doi = paper_meta.get('doi')
+    if doi:
+        keys.append(f"doi:{doi.strip().lower()}")
+    return keys
+
+
+class PaperStore:
+    """
+    Persistent, content-addressed store for papers that survives across runs.
+    Each entry has its own folder holding the PDF, extracted text and metadata.json,
+    and is reachable through any of its keys: 'arxiv:<id>', 'doi:<doi>' or
+    'sha256:<hash of the PDF>'. Per-subject summaries live in summary_cache.
+    Entries are evicted least-recently-used first once the store exceeds max_bytes.
+    """
+    INDEX_FILENAME = "index.json"
+    FILE_NAMES = {'pdf': 'paper.pdf', 'txt': 'paper.txt'}
+
+    def __init__(self, root_folder: str = PAPER_STORE_FOLDER, max_bytes: int = PAPER_STORE_MAX_BYTES):
+        self.root_folder = root_folder
+        self.max_bytes = max_bytes
+        self._index: Optional[Dict[str, Dict]] = None
+        self._lock = threading.RLock()
+
+    # Index handling
+    def _index_path(self) -> str:
+        return os.path.join(self.root_folder, self.INDEX_FILENAME)
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if self._index is None:
+            self._index = {'entries': {}, 'aliases': {}}
+            if os.path.exists(self._index_path()):
+                try:
+                    with open(self._index_path(), 'r', encoding='utf-8') as f:
+                        loaded = json.load(f)
+                    self._index['entries'] = loaded.get('entries', {})
+                    self._index['aliases'] = loaded.get('aliases', {})
+                except (OSError, ValueError) as e:
+                    print(f"{YELLOW}Warning: Paper store index unreadable, starting empty: {e}{RESET}")
+        return self._index
+
+    def _save_index(self) -> None:
+        os.makedirs(self.root_folder, exist_ok=True)
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path())
+
+    def _entry_dir(self, entry_id: str) -> str:
+        return os.path.join(self.root_folder, entry_id)
+
+    def _resolve(self, keys: List[str]) -> Optional[str]:
+        aliases = self._load_index()['aliases']
+        for key in keys:
+            entry_id = aliases.get(key)
+            if entry_id and entry_id in self._index['entries']:
+                return entry_id
+        return None
+
+    def _resolve_or_create(self, keys: List[str]) -> str:
+        entry_id = self._resolve(keys)
+        if entry_id is None:
+            entry_id = hashlib.sha256(keys[0].encode('utf-8')).hexdigest()[:24]
+            self._index['entries'][entry_id] = {'keys': [], 'files': {}, 'size': 0, 'last_access': time.time()}
+            os.makedirs(self._entry_dir(entry_id), exist_ok=True)
+        entry = self._index['entries'][entry_id]
+        for key in keys:
+            self._index['aliases'][key] = entry_id
+            if key not in entry['keys']:
+                entry['keys'].append(key)
+        return entry_id
+
+    def _touch(self, entry_id: str) -> None:
+        self._index['entries'][entry_id]['last_access'] = time.time()
+
+    def _refresh_size(self, entry_id: str) -> None:
+        entry_dir = self._entry_dir(entry_id)
+        size = 0
+        for dirpath, _, filenames in os.walk(entry_dir):
+            size += sum(os.path.getsize(os.path.join(dirpath, fn)) for fn in filenames)
+        self._index['entries'][entry_id]['size'] = size
+
+    def _evict(self, keep_entry_id: Optional[str] = None) -> None:
+        entries = self._index['entries']
+        total = sum(e.get('size', 0) for e in entries.values())
+        for entry_id in sorted(entries, key=lambda eid: entries[eid].get('last_access', 0)):
+            if total <= self.max_bytes:
+                break
+            if entry_id == keep_entry_id:
+                continue
+            total -= entries[entry_id].get('size', 0)
+            for key in entries[entry_id].get('keys', []):
+                self._index['aliases'].pop(key, None)
+            del entries[entry_id]
+            shutil.rmtree(self._entry_dir(entry_id), ignore_errors=True)
+            print(f"Paper store: evicted entry {entry_id} to stay under {self.max_bytes} bytes.")
+
+    # Public API
+    def fetch_file(self, keys: List[str], kind: str, dest_path: str) -> bool:
+        """Copies the stored 'pdf' or 'txt' for the paper to dest_path. Returns True on a hit."""
+        if not keys:
+            return False
+        with self._lock:
+            entry_id = self._resolve(keys)
+            if entry_id is None or kind not in self._index['entries'][entry_id]['files']:
+                return False
+            stored_path = os.path.join(self._entry_dir(entry_id), self.FILE_NAMES[kind])
+            if not os.path.exists(stored_path) or os.path.getsize(stored_path) == 0:
+                return False
+            dest_dir = os.path.dirname(dest_path)
+            if dest_dir:
+                os.makedirs(dest_dir, exist_ok=True)
+            shutil.copyfile(stored_path, dest_path)
+            self._touch(entry_id)
+            self._save_index()
+            return True
+
+    def put_file(self, keys: List[str], kind: str, src_path: str) -> None:
+        """Stores a 'pdf' or 'txt' file for the paper. Storing a PDF also registers its sha256 key."""
+        if not os.path.exists(src_path) or os.path.getsize(src_path) == 0:
+            return
+        if kind == 'pdf':
+            keys = list(keys) + [f"sha256:{file_sha256(src_path)}"]
+        if not keys:
+            return
+        with self._lock:
+            try:
+                entry_id = self._resolve_or_create(keys)
+                shutil.copyfile(src_path, os.path.join(self._entry_dir(entry_id), self.FILE_NAMES[kind]))
+                self._index['entries'][entry_id]['files'][kind] = True
+                self._touch(entry_id)
+                self._refresh_size(entry_id)
+                self._evict(keep_entry_id=entry_id)
+                self._save_index()
+            except OSError as e:
+                print(f"{YELLOW}Warning: Could not add {kind} to paper store: {e}{RESET}")
+
+    def put_metadata(self, keys: List[str], paper_meta: Dict[str, any]) -> None:
+        """Stores the JSON-serializable part of a paper's metadata dict."""
+        if not keys:
+            return
+        serializable = {k: v for k, v in paper_meta.items() if isinstance(v, (str, int, float, bool, list, type(None)))}
+        with self._lock:
+            try:
+                entry_id = self._resolve_or_create(keys)
+                with open(os.path.join(self._entry_dir(entry_id), 'metadata.json'), 'w', encoding='utf-8') as f:
+                    json.dump(serializable, f, indent=2)
+                self._touch(entry_id)
+                self._refresh_size(entry_id)
+                self._save_index()
+            except OSError as e:
+                print(f"{YELLOW}Warning: Could not add metadata to paper store: {e}{RESET}")
+
+
+paper_store = PaperStore()
+
+
+class BoundedDiskCache:
+    """
+    Persistent key -> text cache stored as one file per entry plus a JSON index.
+    Least recently used entries are evicted once max_entries or max_bytes is exceeded,
+    and entries older than ttl_seconds (if set) are treated as misses.
+    Keeps hit/miss counters for reporting. Thread-safe.
+    """
+    INDEX_FILENAME = "index.json"
+
+    def __init__(self, root_folder: str, max_entries: int, max_bytes: int, ttl_seconds: Optional[float] = None):
+        self.root_folder = root_folder
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._index: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Builds a stable cache key from the given parts."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.root_folder, self.INDEX_FILENAME)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.root_folder, f"{key}.txt")
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if self._index is None:
+            self._index = {}
+            if os.path.exists(self._index_path()):
+                try:
+                    with open(self._index_path(), 'r', encoding='utf-8') as f:
+                        self._index = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"{YELLOW}Warning: Cache index '{self._index_path()}' unreadable, starting empty: {e}{RESET}")
+        return self._index
+
+    def _save_index(self) -> None:
+        os.makedirs(self.root_folder, exist_ok=True)
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path())
+
+    def _remove(self, key: str) -> None:
+        self._index.pop(key, None)
+        if os.path.exists(self._entry_path(key)):
+            os.remove(self._entry_path(key))
+
+    def _evict(self) -> None:
+        total_bytes = sum(e.get('size', 0) for e in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k].get('last_access', 0)):
+            if len(self._index) <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            total_bytes -= self._index[key].get('size', 0)
+            self._remove(key)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._load_index().get(key)
+            expired = entry is not None and self.ttl_seconds is not None and time.time() - entry.get('created', 0) > self.ttl_seconds
+            if entry is None or expired or not os.path.exists(self._entry_path(key)):
+                if entry is not None:
+                    self._remove(key)
+                    self._save_index()
+                self.misses += 1
+                return None
+            with open(self._entry_path(key), 'r', encoding='utf-8') as f:
+                value = f.read()
+            entry['last_access'] = time.time()
+            self._save_index()
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            try:
+                self._load_index()
+                os.makedirs(self.root_folder, exist_ok=True)
+                with open(self._entry_path(key), 'w', encoding='utf-8') as f:
+                    f.write(value)
+                now = time.time()
+                self._index[key] = {'size': os.path.getsize(self._entry_path(key)), 'created': now, 'last_access': now}
+                self._evict()
+                self._save_index()
+            except OSError as e:
+                print(f"{YELLOW}Warning: Could not write cache entry to '{self.root_folder}': {e}{RESET}")
+
+    def stats_string(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses"
+
+
+summary_cache = BoundedDiskCache(SUMMARY_CACHE_FOLDER, SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_MAX_BYTES)
+
+def summary_cache_key(content_hash: str, subject: str, kind: str = "summary") -> str:
+    """
+    Summary cache key: paper content hash, normalized subject, model name and prompt version.
+    kind separates plain summaries ("summary") from combined analyses ("analysis").
+    """
+    return BoundedDiskCache.make_key(kind, content_hash, normalize_subject(subject), GEMINI_MODEL_NAME, SUMMARY_PROMPT_VERSION)
+
+
+llm_response_cache = BoundedDiskCache(
+    LLM_RESPONSE_CACHE_FOLDER, LLM_RESPONSE_CACHE_MAX_ENTRIES, LLM_RESPONSE_CACHE_MAX_BYTES,
+    ttl_seconds=LLM_RESPONSE_CACHE_TTL_SECONDS
+)
+
+def llm_response_cache_key(prompt: str, generation_config_params: Dict[str, any]) -> str:
+    """Response cache key: model name, generation config and prompt hash."""
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    return BoundedDiskCache.make_key("response", GEMINI_MODEL_NAME, generation_config_params, prompt_hash)
+
+
+# --- Gemini Upload Manager ---
+class GeminiUploadManager:
+    """
+    Keeps a content-hash -> uploaded Gemini file map so identical content is uploaded
+    once and reused by summarization, reference extraction and chart passes.
+    Handles close to their expiration time are re-uploaded. Files are not deleted
+    after each call; cleanup() removes all of them in bulk at the end of a run.
+    """
+
+    def __init__(self):
+        self._handles: Dict[str, Tuple[any, float]] = {} # key -> (uploaded file, expires_at epoch seconds)
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    @staticmethod
+    def _expires_at(uploaded_file) -> float:
+        expiration_time = getattr(uploaded_file, 'expiration_time', None)
+        try:
+            return expiration_time.timestamp()
+        except (AttributeError, OverflowError, ValueError):
+            return time.time() + GEMINI_FILE_TTL_SECONDS
+
+    def _get_or_upload(self, key: str, upload: Callable[[], any]):
+        # Per-key lock: concurrent callers with the same content wait for a single upload
+        with self._lock_for(key):
+            with self._lock:
+                cached = self._handles.get(key)
+            if cached and time.time() < cached[1] - GEMINI_FILE_EXPIRY_MARGIN_SECONDS:
+                return cached[0]
+            uploaded_file = upload()
+            with self._lock:
+                self._handles[key] = (uploaded_file, self._expires_at(uploaded_file))
+            return uploaded_file
+
+    def upload_path(self, path: str, mime_type: str, display_name: str):
+        """Uploads a local file, or returns the existing handle for identical content."""
+        key = f"{mime_type}:{file_sha256(path)}"
+        return self._get_or_upload(key, lambda: genai.upload_file(path=path, mime_type=mime_type, display_name=display_name[:100]))
+
+    def upload_text(self, text: str, display_name: str, mime_type: str = 'text/plain'):
+        """Uploads in-memory text, or returns the existing handle for identical text."""
+        data = text.encode('utf-8')
+        key = f"{mime_type}:{hashlib.sha256(data).hexdigest()}"
+        return self._get_or_upload(key, lambda: genai.upload_file(path=io.BytesIO(data), mime_type=mime_type, display_name=display_name[:100]))
+
+    def cleanup(self) -> int:
+        """Deletes every file uploaded through this manager. Returns the number deleted."""
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        deleted = 0
+        for uploaded_file, _ in handles:
+            try:
+                genai.delete_file(uploaded_file.name)
+                deleted += 1
+            except Exception as delete_error:
+                print(f"{YELLOW}Warning: Could not delete uploaded file {getattr(uploaded_file, 'name', '?')}: {delete_error}{RESET}")
+        return deleted
+
+
+gemini_uploads = GeminiUploadManager()
+
+
+SECTION_CONTEXT_PLACEHOLDER = "% This file was intentionally left empty due to invalid input content.\n"
+
+
+def upload_section_context_files(files_to_upload_content: Dict[str, str]) -> list:
+    """
+    Uploads section-generation context files through the run-scoped gemini_uploads registry.
+    Identical content (e.g. the same summaries or .bib passed to several sections) is uploaded
+    once and the handle shared; invalid/empty content becomes a shared placeholder so prompt
+    references don't break. A shared handle keeps the display name of its first upload, so each
+    handle is preceded by a text part naming the file(s) the prompt refers to it as.
+    Returns the prompt parts in input order. Files are deleted by gemini_uploads.cleanup()
+    at the end of the run, not per section.
+    """
+    names_by_handle: Dict[any, List[str]] = {}
+    handles_by_key: Dict[any, any] = {}
+    for name, content_str in files_to_upload_content.items():
+        if not (content_str and content_str.strip() and not content_str.startswith("% Error")):
+            content_str = SECTION_CONTEXT_PLACEHOLDER
+        mime_type = 'text/markdown' if name.endswith(".md") else 'text/plain' # BibTeX is plain text
+        uploaded_file = gemini_uploads.upload_text(content_str, display_name=name, mime_type=mime_type)
+        if not uploaded_file:
+            continue
+        handle_key = getattr(uploaded_file, 'name', None) or id(uploaded_file)
+        if handle_key not in names_by_handle:
+            names_by_handle[handle_key] = []
+            handles_by_key[handle_key] = uploaded_file
+        names_by_handle[handle_key].append(name)
+
+    prompt_parts = []
+    for handle_key, names in names_by_handle.items():
+        quoted_names = " and ".join(f"'{name}'" for name in names)
+        prompt_parts.append(f"The next attached file is referred to as {quoted_names}.")
+        prompt_parts.append(handles_by_key[handle_key])
+    return prompt_parts
+
+
+class PdfDownloadPool:
+    """
+    Bounded thread pool that downloads PDFs in the background, streaming each
+    response to disk. A per-host semaphore keeps the number of simultaneous
+    requests to any single host under a politeness limit.
+    """
+
+    def __init__(self, max_workers: int = PDF_DOWNLOAD_MAX_WORKERS, per_host_limit: int = PDF_DOWNLOAD_PER_HOST_LIMIT):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="pdf-download")
+        self._per_host_limit = max(1, per_host_limit)
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore_for(self, url: str) -> threading.BoundedSemaphore:
+        host = urllib.parse.urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self._per_host_limit)
+            return self._host_semaphores[host]
+
+    def _download(self, url: str, dest_path: str, headers: Optional[Dict[str, str]], timeout: int) -> str:
+        # Write to a partial file first so a failed download never leaves a truncated PDF behind.
+        partial_path = dest_path + ".part"
+        with self._semaphore_for(url):
+            try:
+                with get_http_session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+                    response.raise_for_status()
+                    with open(partial_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=PDF_DOWNLOAD_CHUNK_SIZE):
+                            if chunk:
+                                f.write(chunk)
+                os.replace(partial_path, dest_path)
+            except Exception:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+        return dest_path
+
+    def submit(self, url: str, dest_path: str, headers: Optional[Dict[str, str]] = None, timeout: int = 60) -> Future:
+        """Queues a download. The returned future resolves to dest_path or raises the download error."""
+        return self._executor.submit(self._download, url, dest_path, headers, timeout)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
+        return False
+
+
+_arxiv_api_lock = threading.Lock()
+_arxiv_last_request_time = 0.0
+
+def wait_for_arxiv_api_slot() -> None:
+    """Sleeps only as long as needed to keep ARXIV_API_MIN_INTERVAL_SECONDS between arXiv API calls."""
+    global _arxiv_last_request_time
+    with _arxiv_api_lock:
+        remaining = _arxiv_last_request_time + ARXIV_API_MIN_INTERVAL_SECONDS - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        _arxiv_last_request_time = time.monotonic()
+
+
+def arxiv_date_filtered_query(search_query: str, year_range: Tuple[int, int]) -> str:
+    """Adds a submittedDate range so arXiv only returns papers inside year_range."""
+    return f"({search_query}) AND submittedDate:[{year_range[0]}01010000 TO {year_range[1]}12312359]"
+
+
+def arxiv_page_size(papers_still_needed: int, keep_ratio: float) -> int:
+    """Entries to request so that, at the observed keep ratio, one page is likely to be enough."""
+    expected_needed = papers_still_needed / max(keep_ratio, 0.05) * ARXIV_PAGE_SIZE_MARGIN
+    return int(min(max(expected_needed, ARXIV_MIN_PAGE_SIZE), ARXIV_MAX_PAGE_SIZE))
+
+
 def fetch_arxiv_papers(
     search_query_str: str,
     year_range: Tuple[int, int] = (2000, datetime.now().year),
     num_papers: int = 5,
     pdf_folder: str = "pdf_papers",
-    already_fetched_primary_ids: set = None
+    already_fetched_primary_ids: set = None,
+    download_workers: int = PDF_DOWNLOAD_MAX_WORKERS,
+    per_host_limit: int = PDF_DOWNLOAD_PER_HOST_LIMIT,
+    download_pdfs: bool = True
 ) -> Tuple[List[Dict], int, str]:
     """
     Fetch new papers from ArXiv with enhanced error handling and retry logic.
+    PDFs are queued on a bounded PdfDownloadPool as entries are parsed, so API
+    paging continues while earlier files are still streaming to disk.
+    With download_pdfs=False only metadata and abstracts are returned ('local_pdf_path'
+    is where the PDF will go); download_paper_pdfs fetches the PDFs later for the
+    papers that are kept.
     """
     os.makedirs(pdf_folder, exist_ok=True)
     if already_fetched_primary_ids is None:
         already_fetched_primary_ids = set()
 
-    newly_fetched_papers_metadata_list = []
     newly_fetched_and_saved_count = 0
     base_url = 'http://export.arxiv.org/api/query?'
     
@@ -924,150 +1767,173 @@ def fetch_arxiv_papers(
         search_query_for_api = search_query_str
     else:
         search_query_for_api = f'all:"{search_query_str}"'
+    search_query_for_api = arxiv_date_filtered_query(search_query_for_api, year_range)
     
     print(f"Searching ArXiv for: {search_query_for_api}")
     
     start_index = 0
-    max_results_per_api_call = min(num_papers * 3, 100)
-    
-    while newly_fetched_and_saved_count < num_papers:
-        params = {
-            'search_query': search_query_for_api,
-            'start': start_index,
-            'max_results': max_results_per_api_call,
-            'sortBy': 'relevance',
-            'sortOrder': 'descending'
-        }
-        
-        query_url = base_url + urllib.parse.urlencode(params)
-        
-        try:
-            time.sleep(3)  # Basic rate limiting
-            
-            # First attempt with shorter timeout
+    entries_seen_total = 0
+    entries_kept_total = 0
+    api_exhausted = False
+    headers = {'User-Agent': 'Mozilla/5.0 (compatible; ArXiv-Fetcher/1.0)'}
+
+    # Papers are kept in API (relevance) order; failed downloads are filtered out at the end.
+    accepted_papers_in_order: List[Tuple[Dict, str]] = []
+    failed_primary_ids: set = set()
+    pending_downloads: Dict[Future, Tuple[Dict, str]] = {}
+
+    def _collect_downloads(block: bool) -> None:
+        nonlocal newly_fetched_and_saved_count
+        if not pending_downloads:
+            return
+        done, _ = wait(list(pending_downloads), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            paper_metadata, primary_id = pending_downloads.pop(future)
             try:
-                response = requests.get(query_url, timeout=15)
-            except (requests.exceptions.ConnectionError, ConnectionResetError) as cre:
-                # Retry with longer timeout
-                print(f"{YELLOW}Connection error (retrying): {cre}{RESET}")
-                time.sleep(2)
-                response = requests.get(query_url, timeout=30)
-            
-            response.raise_for_status()
-            
-            root = ET.fromstring(response.content)
-            namespaces = {'atom': 'http://www.w3.org/2005/Atom', 'arxiv': 'http://arxiv.org/schemas/atom'}
-            entries = root.findall('atom:entry', namespaces)
-            
-            print(f"ArXiv API call (start_index {start_index}): Found {len(entries)} entries")
+                future.result()
+                print(f"Saved: {paper_metadata['local_pdf_path']}")
+                newly_fetched_and_saved_count += 1
+                store_keys = paper_store_keys(paper_metadata)
+                paper_store.put_file(store_keys, 'pdf', paper_metadata['local_pdf_path'])
+                paper_store.put_metadata(store_keys, paper_metadata)
+            except Exception as e:
+                print(f"Failed to download {paper_metadata['title']}: {e}")
+                failed_primary_ids.add(primary_id)
+                # Allow a later query to pick this paper up again.
+                already_fetched_primary_ids.discard(primary_id)
+
+    with PdfDownloadPool(max_workers=download_workers, per_host_limit=per_host_limit) as download_pool:
+        while True:
+            _collect_downloads(block=False)
+            if newly_fetched_and_saved_count + len(pending_downloads) >= num_papers:
+                if not pending_downloads:
+                    break
+                # Enough downloads in flight; wait for one to settle in case it fails and needs replacing.
+                _collect_downloads(block=True)
+                continue
+            if api_exhausted:
+                break
+
+            # Page size follows the share of entries kept so far (year filter, already-fetched papers)
+            keep_ratio = entries_kept_total / entries_seen_total if entries_seen_total else ARXIV_INITIAL_KEEP_RATIO
+            max_results_per_api_call = arxiv_page_size(num_papers - newly_fetched_and_saved_count - len(pending_downloads), keep_ratio)
+            params = {
+                'search_query': search_query_for_api,
+                'start': start_index,
+                'max_results': max_results_per_api_call,
+                'sortBy': 'relevance',
+                'sortOrder': 'descending'
+            }
             
-            if not entries:
-                print("No more entries found from ArXiv for this query.")
-                break 
+            query_url = base_url + urllib.parse.urlencode(params)
             
-            current_batch_newly_added = 0
-            for entry in entries:
-                if newly_fetched_and_saved_count >= num_papers:
-                    break
-                
-                title_element = entry.find('atom:title', namespaces)
-                title = title_element.text.strip() if title_element is not None else "N/A Title"
-                
-                published_date_element = entry.find('atom:published', namespaces)
-                if published_date_element is None or not published_date_element.text:
-                    print(f"Skipping paper '{title[:50]}...' due to missing publication date.")
-                    continue
-                    
-                published_date = published_date_element.text
-                try:
-                    published_year = int(published_date[:4])
-                except ValueError:
-                    print(f"Skipping paper '{title[:50]}...' due to invalid publication year format: {published_date[:4]}")
-                    continue
-                    
-                if not (year_range[0] <= published_year <= year_range[1]):
-                    continue
-                
-                id_url_element = entry.find('atom:id', namespaces)
-                id_url = id_url_element.text if id_url_element is not None else ""
-                arxiv_id_match = re.search(r'abs/([^v]+)', id_url)
-                arxiv_id = arxiv_id_match.group(1) if arxiv_id_match else ""
+            try:
+                wait_for_arxiv_api_slot()  # Rate limiting shared by all arXiv queries
                 
-                if not arxiv_id:
-                    print(f"Skipping paper '{title[:50]}...' due to missing ArXiv ID.")
-                    continue
+                # Connection errors and 429/5xx are retried with backoff by the shared session.
+                # The feed is parsed as it streams in, so downloads start before the page is complete.
+                entries_in_page = 0
+                current_batch_newly_added = 0
+                with get_http_session().get(query_url, timeout=30, stream=True) as response:
+                    response.raise_for_status()
+                    for entry in iter_arxiv_atom_entries(response.iter_content(chunk_size=ARXIV_FEED_CHUNK_SIZE)):
+                        if newly_fetched_and_saved_count + len(pending_downloads) >= num_papers:
+                            break
+                        # Counted only once processed, so the next page starts at the first unprocessed entry
+                        entries_in_page += 1
+
+                        title = entry['title'] or "N/A Title"
+
+                        published_date = entry['published']
+                        if not published_date:
+                            print(f"Skipping paper '{title[:50]}...' due to missing publication date.")
+                            continue
+                        try:
+                            published_year = int(published_date[:4])
+                        except ValueError:
+                            print(f"Skipping paper '{title[:50]}...' due to invalid publication year format: {published_date[:4]}")
+                            continue
 
-                potential_sanitized_primary_id = sanitize_filename(f"arxiv_{arxiv_id}")
+                        if not (year_range[0] <= published_year <= year_range[1]):
+                            continue
 
-                if potential_sanitized_primary_id in already_fetched_primary_ids:
-                    continue 
-                
-                authors = [auth.find('atom:name', namespaces).text 
-                          for auth in entry.findall('atom:author', namespaces) 
-                          if auth.find('atom:name', namespaces) is not None]
-                
-                doi_element = entry.find('arxiv:doi', namespaces)
-                doi = doi_element.text if doi_element is not None else ""
-                
-                journal_ref_element = entry.find('arxiv:journal_ref', namespaces)
-                journal_ref = journal_ref_element.text if journal_ref_element is not None else ""
-                                
-                pdf_filename = os.path.join(pdf_folder, f"{potential_sanitized_primary_id}.pdf")
-                pdf_url = f'https://arxiv.org/pdf/{arxiv_id}.pdf'
-                
-                paper_metadata = {
-                    'title': title, 'authors': authors, 'doi': doi, 'id_url': id_url,
-                    'pdf_url': pdf_url, 'journal_ref': journal_ref,
-                    'published_year': published_year, 'arxiv_id': arxiv_id,
-                    'local_pdf_path': pdf_filename
-                }
-                
-                if os.path.exists(pdf_filename): 
-                    print(f"PDF {pdf_filename} already exists. Using existing.")
-                    newly_fetched_papers_metadata_list.append(paper_metadata)
-                    newly_fetched_and_saved_count += 1
-                    current_batch_newly_added +=1
-                    already_fetched_primary_ids.add(potential_sanitized_primary_id)
-                    continue
-                
-                try:
-                    print(f"Downloading: {title[:80]}... (ID: {arxiv_id})")
-                    headers = {'User-Agent': 'Mozilla/5.0 (compatible; ArXiv-Fetcher/1.0)'}
-                    pdf_response = requests.get(pdf_url, headers=headers, timeout=60)
-                    pdf_response.raise_for_status()
-                    
-                    with open(pdf_filename, 'wb') as f: 
-                        f.write(pdf_response.content)
-                    
-                    print(f"Saved: {pdf_filename}")
-                    newly_fetched_papers_metadata_list.append(paper_metadata)
-                    newly_fetched_and_saved_count += 1
-                    current_batch_newly_added +=1
-                    already_fetched_primary_ids.add(potential_sanitized_primary_id)
-                    
-                except Exception as e:
-                    print(f"Failed to download {title}: {e}")
-                    if os.path.exists(pdf_filename): 
-                        os.remove(pdf_filename)
+                        id_url = entry['id_url']
+                        arxiv_id_match = re.search(r'abs/([^v]+)', id_url)
+                        arxiv_id = arxiv_id_match.group(1) if arxiv_id_match else ""
+
+                        if not arxiv_id:
+                            print(f"Skipping paper '{title[:50]}...' due to missing ArXiv ID.")
+                            continue
+
+                        potential_sanitized_primary_id = sanitize_filename(f"arxiv_{arxiv_id}")
+
+                        if potential_sanitized_primary_id in already_fetched_primary_ids:
+                            continue
+
+                        pdf_filename = os.path.join(pdf_folder, f"{potential_sanitized_primary_id}.pdf")
+                        pdf_url = f'https://arxiv.org/pdf/{arxiv_id}.pdf'
+
+                        paper_metadata = Paper(
+                            id_primary=potential_sanitized_primary_id,
+                            title=title, authors=entry['authors'], doi=entry['doi'], id_url=id_url,
+                            pdf_url=pdf_url, journal_ref=entry['journal_ref'], abstract_api=entry['summary'],
+                            published_year=published_year, arxiv_id=arxiv_id,
+                            local_pdf_path=pdf_filename
+                        )
+                        accepted_papers_in_order.append((paper_metadata, potential_sanitized_primary_id))
+                        already_fetched_primary_ids.add(potential_sanitized_primary_id)
+                        current_batch_newly_added += 1
+
+                        if not download_pdfs:
+                            newly_fetched_and_saved_count += 1
+                            continue
+
+                        if os.path.exists(pdf_filename):
+                            print(f"PDF {pdf_filename} already exists. Using existing.")
+                            newly_fetched_and_saved_count += 1
+                            continue
+
+                        if paper_store.fetch_file(paper_store_keys(paper_metadata), 'pdf', pdf_filename):
+                            print(f"PDF for {arxiv_id} restored from paper store: {pdf_filename}")
+                            newly_fetched_and_saved_count += 1
+                            continue
+
+                        print(f"Queueing download: {title[:80]}... (ID: {arxiv_id})")
+                        future = download_pool.submit(pdf_url, pdf_filename, headers=headers, timeout=60)
+                        pending_downloads[future] = (paper_metadata, potential_sanitized_primary_id)
+
+                print(f"ArXiv API call (start_index {start_index}): Parsed {entries_in_page} entries")
+
+                if not entries_in_page:
+                    print("No more entries found from ArXiv for this query.")
+                    api_exhausted = True
                     continue
-            
-            start_index += len(entries)
-            
-            if current_batch_newly_added == 0 and len(entries) < max_results_per_api_call:
-                print("No new papers added in this batch. Stopping for this query.")
-                break
 
-            if newly_fetched_and_saved_count >= num_papers:
-                break
+                start_index += entries_in_page
+                entries_seen_total += entries_in_page
+                entries_kept_total += current_batch_newly_added
                 
-        except requests.exceptions.RequestException as e:
-            print(f"{RED}Error querying ArXiv API: {e}{RESET}")
-            break
-        except ET.ParseError as e:
-            print(f"{RED}Error parsing ArXiv API response: {e}{RESET}")
-            break
+                if current_batch_newly_added == 0 and entries_in_page < max_results_per_api_call:
+                    print("No new papers added in this batch. Stopping for this query.")
+                    api_exhausted = True
+                    
+            except requests.exceptions.RequestException as e:
+                print(f"{RED}Error querying ArXiv API: {e}{RESET}")
+                api_exhausted = True
+            except ET.ParseError as e:
+                print(f"{RED}Error parsing ArXiv API response: {e}{RESET}")
+                api_exhausted = True
+
+        while pending_downloads:
+            _collect_downloads(block=True)
+
+    newly_fetched_papers_metadata_list = [
+        meta for meta, primary_id in accepted_papers_in_order if primary_id not in failed_primary_ids
+    ]
     
-    if newly_fetched_and_saved_count > 0:
+    if newly_fetched_and_saved_count > 0 and not download_pdfs:
+        status_msg = f"Found {newly_fetched_and_saved_count} new papers (metadata only) for query '{search_query_str[:50]}...'"
+    elif newly_fetched_and_saved_count > 0:
         status_msg = f"Successfully downloaded {newly_fetched_and_saved_count} new papers for query '{search_query_str[:50]}...'"
     else:
         status_msg = f"No new papers found or downloaded for query: '{search_query_str[:50]}...'"
@@ -1077,7 +1943,340 @@ def fetch_arxiv_papers(
 
 
 
-def batch_convert_pdfs_to_text(pdf_folder: str = "pdf_papers", txt_folder: str = "txt_papers") -> str:
+def download_paper_pdfs(
+    papers_metadata: List[Dict[str, any]],
+    already_fetched_primary_ids: set = None,
+    download_workers: int = PDF_DOWNLOAD_MAX_WORKERS,
+    per_host_limit: int = PDF_DOWNLOAD_PER_HOST_LIMIT
+) -> List[Dict[str, any]]:
+    """
+    Second stage of a metadata-only fetch (fetch_arxiv_papers with download_pdfs=False):
+    downloads 'pdf_url' to 'local_pdf_path' for each paper, reusing existing files and the
+    paper store. Papers without a 'local_pdf_path' (e.g. Scopus entries with text only) pass
+    through untouched. Returns the papers that are still usable, in input order. Failed papers
+    are removed from already_fetched_primary_ids so a later query can pick them up again.
+    """
+    headers = {'User-Agent': 'Mozilla/5.0 (compatible; ArXiv-Fetcher/1.0)'}
+    failed_ids: set = set()
+    pending_downloads: Dict[Future, Dict[str, any]] = {}
+
+    with PdfDownloadPool(max_workers=download_workers, per_host_limit=per_host_limit) as download_pool:
+        for paper_metadata in papers_metadata:
+            pdf_filename = paper_metadata.get('local_pdf_path')
+            if not pdf_filename or os.path.exists(pdf_filename):
+                continue
+            if paper_store.fetch_file(paper_store_keys(paper_metadata), 'pdf', pdf_filename):
+                print(f"PDF for '{paper_metadata.get('title', 'N/A')[:50]}...' restored from paper store: {pdf_filename}")
+                continue
+            if not paper_metadata.get('pdf_url'):
+                failed_ids.add(id(paper_metadata))
+                continue
+            os.makedirs(os.path.dirname(pdf_filename) or '.', exist_ok=True)
+            print(f"Queueing download: {paper_metadata.get('title', 'N/A')[:80]}...")
+            future = download_pool.submit(paper_metadata['pdf_url'], pdf_filename, headers=headers, timeout=60)
+            pending_downloads[future] = paper_metadata
+
+        for future in as_completed(pending_downloads):
+            paper_metadata = pending_downloads[future]
+            try:
+                future.result()
+                print(f"Saved: {paper_metadata['local_pdf_path']}")
+                store_keys = paper_store_keys(paper_metadata)
+                paper_store.put_file(store_keys, 'pdf', paper_metadata['local_pdf_path'])
+                paper_store.put_metadata(store_keys, paper_metadata)
+            except Exception as e:
+                print(f"Failed to download {paper_metadata.get('title', 'N/A')}: {e}")
+                failed_ids.add(id(paper_metadata))
+
+    downloaded = []
+    for paper_metadata in papers_metadata:
+        if id(paper_metadata) in failed_ids:
+            if already_fetched_primary_ids is not None:
+                already_fetched_primary_ids.discard(paper_metadata.get('id_primary'))
+            continue
+        downloaded.append(paper_metadata)
+    return downloaded
+
+
+def _write_text_file_atomically(txt_filepath: str, text: str) -> None:
+    # A worker killed mid-write leaves only the .part file, never a truncated text file
+    partial_path = txt_filepath + ".part"
+    with open(partial_path, 'w', encoding='utf-8') as txt_file:
+        txt_file.write(text)
+    os.replace(partial_path, txt_filepath)
+
+
+def extract_pdf_text_to_file(
+    pdf_path: str,
+    txt_filepath: str,
+    ocr_fallback: bool = PDF_HYBRID_OCR_ENABLED,
+    min_chars_per_page: int = OCR_FALLBACK_MIN_CHARS_PER_PAGE
+) -> Dict[str, any]:
+    """
+    Extracts the text of one PDF and writes it to txt_filepath. The PyPDF2 text layer is
+    written first; with ocr_fallback, pages whose text is empty or shorter than
+    min_chars_per_page are then OCRed (ocr_pdf_page) and the file is rewritten if OCR
+    recovered more text. OCR is a best-effort upgrade: if the worker is stopped by the
+    conversion timeout, the text-layer file is already in place.
+    Runs in a worker process, so it returns a plain result record:
+    {'pdf_path', 'txt_path', 'status', 'pages', 'ocr_pages', 'ocr_timed_out', 'error'} where
+    status is one of the CONVERSION_STATUS_* constants and ocr_pages lists the 1-based OCRed pages.
+    """
+    record = {'pdf_path': pdf_path, 'txt_path': None, 'status': CONVERSION_STATUS_ERROR, 'pages': 0, 'ocr_pages': [], 'ocr_timed_out': False, 'error': None}
+    pdf_file = os.path.basename(pdf_path)
+    try:
+        page_texts = []
+        with open(pdf_path, 'rb') as file:
+            try:
+                pdf_reader = PyPDF2.PdfReader(file)
+                if pdf_reader.is_encrypted:
+                    try:
+                        pdf_reader.decrypt('') # Try with empty password
+                    except Exception as decrypt_err:
+                        record['status'] = CONVERSION_STATUS_ENCRYPTED
+                        record['error'] = f"Could not decrypt {pdf_file}: {decrypt_err}"
+                        return record
+
+                record['pages'] = len(pdf_reader.pages)
+                for i, page in enumerate(pdf_reader.pages):
+                    try:
+                        page_text = page.extract_text() or ""
+                    except Exception as page_extract_err:
+                        print(f"Error extracting text from page {i+1} of {pdf_file}: {page_extract_err}")
+                        page_text = "" # OCR below may still recover this page
+                    page_texts.append(page_text)
+            except PyPDF2.errors.PdfReadError as pdf_read_err:
+                record['error'] = f"Error reading PDF file {pdf_file} (possibly corrupted or not a PDF): {pdf_read_err}"
+                return record
+
+        if "".join(page_texts).strip():
+            _write_text_file_atomically(txt_filepath, "".join(text + "\n" for text in page_texts))
+            record['status'] = CONVERSION_STATUS_SUCCESS
+            record['txt_path'] = txt_filepath
+
+        sparse_pages = [i for i, text in enumerate(page_texts) if len(text.strip()) < min_chars_per_page] if ocr_fallback else []
+        for i in sparse_pages:
+            try:
+                ocr_text = ocr_pdf_page(pdf_path, i + 1)
+            except Exception as ocr_err:
+                # Tesseract/Poppler missing or failing: keep the text layer for the remaining pages
+                print(f"OCR fallback unavailable for {pdf_file} (page {i+1}): {ocr_err}")
+                break
+            if len(ocr_text.strip()) > len(page_texts[i].strip()):
+                page_texts[i] = ocr_text
+                record['ocr_pages'].append(i + 1)
+
+        full_text = "".join(text + "\n" for text in page_texts)
+        if not full_text.strip():
+            record['status'] = CONVERSION_STATUS_EMPTY
+            record['error'] = f"No text extracted from {pdf_file}. It might be image-based or protected."
+            return record
+
+        if record['ocr_pages'] or record['status'] != CONVERSION_STATUS_SUCCESS:
+            _write_text_file_atomically(txt_filepath, full_text)
+        record['status'] = CONVERSION_STATUS_SUCCESS
+        record['txt_path'] = txt_filepath
+    except Exception as e:
+        record['error'] = f"Error processing {pdf_file}: {e}"
+    return record
+
+
+_conversion_start_queue = None # Set in each conversion worker by _init_conversion_worker
+
+
+def _init_conversion_worker(start_queue) -> None:
+    global _conversion_start_queue
+    _conversion_start_queue = start_queue
+
+
+def _extract_pdf_text_reporting_start(index: int, pdf_path: str, txt_filepath: str) -> Dict[str, any]:
+    """Pool task: reports when it actually starts, so its timeout does not count time spent queued."""
+    _conversion_start_queue.put((index, time.time()))
+    return extract_pdf_text_to_file(pdf_path, txt_filepath)
+
+
+def _conversion_failure_record(pdf_path: str, status: str, error: str) -> Dict[str, any]:
+    return {'pdf_path': pdf_path, 'txt_path': None, 'status': status, 'pages': 0, 'ocr_pages': [], 'ocr_timed_out': False, 'error': error}
+
+
+def _conversion_timeout_record(pdf_path: str, txt_filepath: str, error: str) -> Dict[str, any]:
+    """Timed-out conversion: keeps the text-layer file the worker wrote before OCR, if any."""
+    if text_file_has_content(txt_filepath):
+        return {'pdf_path': pdf_path, 'txt_path': txt_filepath, 'status': CONVERSION_STATUS_SUCCESS, 'pages': 0, 'ocr_pages': [],
+                'ocr_timed_out': True, 'error': f"{error}; kept the text layer without OCR"}
+    return _conversion_failure_record(pdf_path, CONVERSION_STATUS_TIMEOUT, error)
+
+
+def convert_pdfs_to_text_records(
+    pdf_paths: List[str],
+    txt_folder: str = TXT_PAPERS_FOLDER,
+    max_workers: int = PDF_CONVERSION_MAX_WORKERS,
+    per_file_timeout: int = PDF_CONVERSION_TIMEOUT_SECONDS
+) -> List[Dict[str, any]]:
+    """
+    Converts the given PDFs to '<txt_folder>/<pdf name>.txt' and returns one result record
+    per PDF (same order). Existing non-empty text files and text already in the paper store
+    are reused. Extraction always runs in a process pool (one process for a single file)
+    under per_file_timeout, counted from when each file starts converting. The whole batch
+    is also capped at per_file_timeout * (ceil(files / workers) + 1) so files queued behind
+    stuck workers cannot wait forever. If the pool cannot start, each file is converted in
+    a daemon thread that is abandoned after the timeout.
+    """
+    os.makedirs(txt_folder, exist_ok=True)
+    records: List[Optional[Dict[str, any]]] = [None] * len(pdf_paths)
+    to_extract = [] # (index, pdf_path, txt_filepath, store_keys)
+
+    for index, pdf_path in enumerate(pdf_paths):
+        # Use original PDF filename (without .pdf) for the .txt filename
+        txt_filename_base = os.path.splitext(os.path.basename(pdf_path))[0]
+        txt_filepath = os.path.join(txt_folder, f"{txt_filename_base}.txt")
+        base_record = {'pdf_path': pdf_path, 'txt_path': txt_filepath, 'status': CONVERSION_STATUS_SUCCESS, 'pages': 0, 'ocr_pages': [], 'ocr_timed_out': False, 'error': None}
+        if os.path.exists(txt_filepath) and os.path.getsize(txt_filepath) > 0: # Check if non-empty
+            records[index] = base_record
+            continue
+        try:
+            # Identical PDF content converted in an earlier run
+            store_keys = [f"sha256:{file_sha256(pdf_path)}"]
+        except OSError as e:
+            records[index] = dict(base_record, txt_path=None, status=CONVERSION_STATUS_ERROR, error=f"Error reading {pdf_path}: {e}")
+            continue
+        if paper_store.fetch_file(store_keys, 'txt', txt_filepath):
+            records[index] = base_record
+            continue
+        to_extract.append((index, pdf_path, txt_filepath, store_keys))
+
+    pool = None
+    start_queue = None
+    worker_count = max(1, min(max_workers, len(to_extract)))
+    if to_extract:
+        try:
+            start_queue = multiprocessing.Queue()
+            pool = multiprocessing.Pool(processes=worker_count, initializer=_init_conversion_worker, initargs=(start_queue,))
+        except (OSError, ValueError) as e:
+            print(f"{YELLOW}Could not start PDF conversion process pool, converting in threads: {e}{RESET}")
+
+    try:
+        if pool is None:
+            for index, pdf_path, txt_filepath, _ in to_extract:
+                result_holder: Dict[str, any] = {}
+                worker = threading.Thread(
+                    target=lambda holder, *args: holder.update(record=extract_pdf_text_to_file(*args)),
+                    args=(result_holder, pdf_path, txt_filepath),
+                    daemon=True
+                )
+                worker.start()
+                worker.join(per_file_timeout)
+                records[index] = result_holder.get('record') or _conversion_timeout_record(
+                    pdf_path, txt_filepath, f"Text extraction of {os.path.basename(pdf_path)} exceeded {per_file_timeout}s")
+        else:
+            pending = {index: (pdf_path, txt_filepath, pool.apply_async(_extract_pdf_text_reporting_start, (index, pdf_path, txt_filepath)))
+                       for index, pdf_path, txt_filepath, _ in to_extract}
+            started_at: Dict[int, float] = {}
+            batch_deadline = time.time() + per_file_timeout * (-(-len(pending) // worker_count) + 1)
+            while pending:
+                while True:
+                    try:
+                        started_index, start_time = start_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    started_at[started_index] = start_time
+                now = time.time()
+                for index in list(pending):
+                    pdf_path, txt_filepath, async_result = pending[index]
+                    if async_result.ready():
+                        try:
+                            records[index] = async_result.get()
+                        except Exception as e:
+                            records[index] = _conversion_failure_record(pdf_path, CONVERSION_STATUS_ERROR, f"Worker failed for {os.path.basename(pdf_path)}: {e}")
+                    elif index in started_at and now - started_at[index] > per_file_timeout:
+                        records[index] = _conversion_timeout_record(
+                            pdf_path, txt_filepath, f"Text extraction of {os.path.basename(pdf_path)} exceeded {per_file_timeout}s")
+                    elif now > batch_deadline:
+                        records[index] = _conversion_timeout_record(
+                            pdf_path, txt_filepath, f"Text extraction of {os.path.basename(pdf_path)} did not finish before the batch deadline")
+                    else:
+                        continue
+                    del pending[index]
+                if pending:
+                    time.sleep(PDF_CONVERSION_POLL_SECONDS)
+    finally:
+        if pool is not None:
+            # terminate() also kills workers still stuck on timed-out files
+            pool.terminate()
+            pool.join()
+        if start_queue is not None:
+            start_queue.close()
+
+    for index, pdf_path, txt_filepath, store_keys in to_extract:
+        record = records[index]
+        if os.path.exists(txt_filepath + ".part"): # Left by a worker stopped mid-write
+            os.remove(txt_filepath + ".part")
+        if record.get('ocr_timed_out'):
+            # Not stored: a later run should get another chance at the OCR upgrade
+            print(f"{YELLOW}{record['error']}{RESET}")
+        elif record['status'] == CONVERSION_STATUS_SUCCESS:
+            paper_store.put_file(store_keys, 'txt', txt_filepath)
+            if record['ocr_pages']:
+                print(f"OCR used for {len(record['ocr_pages'])}/{record['pages']} pages of {os.path.basename(pdf_path)}: {record['ocr_pages']}")
+        elif record.get('error'):
+            print(f"{YELLOW}[{record['status']}] {record['error']}{RESET}")
+    return records
+
+
+def convert_papers_to_text(
+    papers: List[Union[Dict[str, any], str]],
+    txt_folder: str = TXT_PAPERS_FOLDER,
+    max_workers: int = PDF_CONVERSION_MAX_WORKERS,
+    per_file_timeout: int = PDF_CONVERSION_TIMEOUT_SECONDS
+) -> List[Optional[str]]:
+    """
+    Incremental conversion: converts only the given papers (metadata dicts with
+    'local_pdf_path'/'local_txt_path', or plain PDF paths) and returns, in the same
+    order, the text file path to use for each paper, or None if no text is available.
+    A paper's existing non-empty 'local_txt_path' (e.g. a Scopus API abstract) is kept and
+    its PDF is not converted. For converted metadata dicts, the OCRed pages ('ocr_pages')
+    and whether OCR timed out ('ocr_timed_out') are recorded on the paper and in its
+    paper store metadata.
+    """
+    def _existing_txt_path(paper: Union[Dict[str, any], str]) -> Optional[str]:
+        txt_path = None if isinstance(paper, str) else paper.get('local_txt_path')
+        return txt_path if txt_path and os.path.exists(txt_path) and os.path.getsize(txt_path) > 0 else None
+
+    pdf_paths_to_convert = []
+    for paper in papers:
+        if _existing_txt_path(paper):
+            continue # Its text is used as is, so converting the PDF would be wasted work
+        pdf_path = paper if isinstance(paper, str) else paper.get('local_pdf_path')
+        if pdf_path and os.path.exists(pdf_path) and pdf_path not in pdf_paths_to_convert:
+            pdf_paths_to_convert.append(pdf_path)
+
+    records_by_pdf = {}
+    if pdf_paths_to_convert:
+        records = convert_pdfs_to_text_records(pdf_paths_to_convert, txt_folder, max_workers, per_file_timeout)
+        records_by_pdf = {r['pdf_path']: r for r in records}
+
+    text_paths: List[Optional[str]] = []
+    for paper in papers:
+        pdf_path = paper if isinstance(paper, str) else paper.get('local_pdf_path')
+        existing_txt_path = _existing_txt_path(paper)
+        if existing_txt_path:
+            text_paths.append(existing_txt_path)
+            continue
+        record = records_by_pdf.get(pdf_path)
+        if record and not isinstance(paper, str) and (record['ocr_pages'] or record.get('ocr_timed_out')):
+            paper['ocr_pages'] = record['ocr_pages']
+            paper['ocr_timed_out'] = record.get('ocr_timed_out', False)
+            paper_store.put_metadata(paper_store_keys(paper), paper)
+        text_paths.append(record['txt_path'] if record and record['status'] == CONVERSION_STATUS_SUCCESS else None)
+    return text_paths
+
+
+def batch_convert_pdfs_to_text(
+    pdf_folder: str = "pdf_papers",
+    txt_folder: str = "txt_papers",
+    max_workers: int = PDF_CONVERSION_MAX_WORKERS,
+    per_file_timeout: int = PDF_CONVERSION_TIMEOUT_SECONDS
+) -> str:
     """
     Convert all PDFs in the folder to text files in batch.
     """
@@ -1091,60 +2290,22 @@ def batch_convert_pdfs_to_text(pdf_folder: str = "pdf_papers", txt_folder: str =
     if not pdf_files:
         return "No PDF files found in the specified folder."
     
-    success_count = 0
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(pdf_folder, pdf_file)
-        # Use original PDF filename (without .pdf) for the .txt filename
-        txt_filename_base = os.path.splitext(pdf_file)[0]
-        txt_filepath = os.path.join(txt_folder, f"{txt_filename_base}.txt")
-        
-        try:
-            # print(f"\nProcessing: {pdf_file}") # Reduced verbosity
-            
-            if os.path.exists(txt_filepath) and os.path.getsize(txt_filepath) > 0: # Check if non-empty
-                # print(f"Text file already exists and is not empty, skipping: {txt_filepath}") # Reduced verbosity
-                success_count += 1
-                continue
-            
-            full_text = ""
-            with open(pdf_path, 'rb') as file:
-                try:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    if pdf_reader.is_encrypted:
-                        try:
-                            pdf_reader.decrypt('') # Try with empty password
-                        except Exception as decrypt_err:
-                            print(f"Could not decrypt {pdf_file}: {decrypt_err}. Skipping.")
-                            continue
-                    
-                    for i, page in enumerate(pdf_reader.pages):
-                        try:
-                            full_text += page.extract_text() + "\n"
-                        except Exception as page_extract_err:
-                            print(f"Error extracting text from page {i+1} of {pdf_file}: {page_extract_err}")
-                            # Continue to extract from other pages if possible
-                except PyPDF2.errors.PdfReadError as pdf_read_err:
-                    print(f"Error reading PDF file {pdf_file} (possibly corrupted or not a PDF): {pdf_read_err}")
-                    continue # Skip this file
-            
-            if not full_text.strip():
-                print(f"No text extracted from {pdf_file}. It might be image-based or protected.")
-                # Optionally create an empty file or skip creating one
-                # with open(txt_filepath, 'w', encoding='utf-8') as txt_file: # Create empty if desired
-                #     txt_file.write("") 
-                continue # Don't count as success if no text
-
-            with open(txt_filepath, 'w', encoding='utf-8') as txt_file:
-                txt_file.write(full_text)
-            
-            # print(f"Text saved to: {txt_filepath}") # Reduced verbosity
-            success_count += 1
-            
-        except Exception as e:
-            print(f"Error processing {pdf_file}: {e}")
-            continue
+    records = convert_pdfs_to_text_records(
+        [os.path.join(pdf_folder, f) for f in pdf_files], txt_folder, max_workers, per_file_timeout
+    )
+    success_count = sum(1 for r in records if r['status'] == CONVERSION_STATUS_SUCCESS)
+    problem_counts = {}
+    for r in records:
+        if r['status'] != CONVERSION_STATUS_SUCCESS:
+            problem_counts[r['status']] = problem_counts.get(r['status'], 0) + 1
+    problems_str = f" ({', '.join(f'{count} {status}' for status, count in problem_counts.items())})" if problem_counts else ""
+    ocr_page_count = sum(len(r.get('ocr_pages', [])) for r in records)
+    ocr_str = f" {ocr_page_count} page(s) recovered with OCR." if ocr_page_count else ""
+    ocr_timeout_count = sum(1 for r in records if r.get('ocr_timed_out'))
+    if ocr_timeout_count:
+        ocr_str += f" {ocr_timeout_count} file(s) kept their text layer only after OCR timed out."
     
-    return f"Successfully converted/verified {success_count} out of {len(pdf_files)} PDFs to text."
+    return f"Successfully converted/verified {success_count} out of {len(pdf_files)} PDFs to text.{problems_str}{ocr_str}"
 
 
 # --- Utility function from scopus_fetch.py ---
@@ -1164,12 +2325,8 @@ def summarize_paper(
     Uploads the PDF to Gemini and processes it directly.
     """
     try:
-        # Upload the PDF file to Gemini
-        uploaded_file = genai.upload_file(
-            path=pdf_path,
-            mime_type='application/pdf',
-            display_name=paper_name[:100]  # Truncate long names
-        )
+        # Upload the PDF file to Gemini (reused if this content was already uploaded in this run)
+        uploaded_file = gemini_uploads.upload_path(pdf_path, 'application/pdf', paper_name)
     except Exception as e:
         print(f"{RED}Error uploading file to Gemini: {e}{RESET}")
         return f"File upload error: {str(e)}"
@@ -1187,39 +2344,163 @@ Paper Name: [{paper_name}]
 SLR Subject: [{subject}]
 """
         # Generate content with the uploaded file
-        response = summary_model.generate_content(
+        response = generate_with_rate_limit(
             [prompt, uploaded_file],
             generation_config=genai.types.GenerationConfig(temperature=0.7)
         )
         save_usage_metadata(response.usage_metadata, inspect.currentframe().f_code.co_name)
-        # Clean up: Delete the uploaded file after processing
-        try:
-            genai.delete_file(uploaded_file.name)
-        except Exception as delete_error:
-            print(f"{YELLOW}Warning: Could not delete uploaded file {uploaded_file.name} in summarize_paper: {delete_error}{RESET}")
-            
+        # The upload is kept for reference extraction; gemini_uploads.cleanup() deletes it at the end of the run
         return response.text.strip()
     
-    except (google_api_exceptions.PermissionDenied, google_api_exceptions.Unauthenticated, google_api_exceptions.ResourceExhausted, google_api_exceptions.InternalServerError) as critical_e:
+    except (google_api_exceptions.PermissionDenied, google_api_exceptions.Unauthenticated, google_api_exceptions.InternalServerError) as critical_e:
         print(f"{RED}Critical API error during summarization for {paper_name}: {critical_e}{RESET}")
         return LLM_API_CRITICAL_FAILURE_TOKEN
     except Exception as e:
+        # Quota errors reaching here already exhausted generate_with_rate_limit's retries
+        if is_quota_error(e):
+            print(f"{RED}Quota limit still exceeded after retries during summarization for {paper_name}. Critical failure.{RESET}")
+            return LLM_API_CRITICAL_FAILURE_TOKEN
         print(f"{RED}Error during summarization: {e}{RESET}")
-        # Attempt to clean up even if summarization fails
-        try:
-            genai.delete_file(uploaded_file.name)
-        except:
-            pass
         return f"Summarization error: {str(e)}"
 
+def _summarize_single_paper(
+    paper_info: Dict[str, any],
+    subject_keywords: str,
+    summaries_folder: str
+) -> Tuple[Dict[str, any], bool]:
+    """
+    Summarizes one paper for batch_summarize_papers.
+    Returns the augmented paper info and whether the failure was a critical API error.
+    """
+    pdf_path = paper_info.get('local_pdf_path')
+    # Ensure 'filename' key exists, fallback to a generic name if not
+    original_filename_for_summary = paper_info.get('filename', f"unknown_paper_{paper_info.get('id_primary', 'no_id')}")
+    original_txt_filename_no_ext = os.path.splitext(original_filename_for_summary)[0]
+
+    clean_summary_name_base = re.sub(r'[^\w\s-]', '', original_txt_filename_no_ext).strip()
+    clean_summary_name_base = re.sub(r'\s+', '_', clean_summary_name_base)
+    clean_summary_name_base = clean_summary_name_base[:100]
+    if not clean_summary_name_base:
+        clean_summary_name_base = f"summary_{original_txt_filename_no_ext.replace('/', '_').replace(':', '_')}"
+
+    summary_filename_only = f"{clean_summary_name_base}_summary.txt"
+    summary_filepath = os.path.join(summaries_folder, summary_filename_only)
+
+    paper_name_for_prompt = paper_info.get('title', original_txt_filename_no_ext)
+    # Results are recorded on the Paper itself instead of on a copy
+    augmented_paper_info = Paper.from_mapping(paper_info)
+    is_critical_failure = False
+
+    try:
+        print(f"\nProcessing for summary: {original_filename_for_summary}")
+
+        # The summary depends on the exact content sent to the model: the PDF, or the text file fallback
+        txt_path = paper_info.get('local_txt_path')
+        if pdf_path and os.path.exists(pdf_path):
+            source_path, source_mime_type = pdf_path, 'application/pdf'
+        elif txt_path and os.path.exists(txt_path):
+            source_path, source_mime_type = txt_path, 'text/plain'
+        else:
+            source_path, source_mime_type = None, None
+        content_hash = file_sha256(source_path) if source_path else None
+        cache_key = summary_cache_key(content_hash, subject_keywords) if content_hash else None
+
+        analysis = None
+        if content_hash:
+            analysis_kind = "analysis" if PAPER_ANALYSIS_COMBINED else "verdict"
+            analysis_cache_key = summary_cache_key(content_hash, subject_keywords, kind=analysis_kind)
+            cached_analysis = summary_cache.get(analysis_cache_key)
+            if cached_analysis:
+                print(f"Analysis for this paper and subject found in summary cache.")
+                analysis = json.loads(cached_analysis)
+            else:
+                print(f"Analyzing ({'summary, relevance and references' if PAPER_ANALYSIS_COMBINED else 'summary and relevance'}) using: {source_path}")
+                analysis_result = analyze_paper(
+                    source_path, source_mime_type, paper_name_for_prompt, subject_keywords,
+                    include_references=PAPER_ANALYSIS_COMBINED
+                )
+                if analysis_result == LLM_API_CRITICAL_FAILURE_TOKEN:
+                    is_critical_failure = True
+                    analysis_result = None
+                elif isinstance(analysis_result, dict):
+                    summary_cache.put(analysis_cache_key, json.dumps(analysis_result))
+                else:
+                    print(f"{YELLOW}Structured analysis failed ({analysis_result}). Falling back to plain summarization.{RESET}")
+                    analysis_result = None
+                analysis = analysis_result
+
+        cached_summary = summary_cache.get(cache_key) if cache_key and analysis is None and not is_critical_failure else None
+
+        if is_critical_failure:
+            summary_content = LLM_API_CRITICAL_FAILURE_TOKEN
+        elif analysis is not None:
+            summary_content = format_analysis_summary(analysis)
+            augmented_paper_info['relevance_score'] = analysis['relevance_score']
+            augmented_paper_info['relevance_label'] = analysis['relevance_label']
+            augmented_paper_info['relevance_reason'] = analysis['relevance_reason']
+            augmented_paper_info['llm_metadata'] = analysis['metadata']
+            if 'references' in analysis:
+                augmented_paper_info['extracted_references'] = analysis['references']
+            with open(summary_filepath, 'w', encoding='utf-8') as summary_file:
+                summary_file.write(summary_content)
+            print(f"Summary saved to: {summary_filepath}")
+        elif cached_summary:
+            print(f"Summary for this paper and subject found in summary cache.")
+            summary_content = cached_summary
+            with open(summary_filepath, 'w', encoding='utf-8') as summary_file:
+                summary_file.write(summary_content)
+        else:
+            if pdf_path and os.path.exists(pdf_path):
+                print(f"Summarizing using PDF: {pdf_path}")
+                summary_content = summarize_paper(pdf_path, paper_name_for_prompt, subject_keywords)
+            else:
+                # Fallback to text content via file upload
+                txt_file_path_for_fallback = paper_info.get('local_txt_path')
+                if txt_file_path_for_fallback and os.path.exists(txt_file_path_for_fallback):
+                    print(f"{YELLOW}PDF not available or failed, using text file for upload: {txt_file_path_for_fallback}{RESET}")
+                    summary_content = summarize_paper_fallback(
+                        txt_file_path_for_fallback, # Pass the path
+                        paper_name_for_prompt,
+                        subject_keywords
+                    )
+                else:
+                    summary_content = f"Error: No PDF or valid text file path ({txt_file_path_for_fallback}) available for {paper_name_for_prompt}"
+                    print(f"{RED}{summary_content}{RESET}")
+
+            is_critical_failure = summary_content == LLM_API_CRITICAL_FAILURE_TOKEN
+
+            with open(summary_filepath, 'w', encoding='utf-8') as summary_file:
+                summary_file.write(summary_content)
+            print(f"Summary saved to: {summary_filepath}")
+            if cache_key and not summary_content.startswith(LLM_ERROR_PREFIXES + SUMMARY_ERROR_PREFIXES):
+                summary_cache.put(cache_key, summary_content)
+
+        augmented_paper_info['summary_text'] = summary_content
+        augmented_paper_info['summary_filepath'] = summary_filepath
+
+        if not paper_judged_relevant(augmented_paper_info):
+            print(f"Paper '{paper_name_for_prompt}' deemed not relevant by summarizer.")
+
+    except Exception as e:
+        print(f"{RED}Error processing {original_filename_for_summary} for summary: {e}{RESET}")
+        augmented_paper_info['summary_text'] = f"Error during summarization: {e}"
+        augmented_paper_info['summary_filepath'] = None
+
+    return augmented_paper_info, is_critical_failure
+
+
 def batch_summarize_papers(
     subject_keywords: str,
     papers_to_summarize_details: List[Dict[str, any]],
-    summaries_folder: str = SUMMARIES_FOLDER
+    summaries_folder: str = SUMMARIES_FOLDER,
+    max_workers: int = SUMMARY_MAX_WORKERS
 ) -> Union[List[Dict[str, any]], str]: # Can return list or error token
     """    
     Summarize a list of papers using direct PDF processing with Gemini,
     or by uploading text files as a fallback.
+    Papers are summarized concurrently (all LLM calls share llm_rate_limiter); the
+    returned list keeps the input order. The first critical API failure cancels
+    every paper that has not started yet.
     """
     print(f"\nGenerating summaries for {len(papers_to_summarize_details)} papers on subject: '{subject_keywords}'...")
     os.makedirs(summaries_folder, exist_ok=True)
@@ -1228,72 +2509,37 @@ def batch_summarize_papers(
         print("No papers provided to summarize.")
         return []
 
-    processed_papers_with_summaries = []
+    processed_papers_with_summaries: List[Optional[Dict[str, any]]] = [None] * len(papers_to_summarize_details)
     api_error_count = 0
-    for paper_info in papers_to_summarize_details:
-        pdf_path = paper_info.get('local_pdf_path')
-        # Ensure 'filename' key exists, fallback to a generic name if not
-        original_filename_for_summary = paper_info.get('filename', f"unknown_paper_{paper_info.get('id_primary', 'no_id')}")
-        original_txt_filename_no_ext = os.path.splitext(original_filename_for_summary)[0]
-
-        clean_summary_name_base = re.sub(r'[^\w\s-]', '', original_txt_filename_no_ext).strip()
-        clean_summary_name_base = re.sub(r'\s+', '_', clean_summary_name_base)
-        clean_summary_name_base = clean_summary_name_base[:100]
-        if not clean_summary_name_base:
-            clean_summary_name_base = f"summary_{original_txt_filename_no_ext.replace('/', '_').replace(':', '_')}"
-
-        summary_filename_only = f"{clean_summary_name_base}_summary.txt"
-        summary_filepath = os.path.join(summaries_folder, summary_filename_only)
-
-        paper_name_for_prompt = paper_info.get('title', original_txt_filename_no_ext)
-        augmented_paper_info = paper_info.copy()
+    critical_failure_seen = False
+    worker_count = max(1, min(max_workers, len(papers_to_summarize_details)))
 
-        try:
-            print(f"\nProcessing for summary: {original_filename_for_summary}")
-
-            if os.path.exists(summary_filepath) and os.path.getsize(summary_filepath) > 10:
-                print(f"Summary already exists, loading: {summary_filepath}")
-                with open(summary_filepath, 'r', encoding='utf-8') as summary_file:
-                    summary_content = summary_file.read()
-            else:
-                if pdf_path and os.path.exists(pdf_path):
-                    print(f"Summarizing using PDF: {pdf_path}")
-                    summary_content = summarize_paper(pdf_path, paper_name_for_prompt, subject_keywords)
-                else:
-                    # Fallback to text content via file upload
-                    txt_file_path_for_fallback = paper_info.get('local_txt_path')
-                    if txt_file_path_for_fallback and os.path.exists(txt_file_path_for_fallback):
-                        print(f"{YELLOW}PDF not available or failed, using text file for upload: {txt_file_path_for_fallback}{RESET}")
-                        summary_content = summarize_paper_fallback(
-                            txt_file_path_for_fallback, # Pass the path
-                            paper_name_for_prompt,
-                            subject_keywords
-                        )
-                    else:
-                        summary_content = f"Error: No PDF or valid text file path ({txt_file_path_for_fallback}) available for {paper_name_for_prompt}"
-                        print(f"{RED}{summary_content}{RESET}")
-
-                if summary_content == LLM_API_CRITICAL_FAILURE_TOKEN:
-                    api_error_count += 1
-                    # Continue to attempt other summaries unless all fail
-
-                with open(summary_filepath, 'w', encoding='utf-8') as summary_file:
-                    summary_file.write(summary_content)
-                print(f"Summary saved to: {summary_filepath}")
-
-            augmented_paper_info['summary_text'] = summary_content
-            augmented_paper_info['summary_filepath'] = summary_filepath
+    with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="summarize") as executor:
+        future_to_index = {
+            executor.submit(_summarize_single_paper, paper_info, subject_keywords, summaries_folder): index
+            for index, paper_info in enumerate(papers_to_summarize_details)
+        }
+        for future in as_completed(future_to_index):
+            index = future_to_index[future]
+            if future.cancelled():
+                # Never started because the API already failed critically; counts as a critical failure.
+                cancelled_paper_info = Paper.from_mapping(papers_to_summarize_details[index])
+                cancelled_paper_info['summary_text'] = LLM_API_CRITICAL_FAILURE_TOKEN
+                cancelled_paper_info['summary_filepath'] = None
+                processed_papers_with_summaries[index] = cancelled_paper_info
+                api_error_count += 1
+                continue
 
-            if "This paper does not appear to be relevant" in summary_content:
-                print(f"Paper '{paper_name_for_prompt}' deemed not relevant by summarizer.")
+            augmented_paper_info, is_critical_failure = future.result()
+            processed_papers_with_summaries[index] = augmented_paper_info
+            if is_critical_failure:
+                api_error_count += 1
+                if not critical_failure_seen:
+                    critical_failure_seen = True
+                    cancelled_count = sum(1 for f in future_to_index if f.cancel())
+                    print(f"{RED}Critical API error while summarizing. Cancelled {cancelled_count} queued summaries.{RESET}")
 
-            processed_papers_with_summaries.append(augmented_paper_info)
-
-        except Exception as e:
-            print(f"{RED}Error processing {original_filename_for_summary} for summary: {e}{RESET}")
-            augmented_paper_info['summary_text'] = f"Error during summarization: {e}"
-            augmented_paper_info['summary_filepath'] = None
-            processed_papers_with_summaries.append(augmented_paper_info)
+    print(f"Summary cache: {summary_cache.stats_string()} (cumulative for this session).")
 
     # If all summarization attempts failed due to critical API errors
     if papers_to_summarize_details and api_error_count == len(papers_to_summarize_details):
@@ -1311,77 +2557,458 @@ def summarize_paper_fallback(
     Fallback text-based summarization when PDF is unavailable.
     Uploads the TXT file to Gemini and processes it directly.
     """
-    uploaded_file = None
-    try:
-        # Upload the TXT file to Gemini
-        uploaded_file = genai.upload_file(
-            path=txt_file_path,
-            mime_type='text/plain', # Mime type for .txt files
-            display_name=os.path.basename(txt_file_path)
-        )
+    try:
+        # Upload the TXT file to Gemini (reused if this content was already uploaded in this run)
+        uploaded_file = gemini_uploads.upload_path(txt_file_path, 'text/plain', os.path.basename(txt_file_path))
+
+        prompt_instructions = f"""You are an expert academic researcher. Summarize the provided paper content (from the uploaded text file) for a systematic literature review (SLR) on: [{subject}].
+
+Follow these instructions:
+1. Extract metadata: Authors, Title, Journal/Conference, Year, DOI, URL, Paper Type (if inferable from text).
+2. Discuss the paper's relevance to the SLR subject.
+3. List key points relevant to the subject with quotes from the paper.
+4. If not relevant, state: "This paper does not appear relevant to '{subject}'"
+
+Paper Name: [{paper_name}] (filename: {os.path.basename(txt_file_path)})
+SLR Subject: [{subject}]
+"""
+        # Generate content with the uploaded file
+        response = generate_with_rate_limit(
+            [prompt_instructions, uploaded_file], # Pass as a list
+            generation_config=genai.types.GenerationConfig(temperature=0.7)
+        )
+        save_usage_metadata(response.usage_metadata, inspect.currentframe().f_code.co_name)
+        return response.text.strip()
+
+    except (google_api_exceptions.PermissionDenied, google_api_exceptions.Unauthenticated, google_api_exceptions.InternalServerError) as critical_e:
+        print(f"{RED}Critical API error in fallback summarization for {paper_name}: {critical_e}{RESET}")
+        return LLM_API_CRITICAL_FAILURE_TOKEN
+    except Exception as e:
+        # Quota errors reaching here already exhausted generate_with_rate_limit's retries
+        if is_quota_error(e):
+            print(f"{RED}Quota limit still exceeded after retries during fallback summarization for {paper_name}. Critical failure.{RESET}")
+            return LLM_API_CRITICAL_FAILURE_TOKEN
+        print(f"{RED}Error in fallback summarization for {paper_name}: {e}{RESET}")
+        return f"Fallback summarization error for {paper_name}: {str(e)}"
+
+
+def paper_analysis_response_schema(include_references: bool) -> Dict[str, any]:
+    """Gemini response schema for analyze_paper."""
+    string_field = {"type": "STRING"}
+    schema = {
+        "type": "OBJECT",
+        "properties": {
+            "summary": string_field,
+            "relevance_score": {"type": "NUMBER", "description": "0.0 (unrelated) to 1.0 (directly on the SLR subject)"},
+            "relevance_label": {"type": "STRING", "description": "One of: " + ", ".join(RELEVANCE_LABELS)},
+            "relevance_reason": string_field,
+            "metadata": {
+                "type": "OBJECT",
+                "properties": {
+                    "title": string_field,
+                    "authors": {"type": "ARRAY", "items": string_field},
+                    "venue": string_field,
+                    "year": string_field,
+                    "doi": string_field,
+                    "url": string_field,
+                    "paper_type": string_field,
+                },
+            },
+        },
+        "required": ["summary", "relevance_score", "relevance_label", "relevance_reason", "metadata"],
+    }
+    if include_references:
+        schema["properties"]["references"] = {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"title": string_field, "authors": string_field, "year": string_field},
+                "required": ["title"],
+            },
+        }
+        schema["required"].append("references")
+    return schema
+
+
+def analyze_paper(
+    file_path: str,
+    mime_type: str,
+    paper_name: str,
+    subject: str,
+    include_references: bool = True,
+) -> Union[Dict[str, any], str]:
+    """
+    Structured per-paper analysis: one JSON call (constrained by a response schema) returns the
+    summary, a relevance score and label, the paper's metadata and, if include_references is set,
+    the cited references, so snowballing needs no second upload or call.
+    Returns the parsed dict, or an error string (LLM_API_CRITICAL_FAILURE_TOKEN for critical API errors).
+    """
+    try:
+        # Shared with summarize_paper and reference extraction through gemini_uploads
+        uploaded_file = gemini_uploads.upload_path(file_path, mime_type, paper_name)
+    except Exception as e:
+        print(f"{RED}Error uploading file to Gemini: {e}{RESET}")
+        return f"File upload error: {str(e)}"
+
+    try:
+        references_instructions = f"""- "references": the works cited by the paper, at most {COMBINED_ANALYSIS_MAX_REFERENCES}, most relevant to the SLR subject first.
+  Give only real titles from the reference list, without numbering, venues, DOIs or URLs. Use "" for unknown authors or year.
+""" if include_references else ""
+        prompt = f"""You are an expert academic researcher. Analyze the provided paper for a systematic literature review (SLR) on: [{subject}].
+
+Fill in the JSON response as follows:
+- "summary": discuss the paper's relevance to the SLR subject and list key points relevant to the subject with quotes from the paper
+- "relevance_score": 0.0 if the paper is unrelated to the SLR subject, 1.0 if it directly addresses it
+- "relevance_label": "relevant", "partially_relevant" or "not_relevant"
+- "relevance_reason": one or two sentences justifying the score
+- "metadata": Authors, Title, Journal/Conference (venue), Year, DOI, URL and Paper Type as stated in the paper. Use "" when unknown.
+{references_instructions}
+Paper Name: [{paper_name}]
+SLR Subject: [{subject}]
+"""
+        response = generate_with_rate_limit(
+            [prompt, uploaded_file],
+            generation_config=genai.types.GenerationConfig(
+                temperature=0.7,
+                response_mime_type="application/json",
+                response_schema=paper_analysis_response_schema(include_references)
+            )
+        )
+        save_usage_metadata(response.usage_metadata, inspect.currentframe().f_code.co_name)
+        parsed = json.loads(response.text)
+    except (google_api_exceptions.PermissionDenied, google_api_exceptions.Unauthenticated, google_api_exceptions.InternalServerError) as critical_e:
+        print(f"{RED}Critical API error during analysis for {paper_name}: {critical_e}{RESET}")
+        return LLM_API_CRITICAL_FAILURE_TOKEN
+    except Exception as e:
+        # Quota errors reaching here already exhausted generate_with_rate_limit's retries
+        if is_quota_error(e):
+            print(f"{RED}Quota limit still exceeded after retries during analysis for {paper_name}. Critical failure.{RESET}")
+            return LLM_API_CRITICAL_FAILURE_TOKEN
+        print(f"{RED}Error during combined analysis for {paper_name}: {e}{RESET}")
+        return f"Analysis error: {str(e)}"
+
+    summary_text = str(parsed.get('summary', '')).strip() if isinstance(parsed, dict) else ''
+    if not summary_text:
+        return f"Analysis error: no summary in response for {paper_name}"
+
+    try:
+        relevance_score = min(max(float(parsed.get('relevance_score', 0.0)), 0.0), 1.0)
+    except (TypeError, ValueError):
+        return f"Analysis error: invalid relevance_score in response for {paper_name}"
+    relevance_label = str(parsed.get('relevance_label', '')).strip().lower().replace(' ', '_').replace('-', '_')
+    if relevance_label not in RELEVANCE_LABELS:
+        relevance_label = "relevant" if relevance_score >= RELEVANCE_SCORE_THRESHOLD else "not_relevant"
+
+    raw_metadata = parsed.get('metadata') if isinstance(parsed.get('metadata'), dict) else {}
+    metadata = {key: str(value).strip() for key, value in raw_metadata.items() if key != 'authors' and value}
+    authors = raw_metadata.get('authors') or []
+    if isinstance(authors, str):
+        authors = [a.strip() for a in re.split(r',| and ', authors) if a.strip()]
+    metadata['authors'] = [str(a).strip() for a in authors if str(a).strip()]
+
+    references = []
+    seen_titles_lower = set()
+    for ref in parsed.get('references') or []:
+        if not isinstance(ref, dict):
+            continue
+        title = re.sub(r'\s+', ' ', str(ref.get('title', ''))).strip().rstrip('.')
+        if len(title) < 5 or title.lower() in seen_titles_lower:
+            continue
+        seen_titles_lower.add(title.lower())
+        references.append({
+            'title': title,
+            'authors': str(ref.get('authors') or 'N/A'),
+            'year': str(ref.get('year') or 'N/A')
+        })
+        if len(references) >= COMBINED_ANALYSIS_MAX_REFERENCES:
+            break
+
+    analysis = {
+        'summary': summary_text,
+        'relevance_score': relevance_score,
+        'relevance_label': relevance_label,
+        'relevance_reason': str(parsed.get('relevance_reason', '')).strip(),
+        'metadata': metadata
+    }
+    if include_references:
+        analysis['references'] = references
+    return analysis
+
+
+def relevance_assessment_record(paper_info: Dict[str, any], phase: str, included: bool) -> Dict[str, any]:
+    """Relevance decision entry for generate_final_processing_report."""
+    return {
+        'title': paper_info.get('title', paper_info.get('filename', 'Unknown Paper')),
+        'phase': phase,
+        'included': included,
+        'relevance_score': paper_info.get('relevance_score'),
+        'relevance_label': paper_info.get('relevance_label'),
+        'relevance_reason': paper_info.get('relevance_reason', '')
+    }
+
+
+def content_terms(text: str) -> set:
+    """Lowercased words longer than two characters, PRESCREEN_STOPWORDS removed."""
+    return {t for t in re.findall(r'[a-z0-9]+', text.lower()) if len(t) > 2 and t not in PRESCREEN_STOPWORDS}
+
+
+def lexical_relevance_score(subject: str, text: str) -> float:
+    """Share of the subject's content words (PRESCREEN_STOPWORDS removed) that occur in text."""
+    subject_terms = content_terms(subject)
+    if not subject_terms:
+        return 0.0
+    text_terms = content_terms(text)
+    # Crude stemming: "agents" matches "agent", "learning" matches "learn"
+    matched = sum(1 for term in subject_terms if any(t.startswith(term[:5]) for t in text_terms))
+    return matched / len(subject_terms)
+
+
+def prescreen_papers_by_abstract(
+    subject: str,
+    papers_metadata: List[Dict[str, any]],
+    threshold: float = PRESCREEN_SCORE_THRESHOLD,
+    batch_size: int = PRESCREEN_BATCH_SIZE
+) -> Tuple[List[Dict[str, any]], List[Dict[str, any]]]:
+    """
+    Scores title + abstract of each paper against the SLR subject, PRESCREEN_BATCH_SIZE papers
+    per LLM call. Batches whose call fails are scored locally with lexical_relevance_score.
+    Papers without an abstract (e.g. manual uploads) are always kept.
+    Sets 'prescreen_score' and 'prescreen_method' on each screened paper and returns (kept, rejected).
+    """
+    rejected = []
+    screenable = []
+    for meta in papers_metadata:
+        abstract = (meta.get('abstract_api') or meta.get('summary') or '').strip()
+        if abstract and not abstract.startswith('N/A'):
+            screenable.append((meta, abstract[:PRESCREEN_ABSTRACT_MAX_CHARS]))
+
+    for batch_start in range(0, len(screenable), batch_size):
+        batch = screenable[batch_start:batch_start + batch_size]
+        candidates_text = "\n\n".join(
+            f"[{idx}] Title: {meta.get('title', 'N/A')}\nAbstract: {abstract}"
+            for idx, (meta, abstract) in enumerate(batch)
+        )
+        prompt = f"""You are screening candidate papers for a systematic literature review (SLR) on: [{subject}].
+For each candidate below, judge from its title and abstract alone how relevant it is to the SLR subject.
+Give a score from 0.0 (unrelated) to 1.0 (directly on the subject). Be inclusive: score borderline papers around 0.5.
+Return one entry per candidate, using its [index].
+
+{candidates_text}
+"""
+        scores = {}
+        try:
+            response = generate_with_rate_limit(
+                prompt,
+                generation_config=genai.types.GenerationConfig(
+                    temperature=0.0,
+                    response_mime_type="application/json",
+                    response_schema={
+                        "type": "ARRAY",
+                        "items": {
+                            "type": "OBJECT",
+                            "properties": {"index": {"type": "INTEGER"}, "score": {"type": "NUMBER"}},
+                            "required": ["index", "score"],
+                        },
+                    }
+                )
+            )
+            save_usage_metadata(response.usage_metadata, inspect.currentframe().f_code.co_name)
+            for item in json.loads(response.text):
+                scores[int(item['index'])] = min(max(float(item['score']), 0.0), 1.0)
+        except Exception as e:
+            print(f"{YELLOW}Abstract pre-screen LLM call failed ({e}). Using lexical scoring for this batch.{RESET}")
+            scores = {}
+
+        for idx, (meta, abstract) in enumerate(batch):
+            if idx in scores:
+                meta['prescreen_score'], meta['prescreen_method'] = scores[idx], 'llm'
+                passed = scores[idx] >= threshold
+            else:
+                lexical_score = lexical_relevance_score(subject, f"{meta.get('title', '')} {abstract}")
+                meta['prescreen_score'], meta['prescreen_method'] = lexical_score, 'lexical'
+                passed = lexical_score >= PRESCREEN_LEXICAL_THRESHOLD
+            if not passed:
+                rejected.append(meta)
+
+    rejected_ids = {id(meta) for meta in rejected}
+    kept = [meta for meta in papers_metadata if id(meta) not in rejected_ids]
+    return kept, rejected
+
+
+def format_analysis_summary(analysis: Dict[str, any]) -> str:
+    """Renders a structured analysis as the summary text fed to the section prompts."""
+    metadata = analysis.get('metadata', {})
+    lines = [
+        f"Title: {metadata.get('title') or 'N/A'}",
+        f"Authors: {', '.join(metadata.get('authors', [])) or 'N/A'}",
+        f"Journal/Conference: {metadata.get('venue') or 'N/A'}",
+        f"Year: {metadata.get('year') or 'N/A'}",
+        f"DOI: {metadata.get('doi') or 'N/A'}",
+        f"URL: {metadata.get('url') or 'N/A'}",
+        f"Paper Type: {metadata.get('paper_type') or 'N/A'}",
+        f"Relevance: {analysis['relevance_label']} (score {analysis['relevance_score']:.2f}) - {analysis.get('relevance_reason', '')}",
+        "",
+        analysis['summary'],
+    ]
+    return "\n".join(lines)
+
+
+def pack_summaries_for_section(
+    papers: List[Dict[str, any]],
+    subject: str,
+    section_focus: str = "",
+    token_budget: int = SECTION_SUMMARIES_TOKEN_BUDGET
+) -> Tuple[str, List[Dict[str, any]]]:
+    """
+    Packs paper summaries into a section prompt within token_budget (estimate_prompt_tokens).
+    Summaries are ranked by lexical_relevance_score against the subject plus section_focus,
+    with the structured relevance_score as a bonus, and added best-first while they fit.
+    Packed summaries keep their input order and the "---" separator, so a set that fits
+    entirely gives the same text as joining them all. Returns (packed text, dropped papers).
+    """
+    separator = "\n\n---\n\n"
+    separator_tokens = estimate_prompt_tokens(separator)
+    focus = f"{subject} {section_focus}".strip()
+
+    def _rank(index: int) -> Tuple[float, int]:
+        paper = papers[index]
+        score = lexical_relevance_score(focus, paper['summary_text']) + (paper.get('relevance_score') or 0.0)
+        return -score, index
+
+    packed_indices = set()
+    used_tokens = 0
+    for index in sorted(range(len(papers)), key=_rank):
+        summary_tokens = estimate_prompt_tokens(papers[index]['summary_text']) + separator_tokens
+        if used_tokens + summary_tokens <= token_budget:
+            packed_indices.add(index)
+            used_tokens += summary_tokens
+
+    packed_text = separator.join(papers[i]['summary_text'] for i in range(len(papers)) if i in packed_indices).strip()
+    dropped_papers = [papers[i] for i in range(len(papers)) if i not in packed_indices]
+    return packed_text, dropped_papers
+
+
+def cluster_texts_by_theme(texts: List[str], max_cluster_size: int = MAP_REDUCE_CLUSTER_SIZE) -> List[List[int]]:
+    """
+    Groups texts into thematic clusters by word overlap (Jaccard similarity of content_terms).
+    Each cluster starts from the first unassigned text and takes its most similar unassigned
+    texts; cluster sizes are balanced so no cluster exceeds max_cluster_size.
+    Returns lists of indices into texts.
+    """
+    if not texts:
+        return []
+    cluster_count = -(-len(texts) // max(2, max_cluster_size))
+    cluster_size = -(-len(texts) // cluster_count)
+    term_sets = [content_terms(text) for text in texts]
+    unassigned = list(range(len(texts)))
+    clusters: List[List[int]] = []
+    while unassigned:
+        seed = unassigned.pop(0)
+        def _similarity(index: int) -> float:
+            union = term_sets[seed] | term_sets[index]
+            return len(term_sets[seed] & term_sets[index]) / len(union) if union else 0.0
+        members = sorted(unassigned, key=_similarity, reverse=True)[:cluster_size - 1]
+        for index in members:
+            unassigned.remove(index)
+        clusters.append([seed] + sorted(members))
+    return clusters
+
+
+def synthesize_summary_cluster(texts: List[str], subject: str, cluster_label: str) -> str:
+    """Map step: one LLM call merges a cluster of paper summaries (or partial syntheses) into a thematic synthesis."""
+    joined_texts = "\n\n---\n\n".join(texts)
+    prompt = f"""You are an expert researcher preparing material for a Systematic Literature Review on "{subject}".
+Below are {len(texts)} paper summaries (or partial syntheses of summaries) that share a theme, separated by "---".
 
-        prompt_instructions = f"""You are an expert academic researcher. Summarize the provided paper content (from the uploaded text file) for a systematic literature review (SLR) on: [{subject}].
+Task:
+Write a thematic synthesis of this group:
+1. Start with a one-line name for the shared theme.
+2. Describe the common problems, approaches and methodologies, and how the papers differ.
+3. Report the key findings and results, keeping concrete numbers, datasets and evaluation details.
+4. Note limitations, contradictions and open questions.
+5. For every paper mentioned, keep its title, first author and year exactly as given so it can still be cited. Do not drop any paper.
 
-Follow these instructions:
-1. Extract metadata: Authors, Title, Journal/Conference, Year, DOI, URL, Paper Type (if inferable from text).
-2. Discuss the paper's relevance to the SLR subject.
-3. List key points relevant to the subject with quotes from the paper.
-4. If not relevant, state: "This paper does not appear relevant to '{subject}'"
+Return only the synthesis as plain text. Do not invent papers or results.
 
-Paper Name: [{paper_name}] (filename: {os.path.basename(txt_file_path)})
-SLR Subject: [{subject}]
+{joined_texts}
 """
-        # Generate content with the uploaded file
-        response = summary_model.generate_content(
-            [prompt_instructions, uploaded_file], # Pass as a list
-            generation_config=genai.types.GenerationConfig(temperature=0.7)
-        )
-        save_usage_metadata(response.usage_metadata, inspect.currentframe().f_code.co_name)
-        return response.text.strip()
-
-    except (google_api_exceptions.PermissionDenied, google_api_exceptions.Unauthenticated, google_api_exceptions.ResourceExhausted, google_api_exceptions.InternalServerError) as critical_e:
-        print(f"{RED}Critical API error in fallback summarization for {paper_name}: {critical_e}{RESET}")
-        return LLM_API_CRITICAL_FAILURE_TOKEN
-    except Exception as e:
-        print(f"{RED}Error in fallback summarization for {paper_name}: {e}{RESET}")
-        return f"Fallback summarization error for {paper_name}: {str(e)}"
-    finally:
-        # Clean up: Delete the uploaded file after processing
-        if uploaded_file:
-            try:
-                genai.delete_file(uploaded_file.name)
-            except Exception as delete_error:
-                print(f"{YELLOW}Warning: Could not delete uploaded file {uploaded_file.name} in summarize_paper_fallback: {delete_error}{RESET}")
+    return generate_content_from_prompt(prompt, context_for_error=f"Summary synthesis for {cluster_label}")
 
 
-def generate_content_from_prompt(prompt: str, context_for_error: str = "LLM Generation") -> str:
-    """Generates content using Gemini model with enhanced error handling"""
-    global LLM_CALL_COUNT
-    LLM_CALL_COUNT += 1
+def map_reduce_summary_synthesis(
+    texts: List[str],
+    subject: str,
+    token_budget: int = SECTION_SUMMARIES_TOKEN_BUDGET,
+    max_cluster_size: int = MAP_REDUCE_CLUSTER_SIZE,
+    max_workers: int = MAP_REDUCE_MAX_WORKERS
+) -> str:
+    """
+    Hierarchical map-reduce over paper summaries for large reviews. Summaries are clustered by
+    theme (cluster_texts_by_theme) and each cluster is synthesized concurrently; if the partial
+    syntheses together still exceed token_budget, they are clustered and synthesized again.
+    Returns the partial syntheses joined with the "---" separator (reduced into each section
+    by its generator), or the first LLM error string.
+    """
+    level = 1
+    while True:
+        clusters = cluster_texts_by_theme(texts, max_cluster_size)
+        print(f"Map-reduce synthesis level {level}: {len(texts)} inputs in {len(clusters)} thematic clusters.")
+        worker_count = max(1, min(max_workers, len(clusters)))
+        with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="synthesis") as executor:
+            partials = list(executor.map(
+                lambda numbered_cluster: synthesize_summary_cluster(
+                    [texts[i] for i in numbered_cluster[1]], subject, f"level {level} cluster {numbered_cluster[0] + 1}"
+                ),
+                enumerate(clusters)
+            ))
+        failed_partial = next((partial for partial in partials if not partial or partial.startswith(LLM_ERROR_PREFIXES)), None)
+        if failed_partial is not None:
+            return failed_partial or f"% Error during summary synthesis: empty partial synthesis at level {level}"
+        joined_partials = "\n\n---\n\n".join(partials).strip()
+        if len(partials) == 1 or estimate_prompt_tokens(joined_partials) <= token_budget:
+            return joined_partials
+        texts = partials
+        level += 1
+
+
+def paper_judged_relevant(paper_info: Dict[str, any]) -> bool:
+    """
+    Relevance filter used by process_papers. Uses the structured verdict (relevance_score and
+    relevance_label) when present; plain-text summaries from the fallback path are checked for
+    the "does not appear relevant" statement the summarization prompts ask for.
+    """
+    summary_text = paper_info.get('summary_text', '')
+    if not summary_text or summary_text.startswith(LLM_ERROR_PREFIXES + SUMMARY_ERROR_PREFIXES) or \
+       "Error summarizing paper" in summary_text:
+        return False
+    if paper_info.get('relevance_score') is not None:
+        return paper_info['relevance_score'] >= RELEVANCE_SCORE_THRESHOLD and \
+               paper_info.get('relevance_label') != "not_relevant"
+    return re.search(r'does not appear (to be )?relevant', summary_text, re.IGNORECASE) is None
 
-    # Rate limiting
-    if LLM_CALL_COUNT > 0 and LLM_CALL_COUNT % LLM_CALLS_BEFORE_WAIT == 0:
-        print(f"Reached {LLM_CALL_COUNT} LLM calls. Pausing for {LLM_WAIT_SECONDS} seconds...")
-        time.sleep(LLM_WAIT_SECONDS)
-        print("Resuming LLM calls.")
 
+def generate_content_from_prompt(prompt: str, context_for_error: str = "LLM Generation", bypass_cache: bool = False) -> str:
+    """
+    Generates content using Gemini model with enhanced error handling.
+    With LLM_RESPONSE_CACHE_ENABLED, successful responses are stored in llm_response_cache and
+    identical prompts are answered from it; pass bypass_cache=True for calls that need a fresh answer.
+    """
     try:
-        generation_config = genai.types.GenerationConfig(
-            temperature=0.7
-        )
-        
-        max_retries_quota = 3
-        attempt = 0
+        generation_config_params = {"temperature": 0.7}
+        generation_config = genai.types.GenerationConfig(**generation_config_params)
+
+        response_cache_key = None
+        if LLM_RESPONSE_CACHE_ENABLED and not bypass_cache and isinstance(prompt, str):
+            response_cache_key = llm_response_cache_key(prompt, generation_config_params)
+            cached_response = llm_response_cache.get(response_cache_key)
+            if cached_response is not None:
+                print(f"Response cache hit for {context_for_error}.")
+                return cached_response
         
         while True:
             try:
-                if attempt > 0:
-                    LLM_CALL_COUNT += 1
-                    if LLM_CALL_COUNT % LLM_CALLS_BEFORE_WAIT == 0:
-                        print(f"Reached {LLM_CALL_COUNT} LLM calls (retry). Pausing...")
-                        time.sleep(LLM_WAIT_SECONDS)
-
-                response = summary_model.generate_content(
+                # Rate limiting (RPM/TPM budgets) and 429 retries happen inside generate_with_rate_limit
+                response = generate_with_rate_limit(
                     prompt,
                     generation_config=generation_config
                 )
@@ -1394,6 +3021,8 @@ def generate_content_from_prompt(prompt: str, context_for_error: str = "LLM Gene
                 # Process response
                 try:
                     generated_text = response.text.strip()
+                    if response_cache_key and generated_text:
+                        llm_response_cache.put(response_cache_key, generated_text)
                     return generated_text
                 except ValueError as ve:
                     # This can happen if response.text is not available or malformed due to an API error
@@ -1406,17 +3035,10 @@ def generate_content_from_prompt(prompt: str, context_for_error: str = "LLM Gene
 
             except Exception as e_inner:
                 error_str = str(e_inner)
-                # Handle quota errors
-                if "429" in error_str and "quota" in error_str.lower():
-                    if attempt < max_retries_quota:
-                        retry_delay = 60
-                        print(f"{YELLOW}Quota error (429) for {context_for_error}. Waiting {retry_delay}s... (Attempt {attempt+1}/{max_retries_quota}){RESET}")
-                        time.sleep(retry_delay)
-                        attempt += 1
-                        continue
-                    else:
-                        print(f"{RED}Quota limit still exceeded after retries for {context_for_error}. Critical failure.{RESET}")
-                        return LLM_API_CRITICAL_FAILURE_TOKEN # Treat as critical
+                # Quota errors reaching here already exhausted generate_with_rate_limit's retries
+                if is_quota_error(e_inner):
+                    print(f"{RED}Quota limit still exceeded after retries for {context_for_error}. Critical failure.{RESET}")
+                    return LLM_API_CRITICAL_FAILURE_TOKEN # Treat as critical
                 
                 # Check for other critical API errors
                 if isinstance(e_inner, (google_api_exceptions.PermissionDenied, google_api_exceptions.Unauthenticated, google_api_exceptions.InternalServerError)):
@@ -1500,16 +3122,19 @@ def create_bibliometric(
     metadata_prompt_string = ""
     for i, meta in enumerate(fetched_papers_metadata):
         # Ensure meta is a dict, as it might come from llm_confirmed_relevant_papers
-        if not isinstance(meta, dict):
+        if not isinstance(meta, Mapping):
             print(f"Warning: Metadata item {i} is not a dictionary, skipping for BibTeX generation. Item: {meta}")
             continue
+        # Metadata extracted by the structured paper analysis fills the gaps left by the search APIs
+        llm_meta = meta.get('llm_metadata') or {}
         metadata_prompt_string += f"Paper {i+1}:\n"
-        metadata_prompt_string += f"  Title: {meta.get('title', 'N/A')}\n"
-        metadata_prompt_string += f"  Authors: {', '.join(meta.get('authors', []))}\n"
-        metadata_prompt_string += f"  Year: {meta.get('published_year', 'N/A')}\n"
-        metadata_prompt_string += f"  DOI: {meta.get('doi', 'N/A')}\n"
-        metadata_prompt_string += f"  URL: {meta.get('id_url', meta.get('pdf_url', 'N/A'))}\n" 
-        metadata_prompt_string += f"  Journal/Conference: {meta.get('journal_ref', 'N/A')}\n\n"
+        metadata_prompt_string += f"  Title: {meta.get('title') or llm_meta.get('title') or 'N/A'}\n"
+        metadata_prompt_string += f"  Authors: {', '.join(meta.get('authors') or llm_meta.get('authors') or [])}\n"
+        metadata_prompt_string += f"  Year: {meta.get('published_year') or llm_meta.get('year') or 'N/A'}\n"
+        metadata_prompt_string += f"  DOI: {meta.get('doi') or llm_meta.get('doi') or 'N/A'}\n"
+        metadata_prompt_string += f"  URL: {meta.get('id_url') or meta.get('pdf_url') or llm_meta.get('url') or 'N/A'}\n"
+        metadata_prompt_string += f"  Journal/Conference: {meta.get('journal_ref') or llm_meta.get('venue') or 'N/A'}\n"
+        metadata_prompt_string += f"  Paper Type: {llm_meta.get('paper_type') or 'N/A'}\n\n"
 
     if not metadata_prompt_string.strip():
         print("No valid metadata could be extracted for BibTeX generation.")
@@ -1517,7 +3142,7 @@ def create_bibliometric(
 
     prompt = f"""Based on the following paper metadata (and optionally, summaries for context), create a .bib file content for a BibTeX bibliography.
 Each entry should attempt to extract and format the following fields if available from the METADATA primarily: author, title, journal (or booktitle for conferences), year, pages (if available), doi, url.
-Use standard BibTeX entry types (e.g., @article, @inproceedings, @book, @techreport). Create a unique BibTeX key for each entry (e.g., AuthorYearKeyword).
+Use standard BibTeX entry types (e.g., @article, @inproceedings, @book, @techreport), chosen from the Paper Type when it is given. Create a unique BibTeX key for each entry (e.g., AuthorYearKeyword).
 If a field is not present in the metadata, omit it from the BibTeX entry.
 
 ---BEGIN METADATA---
@@ -1561,29 +3186,6 @@ def read_metadata() -> str:
         return f"Error reading metadata: {e}"
 
 # --- Scopus Specific Functions (adapted from scopus_fetch.py) ---
-def convert_pdf_to_text_ocr(pdf_path: str, txt_out_path: str) -> bool:
-    """
-    Converts a PDF to text using OCR (Tesseract).
-    Used for Scopus PDFs which might be image-based.
-    """
-    try:
-        # Ensure output directory for the .txt file exists
-        os.makedirs(os.path.dirname(txt_out_path), exist_ok=True)
-        with tempfile.TemporaryDirectory() as temp_dir:
-            images = convert_from_path(pdf_path, output_folder=temp_dir)
-            full_text = ""
-            for i, img in enumerate(images):
-                text = pytesseract.image_to_string(img)
-                full_text += f"\n\n--- Page {i + 1} ---\n{text}"
-
-        with open(txt_out_path, "w", encoding="utf-8") as f:
-            f.write(full_text.strip())
-        print(f"    OCR Success: Saved {txt_out_path}")
-        return True
-    except Exception as e:
-        print(f"    [!] OCR failed for {pdf_path}: {e}")
-        return False
-
 def download_pdf_from_scopus(
     doi: str,
     base_filename: str,
@@ -1608,22 +3210,27 @@ def download_pdf_from_scopus(
         print(f"    PDF and TXT already exist for {base_filename}, skipping download.")
         return pdf_path, txt_path
 
+    store_keys = [f"doi:{doi.strip().lower()}"]
+    if paper_store.fetch_file(store_keys, 'pdf', pdf_path):
+        print(f"    Scopus PDF restored from paper store: {pdf_path}")
+        return pdf_path, None
+
     headers = {"X-ELS-APIKey": scopus_api_key, "Accept": "application/pdf"}
     url = SCOPUS_ARTICLE_BASE_URL + urllib.parse.quote_plus(doi)
 
     try:
         print(f"    Attempting Scopus PDF download for DOI: {doi} (File: {base_filename}.pdf)")
-        resp = requests.get(url, headers=headers, stream=True, timeout=60)
-        if resp.status_code == 200:
+        with get_http_session().get(url, headers=headers, stream=True, timeout=60) as resp:
+            if resp.status_code != 200:
+                print(f"    Scopus PDF download failed for DOI {doi}. Status: {resp.status_code} {resp.text[:100]}")
+                return None, None
             os.makedirs(pdf_folder, exist_ok=True)
             with open(pdf_path, "wb") as f:
-                for chunk in resp.iter_content(chunk_size=8192):
+                for chunk in resp.iter_content(chunk_size=PDF_DOWNLOAD_CHUNK_SIZE):
                     f.write(chunk)
-            print(f"    Scopus PDF downloaded: {pdf_path}")
-            return pdf_path, None  # No OCR text path
-        else:
-            print(f"    Scopus PDF download failed for DOI {doi}. Status: {resp.status_code} {resp.text[:100]}")
-            return None, None
+        print(f"    Scopus PDF downloaded: {pdf_path}")
+        paper_store.put_file(store_keys, 'pdf', pdf_path)
+        return pdf_path, None  # No OCR text path
     except requests.exceptions.RequestException as e:
         print(f"    Scopus PDF download exception for DOI {doi}: {e}")
         return None, None
@@ -1634,11 +3241,14 @@ def fetch_scopus_papers_and_process(
     pdf_folder: str,
     txt_folder: str,
     already_fetched_primary_ids: set,
-    scopus_api_key: Optional[str] # Added parameter
+    scopus_api_key: Optional[str], # Added parameter
+    download_pdfs: bool = True
 ) -> Tuple[List[Dict], int, str]:
     """ 
     Fetches paper metadata from Scopus, downloads PDFs, converts them to text (OCR),
     and returns a list of processed paper metadata.
+    With download_pdfs=False only metadata and the API abstract are kept; download_scopus_paper_pdfs
+    fetches the PDFs later for the papers that pass the abstract pre-screen.
     """
     if not scopus_api_key:
         return [], 0, "Scopus: API key not provided. Skipping Scopus search."
@@ -1657,7 +3267,7 @@ def fetch_scopus_papers_and_process(
     newly_fetched_and_saved_count = 0
 
     try:
-        resp = requests.get(SCOPUS_SEARCH_URL, headers=headers, params=params, timeout=30)
+        resp = get_http_session().get(SCOPUS_SEARCH_URL, headers=headers, params=params, timeout=30)
         resp.raise_for_status()
         data = resp.json()
     except requests.exceptions.RequestException as e:
@@ -1690,7 +3300,10 @@ def fetch_scopus_papers_and_process(
         sanitized_base_filename = sanitize_filename(primary_id_scopus) # Uses the primary_id for filename base
         # pdf_path will be the path to the PDF if downloaded, else None.
         # ocr_txt_path will be the path to the OCR'd text if successful, else None.
-        pdf_downloaded_path, ocr_txt_path = download_pdf_from_scopus(doi, sanitized_base_filename, pdf_folder, txt_folder, scopus_api_key)
+        if download_pdfs:
+            pdf_downloaded_path, ocr_txt_path = download_pdf_from_scopus(doi, sanitized_base_filename, pdf_folder, txt_folder, scopus_api_key)
+        else:
+            pdf_downloaded_path, ocr_txt_path = None, None
 
         # Determine the text content and its source
         final_txt_path_for_meta = None
@@ -1723,22 +3336,46 @@ def fetch_scopus_papers_and_process(
                 print(f"    No OCR text and no API abstract for Scopus entry {primary_id_scopus}. Cannot process further.")
 
         if text_content_available: # If we have either OCR text or API abstract
-            scopus_meta = {
-                'source': 'scopus', 'id_primary': primary_id_scopus,
-                'title': title,
-                'authors': [a.get('$') for a in entry.get('author', []) if isinstance(a, dict) and '$' in a],
-                'published_year': entry.get("prism:coverDate", "")[:4],
-                'abstract_api': entry.get("dc:description") or entry.get("prism:description") or "", # Check both
-                'doi': doi, 'scopus_id': scopus_id,
-                'local_pdf_path': pdf_downloaded_path, # This might be None if PDF download failed
-                'local_txt_path': final_txt_path_for_meta, # Path to the text file (either OCR or API abstract)
-            }
+            scopus_meta = Paper(
+                source='scopus', id_primary=primary_id_scopus,
+                title=title,
+                authors=[a.get('$') for a in entry.get('author', []) if isinstance(a, dict) and '$' in a],
+                published_year=entry.get("prism:coverDate", "")[:4],
+                abstract_api=entry.get("dc:description") or entry.get("prism:description") or "", # Check both
+                doi=doi, scopus_id=scopus_id,
+                local_pdf_path=pdf_downloaded_path, # This might be None if PDF download failed
+                local_txt_path=final_txt_path_for_meta, # Path to the text file (either OCR or API abstract)
+            )
             processed_papers_metadata_list.append(scopus_meta)
+            paper_store.put_metadata(paper_store_keys(scopus_meta), scopus_meta)
             already_fetched_primary_ids.add(primary_id_scopus) # Mark as fetched
             newly_fetched_and_saved_count += 1
     
     return processed_papers_metadata_list, newly_fetched_and_saved_count, f"Scopus: Processed {newly_fetched_and_saved_count} new papers for query '{search_query_str[:50]}...'"
 
+
+def download_scopus_paper_pdfs(
+    papers_metadata: List[Dict[str, any]],
+    pdf_folder: str,
+    txt_folder: str,
+    scopus_api_key: Optional[str]
+) -> None:
+    """
+    Second stage of a metadata-only Scopus fetch (fetch_scopus_papers_and_process with
+    download_pdfs=False): downloads the PDF of each Scopus paper that has a DOI and no PDF yet
+    and sets its 'local_pdf_path'. Papers whose download fails keep their API abstract text.
+    """
+    if not scopus_api_key:
+        return
+    for paper_metadata in papers_metadata:
+        if paper_metadata.get('source') != 'scopus' or not paper_metadata.get('doi') or paper_metadata.get('local_pdf_path'):
+            continue
+        pdf_path, _ = download_pdf_from_scopus(
+            paper_metadata['doi'], sanitize_filename(paper_metadata['id_primary']), pdf_folder, txt_folder, scopus_api_key
+        )
+        if pdf_path:
+            paper_metadata['local_pdf_path'] = pdf_path
+
 def create_charts(section_content_tex_path: str, section_name_for_file: str) -> str:
     """
     Enhances a LaTeX section (from a .tex file) by adding charts/tables based on its content.
@@ -1792,22 +3429,18 @@ Return the **modified LaTeX code for the section ONLY**.
 """
     prompt_instructions += f"\n\n{LATEX_SAFETY_RULES}"
     
-    uploaded_section_file = None
     enhanced_content = original_content # Default to original if LLM fails
 
     try:
-        uploaded_section_file = genai.upload_file(
-            path=section_content_tex_path,
-            mime_type='text/plain', # Treat .tex section as plain text
-            display_name=f"section_{section_name_for_file}"
-        )
+        # Treat .tex section as plain text; unchanged sections reuse their earlier upload
+        uploaded_section_file = gemini_uploads.upload_path(section_content_tex_path, 'text/plain', f"section_{section_name_for_file}")
         
         # generate_markdown needs to be able to handle a list [instructions, file_object]
         # For now, let's assume generate_markdown is adapted or we call summary_model directly
         # For simplicity here, directly calling summary_model.
         # The `generate_markdown` function would need to be refactored to accept a list for its `prompt` argument.
         
-        response = summary_model.generate_content(
+        response = generate_with_rate_limit(
             [prompt_instructions, uploaded_section_file],
             generation_config=genai.types.GenerationConfig(temperature=0.3) # Lower temp for code generation
         )
@@ -1827,12 +3460,6 @@ Return the **modified LaTeX code for the section ONLY**.
     except Exception as e:
         print(f"{RED}Error during chart creation for {section_name_for_file}: {e}{RESET}")
         enhanced_content = original_content # Revert to original on error
-    finally:
-        if uploaded_section_file:
-            try:
-                genai.delete_file(uploaded_section_file.name)
-            except Exception as delete_error:
-                print(f"{YELLOW}Warning: Could not delete uploaded section file {uploaded_section_file.name}: {delete_error}{RESET}")
 
     # Save the (potentially) enhanced content
     results_dir = os.path.dirname(output_tex_filename)
@@ -2095,37 +3722,15 @@ The BibTeX bibliography for context is in the uploaded 'biblio_context.bib' file
     # prompt_instructions += f"\n\n{LATEX_SAFETY_RULES}"
 
 
-    uploaded_summaries_file = None
-    uploaded_biblio_context_file = None
-    temp_summaries_path = None
-    temp_biblio_path = None
-
+    files_to_upload_content = {
+        "summaries_data.txt": summaries,
+        "biblio_context.bib": Biblio_content
+    }
     try:
-        # Save summaries string to a temporary file
-        with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".txt", encoding='utf-8') as tmp_s:
-            tmp_s.write(summaries)
-            temp_summaries_path = tmp_s.name
-        
-        # Save Biblio_content string to a temporary file
-        with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".bib", encoding='utf-8') as tmp_b:
-            tmp_b.write(Biblio_content)
-            temp_biblio_path = tmp_b.name
-
-        uploaded_summaries_file = genai.upload_file(
-            path=temp_summaries_path,
-            mime_type='text/plain',
-            display_name='summaries_data.txt'
-        )
-        uploaded_biblio_context_file = genai.upload_file(
-            path=temp_biblio_path,
-            mime_type='text/plain', # BibTeX is plain text
-            display_name='biblio_context.bib'
-        )
-        
-        # generate_markdown needs to be adapted to handle a list prompt
-        # For now, directly calling summary_model.generate_content
-        response = summary_model.generate_content(
-            [prompt_instructions, uploaded_summaries_file, uploaded_biblio_context_file],
+        uploaded_context_files = upload_section_context_files(files_to_upload_content)
+
+        response = generate_with_rate_limit(
+            [prompt_instructions] + uploaded_context_files,
             generation_config=genai.types.GenerationConfig(temperature=0.7)
         )
         generated_text = response.text.strip()
@@ -2146,11 +3751,6 @@ The BibTeX bibliography for context is in the uploaded 'biblio_context.bib' file
     except Exception as e:
         print(f"{RED}Error in create_related_works: {e}{RESET}")
         return f"% Error generating related_works section: {e}"
-    finally:
-        if uploaded_summaries_file: genai.delete_file(uploaded_summaries_file.name)
-        if uploaded_biblio_context_file: genai.delete_file(uploaded_biblio_context_file.name)
-        if temp_summaries_path and os.path.exists(temp_summaries_path): os.remove(temp_summaries_path)
-        if temp_biblio_path and os.path.exists(temp_biblio_path): os.remove(temp_biblio_path)
 
 
 
@@ -2607,7 +4207,7 @@ def generate_critique(slr_content_tex_path: str, previous_critique_text: str = "
         # Call the centralized LLM content generation function
         # generate_content_from_prompt needs to be able to handle a list [instructions, file_object]
         # For now, assuming generate_content_from_prompt is adapted or we call summary_model directly
-        response = summary_model.generate_content(
+        response = generate_with_rate_limit(
             [critique_prompt_instructions, uploaded_slr_file],
             generation_config=genai.types.GenerationConfig(temperature=0.5)
         )
@@ -2721,6 +4321,97 @@ def replace_placeholders_in_latex(latex_content: str, counts: Dict[str, int]) ->
 
  # Functions compile_latex, parse_latex_log, get_latex_correction_suggestion are removed as pdflatex is no longer used.
 
+# --- Section Generation Scheduler ---
+def _timed_section_call(node_fn: Callable[[Dict[str, str]], str], inputs: Dict[str, str]) -> Tuple[str, timedelta]:
+    start_time = datetime.now()
+    result = node_fn(inputs)
+    return result, datetime.now() - start_time
+
+
+def section_inputs_fingerprint(inputs: Dict[str, str]) -> str:
+    """Content-hash fingerprint of a section step's inputs."""
+    return BoundedDiskCache.make_key(sorted(
+        (name, hashlib.sha256(content.encode('utf-8')).hexdigest()) for name, content in inputs.items()
+    ))
+
+
+def run_section_graph(
+    nodes: Dict[str, Tuple[Tuple[str, ...], Callable[[Dict[str, str]], str]]],
+    max_workers: int = SECTION_GENERATION_MAX_WORKERS,
+    reuse_cache: Optional[Dict[str, Tuple[str, str]]] = None,
+    changed_steps: Iterable[str] = (),
+    on_start: Optional[Callable[[str], None]] = None
+) -> Tuple[Dict[str, str], Dict[str, timedelta], Optional[str]]:
+    """
+    Runs section-generation steps as a dependency graph. nodes maps a step name to
+    (names of the steps it takes as input, callable receiving {input name: output}).
+    Every step whose inputs are done is started, so independent sections and chart
+    passes overlap; their LLM calls still go through llm_rate_limiter.
+    With a reuse_cache (step -> (inputs fingerprint, output), updated in place), a step
+    not listed in changed_steps whose inputs hash the same as last time reuses its
+    previous output instead of running; reused steps get no timing entry.
+    on_start(step name) is called on the calling thread just before a step is submitted,
+    so progress can be reported from there (worker threads have no UI context).
+    Returns (outputs, per-step timings, first step whose output starts with an
+    LLM_ERROR_PREFIXES entry or None). No new step starts after a failure; an exception
+    raised by a step is re-raised once the running steps finish.
+    """
+    for name, (dependencies, _) in nodes.items():
+        unknown = [dep for dep in dependencies if dep not in nodes]
+        if unknown:
+            raise ValueError(f"Section step '{name}' depends on unknown steps: {unknown}")
+
+    outputs: Dict[str, str] = {}
+    timings: Dict[str, timedelta] = {}
+    pending = dict(nodes)
+    running: Dict[Future, str] = {}
+    fingerprints: Dict[str, str] = {}
+    changed_steps = set(changed_steps)
+    failed_node: Optional[str] = None
+    node_error: Optional[BaseException] = None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="section") as executor:
+        while True:
+            ready = failed_node is None and node_error is None
+            while ready:
+                # Reused steps complete immediately and may make their dependents ready
+                ready = [name for name, (dependencies, _) in pending.items() if all(dep in outputs for dep in dependencies)]
+                for name in ready:
+                    dependencies, node_fn = pending.pop(name)
+                    inputs = {dep: outputs[dep] for dep in dependencies}
+                    fingerprints[name] = section_inputs_fingerprint(inputs)
+                    cached = reuse_cache.get(name) if reuse_cache is not None else None
+                    if cached and cached[0] == fingerprints[name] and name not in changed_steps:
+                        outputs[name] = cached[1]
+                        continue
+                    if on_start:
+                        on_start(name)
+                    running[executor.submit(_timed_section_call, node_fn, inputs)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    node_error = node_error or e
+                    continue
+                outputs[name] = result
+                timings[name] = elapsed
+                if result.startswith(LLM_ERROR_PREFIXES):
+                    failed_node = failed_node or name
+                elif reuse_cache is not None:
+                    reuse_cache[name] = (fingerprints[name], result)
+
+    if node_error is not None:
+        raise node_error
+    if pending and failed_node is None:
+        raise ValueError(f"Section steps with unsatisfiable dependencies: {sorted(pending)}")
+    # Report timings in declaration order rather than completion order
+    return outputs, {name: timings[name] for name in nodes if name in timings}, failed_node
+
+
 def generate_slr_outline(natural_language_paper_goal: str, relevant_papers_summaries: str, subject: str) -> str:
     """
     Generates a high-level outline for the SLR using an LLM by uploading relevant summaries.
@@ -2728,17 +4419,10 @@ def generate_slr_outline(natural_language_paper_goal: str, relevant_papers_summa
     if not relevant_papers_summaries.strip() or relevant_papers_summaries.startswith(("% Error", "% No relevant")):
         return "% No relevant paper summaries provided to generate an outline."
 
-    uploaded_summaries_file = None
-    temp_summaries_path = None
-
     try:
-        with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".txt", encoding='utf-8') as tmp_s:
-            tmp_s.write(relevant_papers_summaries)
-            temp_summaries_path = tmp_s.name
-        
-        uploaded_summaries_file = genai.upload_file(
-            path=temp_summaries_path,
-            mime_type='text/plain',
+        # Shared run-scoped upload: the same summaries blob is reused by the section generators
+        uploaded_summaries_file = gemini_uploads.upload_text(
+            relevant_papers_summaries,
             display_name='relevant_paper_summaries_for_outline.txt'
         )
 
@@ -2794,8 +4478,8 @@ SLR Outline for: {subject}
 ---
 Return only the outline. Do not include conversational preambles.
 """
-        # Call summary_model.generate_content directly
-        response = summary_model.generate_content(
+        # Call the model through the shared rate limiter
+        response = generate_with_rate_limit(
             [prompt, uploaded_summaries_file],
             generation_config=genai.types.GenerationConfig(temperature=0.7)
         )
@@ -2812,95 +4496,82 @@ Return only the outline. Do not include conversational preambles.
     except Exception as e:
         print(f"{RED}Error in generate_slr_outline: {e}{RESET}")
         return f"% Error generating SLR outline: {e}"
-    finally:
-        if uploaded_summaries_file:
-            try:
-                genai.delete_file(uploaded_summaries_file.name)
-            except Exception as delete_error:
-                print(f"{YELLOW}Warning: Could not delete uploaded summaries file in generate_slr_outline: {delete_error}{RESET}")
-        if temp_summaries_path and os.path.exists(temp_summaries_path):
-            os.remove(temp_summaries_path)
 
 def extract_references_from_paper_text(
     txt_file_path: str, # Changed from paper_text_content
     paper_title_for_logging: str,
-    status_update_func: Callable[[str], None]
+    status_update_func: Callable[[str], None],
+    pdf_path: Optional[str] = None
 ) -> List[Dict[str, str]]:
     """
     Extracts reference titles from a paper's text file.
     It first uses regex to attempt to isolate the reference section,
     then uses an LLM to extract titles from that section (or the full text if section not found).
+    If pdf_path is given, the PDF upload shared with summarization (gemini_uploads) is
+    reused instead of uploading the reference text again.
     """
-    status_update_func(f"  Extracting references for '{paper_title_for_logging[:50]}...' from: {os.path.basename(txt_file_path)}")
+    uploaded_paper_file = None
+    if pdf_path and os.path.exists(pdf_path):
+        try:
+            uploaded_paper_file = gemini_uploads.upload_path(pdf_path, 'application/pdf', paper_title_for_logging)
+            status_update_func(f"  Extracting references for '{paper_title_for_logging[:50]}...' from its uploaded PDF: {os.path.basename(pdf_path)}")
+        except Exception as e_upload:
+            status_update_func(f"    Could not reuse PDF upload for '{paper_title_for_logging[:50]}...' ({e_upload}). Falling back to text file.")
 
-    full_text_content = ""
-    try:
-        with open(txt_file_path, 'r', encoding='utf-8') as f:
-            full_text_content = f.read()
-    except Exception as e_read:
-        status_update_func(f"    Error reading text file {txt_file_path}: {e_read}")
-        return []
+    if uploaded_paper_file is None:
+        status_update_func(f"  Extracting references for '{paper_title_for_logging[:50]}...' from: {os.path.basename(txt_file_path)}")
 
-    if not full_text_content.strip():
-        status_update_func(f"    Text file {txt_file_path} is empty. Cannot extract references.")
-        return []
+        if not text_file_has_content(txt_file_path):
+            status_update_func(f"    Text file {txt_file_path} is empty or missing. Cannot extract references.")
+            return []
 
-    # 1. Regex to attempt to isolate the reference section
-    reference_section_text_for_llm = ""
-    # Regex to find common reference section headers and capture text following them.
-    # This is a basic attempt; robustly finding the end of a reference section in plain text is hard.
-    # It looks for a header and then takes a substantial chunk of text, or up to a common next section.
-    ref_headers_pattern = r'\n\s*(REFERENCES|BIBLIOGRAPHY|WORKS CITED|LITERATURE CITED)\s*\n'
-    match = re.search(ref_headers_pattern, full_text_content, re.IGNORECASE | re.DOTALL)
-
-    if match:
-        status_update_func(f"    Regex found potential reference section header: '{match.group(1)}'")
-        # Take text from after the header to the end of the document
-        potential_section_text = full_text_content[match.end():]
-        
-        # Optional: Try to find a common subsequent section header to limit the reference text
-        # next_section_match = re.search(r'\n\s*(APPENDIX|ACKNOWLEDGEMENTS)\s*\n', potential_section_text, re.IGNORECASE)
-        # if next_section_match:
-        #     reference_section_text_for_llm = potential_section_text[:next_section_match.start()]
-        #     status_update_func(f"    Reference section text truncated before '{next_section_match.group(1)}'.")
-        # else:
-        reference_section_text_for_llm = potential_section_text
-        status_update_func(f"    Using text from '{match.group(1)}' onwards for LLM title extraction.")
-    else:
-        status_update_func(f"    Regex did not find a clear reference section header. Using full text for LLM title extraction.")
-        reference_section_text_for_llm = full_text_content
+        # 1. Regex to attempt to isolate the reference section
+        reference_section_text_for_llm = ""
+        # Regex to find common reference section headers and capture text following them.
+        # This is a basic attempt; robustly finding the end of a reference section in plain text is hard.
+        # It looks for a header and then takes a substantial chunk of text, or up to a common next section.
+        # The file is memory-mapped and searched as bytes, so only the part sent to the LLM is decoded.
+        ref_headers_pattern = rb'\n\s*(REFERENCES|BIBLIOGRAPHY|WORKS CITED|LITERATURE CITED)\s*\n'
+        # Decode at most 4 bytes per character of the LLM limit applied below (UTF-8 worst case)
+        max_ref_bytes = 4 * REFERENCE_TEXT_TOKEN_BUDGET * ESTIMATED_CHARS_PER_TOKEN
+        try:
+            with open(txt_file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_text:
+                match = re.search(ref_headers_pattern, mapped_text, re.IGNORECASE | re.DOTALL)
+                # Read the match before the map is closed
+                header = match.group(1).decode('ascii') if match else None
+                section_start = match.end() if match else 0
+                reference_section_text_for_llm = mapped_text[section_start:section_start + max_ref_bytes].decode('utf-8', errors='ignore')
+        except Exception as e_read:
+            status_update_func(f"    Error reading text file {txt_file_path}: {e_read}")
+            return []
 
-    if not reference_section_text_for_llm.strip():
-        status_update_func(f"    No text (either section or full) to send to LLM for title extraction from '{paper_title_for_logging[:50]}...'.")
-        return []
+        if header:
+            status_update_func(f"    Regex found potential reference section header: '{header}'")
+            # Take text from after the header to the end of the document
+            status_update_func(f"    Using text from '{header}' onwards for LLM title extraction.")
+        else:
+            status_update_func(f"    Regex did not find a clear reference section header. Using full text for LLM title extraction.")
+
+        if not reference_section_text_for_llm.strip():
+            status_update_func(f"    No text (either section or full) to send to LLM for title extraction from '{paper_title_for_logging[:50]}...'.")
+            return []
 
-    uploaded_paper_file = None
     extracted_titles_from_llm = []
-    temp_ref_section_file_path = None # For temporary file
 
     try:
-        status_update_func(f"    Uploading reference section text (or full text) to LLM for title extraction from '{paper_title_for_logging[:50]}...'")
-        
-        # Limit the size of text sent to LLM to avoid excessive token usage for very long reference sections/papers
-        max_ref_text_len = 75000 # Approx 15k-20k tokens, adjust as needed
-        if len(reference_section_text_for_llm) > max_ref_text_len:
-            status_update_func(f"    Reference text for LLM is very long ({len(reference_section_text_for_llm)} chars), truncating to {max_ref_text_len} chars.")
-            reference_section_text_for_llm = reference_section_text_for_llm[:max_ref_text_len]
-
-        # Write the reference section text to a temporary file
-        with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".txt", encoding='utf-8') as tmp_f:
-            tmp_f.write(reference_section_text_for_llm)
-            temp_ref_section_file_path = tmp_f.name
-        
-        if not temp_ref_section_file_path:
-            status_update_func(f"    Could not create temporary file for reference section of '{paper_title_for_logging[:50]}...'.")
-            return []
-
-        uploaded_paper_file = genai.upload_file(
-            path=temp_ref_section_file_path, # Pass path to the temporary file
-            mime_type='text/plain',
-            display_name=f"ref_section_{os.path.basename(txt_file_path)}"
-        )
+        if uploaded_paper_file is None:
+            status_update_func(f"    Uploading reference section text (or full text) to LLM for title extraction from '{paper_title_for_logging[:50]}...'")
+            
+            # Limit the size of text sent to LLM to avoid excessive token usage for very long reference sections/papers
+            max_ref_text_len = REFERENCE_TEXT_TOKEN_BUDGET * ESTIMATED_CHARS_PER_TOKEN
+            if len(reference_section_text_for_llm) > max_ref_text_len:
+                status_update_func(f"    Reference text for LLM is very long ({len(reference_section_text_for_llm)} chars), truncating to {max_ref_text_len} chars.")
+                reference_section_text_for_llm = reference_section_text_for_llm[:max_ref_text_len]
+
+            uploaded_paper_file = gemini_uploads.upload_text(
+                reference_section_text_for_llm,
+                display_name=f"ref_section_{os.path.basename(txt_file_path)}"
+            )
 
         title_extraction_prompt = f"""
 From the provided text (uploaded file, which is believed to be a list of academic references or a full paper containing them), your task is to extract the titles of the cited works.
@@ -2923,7 +4594,7 @@ The Role of AI in Modern Education
 A Study on Machine Learning Algorithms for Healthcare
 Climate Change Impacts on Biodiversity
 """
-        llm_response_obj = summary_model.generate_content(
+        llm_response_obj = generate_with_rate_limit(
             [title_extraction_prompt, uploaded_paper_file],
             generation_config=genai.types.GenerationConfig(temperature=0.3) # Slightly higher temp for more creative extraction if needed
         )
@@ -2940,14 +4611,6 @@ Climate Change Impacts on Biodiversity
         status_update_func(f"    Error during LLM title extraction for '{paper_title_for_logging[:50]}...': {e}")
         # No explicit fallback to old regex parsing here, as the request is to use LLM for titles.
         # If LLM fails, we'll have an empty list of titles.
-    finally:
-        if uploaded_paper_file:
-            try:
-                genai.delete_file(uploaded_paper_file.name)
-            except Exception as delete_error:
-                print(f"{YELLOW}Warning: Could not delete uploaded file {uploaded_paper_file.name} in extract_references_from_paper_text: {delete_error}{RESET}")
-        if temp_ref_section_file_path and os.path.exists(temp_ref_section_file_path):
-            os.remove(temp_ref_section_file_path) # Delete the temporary file
 
 
     unique_references = []
@@ -2993,6 +4656,34 @@ def process_papers(
     """
     Main processing function for SLR generation, including fetching, summarization,
     snowballing, and iterative refinement.
+    Files uploaded to Gemini during the run are deleted in bulk when it ends.
+    """
+    try:
+        return _run_slr_pipeline(
+            natural_language_paper_goal, year_range, num_papers_to_fetch_per_iteration,
+            num_search_iterations, num_refinement_cycles, min_relevant_papers_target,
+            gemini_api_key, scopus_api_key, max_supplementary_iterations, status_update_callback
+        )
+    finally:
+        deleted_count = gemini_uploads.cleanup()
+        if deleted_count:
+            print(f"Deleted {deleted_count} files uploaded to Gemini during this run.")
+
+
+def _run_slr_pipeline(
+    natural_language_paper_goal: str,
+    year_range: Tuple[int, int],
+    num_papers_to_fetch_per_iteration: int,
+    num_search_iterations: int = 1,
+    num_refinement_cycles: int = 1,
+    min_relevant_papers_target: int = 5, # Target number of relevant papers
+    gemini_api_key: Optional[str] = None, # New parameter for Gemini API key
+    scopus_api_key: Optional[str] = None, # New parameter for Scopus API key
+    max_supplementary_iterations: int = 2, # How many extra fetch rounds if target not met
+    status_update_callback: Optional[Callable[[str], None]] = None,
+) -> Tuple[str, Optional[str], Optional[str]]: # Returns (status_or_final_slr_path, refinement_report_path, processing_summary_report_path)
+    """
+    Runs the SLR pipeline for process_papers (see there for the parameters and return value).
     """
     overall_start_time = datetime.now()
     phase_timings: Dict[str, timedelta] = {}
@@ -3046,6 +4737,7 @@ def process_papers(
     # Lists to store details of fetched papers for the report
     manual_papers_added_details: List[Dict[str, str]] = []
     all_snowballed_papers_added_details: List[Dict[str, str]] = []
+    relevance_assessments: List[Dict[str, any]] = [] # One record per relevance decision, for the processing report
 
     # PRISMA counts initialization
     counts_for_reporting = {
@@ -3054,6 +4746,7 @@ def process_papers(
         "NUMBER_RECORDS_IDENTIFIED_MANUAL": 0,
         "NUMBER_RECORDS_IDENTIFIED_SNOWBALL": 0, # New for snowballing
         "NUMBER_RECORDS_AFTER_DUPLICATES_REMOVED": 0, # Total unique items before summarization
+        "NUMBER_EXCLUDED_BY_ABSTRACT_PRESCREEN": 0, # Rejected on title + abstract before conversion/summarization
         "NUMBER_RECORDS_SCREENED_FOR_SUMMARIZATION": 0, # Items for which text was successfully extracted
         "NUMBER_SUMMARIES_GENERATED": 0,
         "NUMBER_EXCLUDED_BY_LLM_RELEVANCE_FILTER": 0, # Papers deemed not relevant by LLM
@@ -3090,7 +4783,7 @@ def process_papers(
             if current_query == INVALID_QUERY_FOR_ACADEMIC_SEARCH or not current_query.strip():
                 if current_query == LLM_API_CRITICAL_FAILURE_TOKEN: # Check for critical API failure from query gen
                     _update_status(f"{RED}CRITICAL: LLM API failure during ArXiv query generation. Aborting.{RESET}")
-                    processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+                    processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
                     return LLM_API_CRITICAL_FAILURE_TOKEN, None, processing_summary_report_path
 
 
@@ -3113,7 +4806,8 @@ def process_papers(
                 newly_fetched_meta_arxiv, fetched_count_arxiv, fetch_status_arxiv = fetch_arxiv_papers(
                     current_query, year_range, 
                     num_to_request_this_call_arxiv,
-                    pdf_folder, globally_fetched_primary_ids
+                    pdf_folder, globally_fetched_primary_ids,
+                    download_pdfs=not LAZY_PDF_DOWNLOAD
                 )
                 _update_status(f"      ArXiv: {fetch_status_arxiv}")
                 fetched_this_sub_attempt_arxiv = fetched_count_arxiv # Count of *newly added*
@@ -3142,7 +4836,8 @@ def process_papers(
                         num_to_request_this_call_scopus,
                         pdf_folder, txt_papers_folder_path, 
                         globally_fetched_primary_ids,
-                        scopus_api_key # Pass the key
+                        scopus_api_key, # Pass the key
+                        download_pdfs=not LAZY_PDF_DOWNLOAD
                     )
                     _update_status(f"      Scopus: {fetch_status_scopus}")
                     fetched_this_sub_attempt_scopus = fetched_count_scopus
@@ -3217,7 +4912,8 @@ def process_papers(
         try:
             newly_fetched_meta_arxiv_fb, fetched_count_arxiv_fb, fetch_status_arxiv_fb = fetch_arxiv_papers(
                 fallback_query_direct, year_range, num_papers_to_fetch_per_iteration * 2, # Fetch more on fallback
-                pdf_folder, globally_fetched_primary_ids
+                pdf_folder, globally_fetched_primary_ids,
+                download_pdfs=not LAZY_PDF_DOWNLOAD
             )
             _update_status(f"    ArXiv (Fallback): {fetch_status_arxiv_fb}")
             counts_for_reporting["NUMBER_RECORDS_IDENTIFIED_ARXIV"] += fetched_count_arxiv_fb
@@ -3241,7 +4937,8 @@ def process_papers(
             try:
                 newly_fetched_meta_scopus_fb, fetched_count_scopus_fb, fetch_status_scopus_fb = fetch_scopus_papers_and_process(
                     fallback_query_direct, year_range, num_papers_to_fetch_per_iteration * 2,
-                    pdf_folder, txt_papers_folder_path, globally_fetched_primary_ids, scopus_api_key
+                    pdf_folder, txt_papers_folder_path, globally_fetched_primary_ids, scopus_api_key,
+                    download_pdfs=not LAZY_PDF_DOWNLOAD
                 )
                 _update_status(f"    Scopus (Fallback): {fetch_status_scopus_fb}")
                 counts_for_reporting["NUMBER_RECORDS_IDENTIFIED_SCOPUS"] += fetched_count_scopus_fb
@@ -3271,14 +4968,14 @@ def process_papers(
 
         # Check if this manual PDF (by its generated ID) is already in the global set
         if manual_primary_id not in globally_fetched_primary_ids:
-            manual_meta = {
-                'source': 'manual', 'id_primary': manual_primary_id,
-                'title': base_name_manual.replace('_', ' '),
-                'authors': ['N/A (Manual Upload)'], 'published_year': 'N/A',
-                'abstract_api': 'N/A (Manual Upload)', 'doi': '', 'scopus_id': '',
-                'local_pdf_path': os.path.join(pdf_folder, pdf_file_manual),
-                'local_txt_path': os.path.join(txt_papers_folder_path, f"{sanitized_manual_filename_id}.txt") # Use sanitized name for txt
-            }
+            manual_meta = Paper(
+                source='manual', id_primary=manual_primary_id,
+                title=base_name_manual.replace('_', ' '),
+                authors=['N/A (Manual Upload)'], published_year=None,
+                abstract_api='N/A (Manual Upload)', doi='', scopus_id='',
+                local_pdf_path=os.path.join(pdf_folder, pdf_file_manual),
+                local_txt_path=os.path.join(txt_papers_folder_path, f"{sanitized_manual_filename_id}.txt") # Use sanitized name for txt
+            )
             # Check if a paper with the same title (from API) might exist to avoid true duplicates
             # This is a heuristic. A better check would involve DOI or more sophisticated title matching.
             is_potential_api_duplicate = any(
@@ -3300,49 +4997,80 @@ def process_papers(
     if not cumulative_fetched_paper_metadata:
         _update_status(f"{RED}CRITICAL: No papers found from any source (ArXiv, Scopus, Manual). Aborting.{RESET}")
         last_query_info = all_angles_and_queries[-1][1] if all_angles_and_queries else "NO_PAPERS_UPLOADED_OR_FETCHED"
-        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
         return f"PROCESS_INCOMPLETE_LAST_QUERY_INFO:{last_query_info}", None, processing_summary_report_path
 
     counts_for_reporting["NUMBER_RECORDS_AFTER_DUPLICATES_REMOVED"] = len(cumulative_fetched_paper_metadata)
     _update_status(f"Total unique papers identified for processing: {len(cumulative_fetched_paper_metadata)}")
 
+    def _apply_abstract_prescreen(papers_metadata: List[Dict[str, any]], phase_label: str) -> List[Dict[str, any]]:
+        """Runs prescreen_papers_by_abstract and records its decisions for the processing report."""
+        if not PRESCREEN_ENABLED or not papers_metadata:
+            return papers_metadata
+        kept, rejected = prescreen_papers_by_abstract(natural_language_paper_goal, papers_metadata)
+        rejected_ids = {id(meta) for meta in rejected}
+        for meta in papers_metadata:
+            if 'prescreen_score' in meta:
+                relevance_assessments.append({
+                    'title': meta.get('title', 'Unknown Paper'), 'phase': phase_label,
+                    'included': id(meta) not in rejected_ids, 'relevance_score': meta['prescreen_score'],
+                    'relevance_label': None, 'relevance_reason': f"abstract pre-screen ({meta['prescreen_method']})"
+                })
+        for meta in rejected:
+            _update_status(f"    EXCLUDED by abstract pre-screen ({meta['prescreen_method']}, score {meta['prescreen_score']:.2f}): '{meta.get('title', 'N/A')[:60]}...'")
+        counts_for_reporting["NUMBER_EXCLUDED_BY_ABSTRACT_PRESCREEN"] += len(rejected)
+        _update_status(f"  Abstract pre-screen ({phase_label}): kept {len(kept)} of {len(papers_metadata)} papers.")
+        return kept
+
+    # --- Phase 1.5: Abstract Pre-screen ---
+    phase_start_time_prescreen = datetime.now()
+    cumulative_fetched_paper_metadata = _apply_abstract_prescreen(cumulative_fetched_paper_metadata, "Abstract pre-screen (Initial)")
+    phase_timings['Abstract Pre-screen'] = datetime.now() - phase_start_time_prescreen
+    if LAZY_PDF_DOWNLOAD and cumulative_fetched_paper_metadata:
+        phase_start_time_pdf_download = datetime.now()
+        _update_status(f"Downloading PDFs for {len(cumulative_fetched_paper_metadata)} screened-in papers...")
+        cumulative_fetched_paper_metadata = download_paper_pdfs(cumulative_fetched_paper_metadata, globally_fetched_primary_ids)
+        download_scopus_paper_pdfs(cumulative_fetched_paper_metadata, pdf_folder, txt_papers_folder_path, scopus_api_key)
+        phase_timings['PDF Download (screened-in papers)'] = datetime.now() - phase_start_time_pdf_download
+    if not cumulative_fetched_paper_metadata:
+        _update_status(f"{RED}CRITICAL: No papers passed the abstract pre-screen or could be downloaded. Aborting.{RESET}")
+        last_query_info = all_angles_and_queries[-1][1] if all_angles_and_queries else "NO_PAPERS_UPLOADED_OR_FETCHED"
+        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
+        return f"PROCESS_INCOMPLETE_LAST_QUERY_INFO:{last_query_info}", None, processing_summary_report_path
+
 
     # --- Phase 2: PDF-to-Text Conversion ---
     phase_start_time_pdf_to_text = datetime.now()
     _update_status("Phase 2: PDF-to-Text Conversion...")
     try:
-        conversion_status = batch_convert_pdfs_to_text(pdf_folder, txt_papers_folder_path)
-        _update_status(f"  {conversion_status}")
+        initial_text_paths = convert_papers_to_text(cumulative_fetched_paper_metadata, txt_papers_folder_path)
+        _update_status(f"  Text available for {sum(1 for t in initial_text_paths if t)} out of {len(initial_text_paths)} papers.")
         phase_timings['PDF-to-Text Conversion'] = datetime.now() - phase_start_time_pdf_to_text
     except Exception as e_pdf_text:
         _update_status(f"  {RED}Error during PDF-to-text conversion: {e_pdf_text}{RESET}")
         return NO_TEXT_FILES_GENERATED, None
 
     papers_to_summarize_details_initial = []
-    for paper_meta in cumulative_fetched_paper_metadata:
-        txt_path = paper_meta.get('local_txt_path')
-        if txt_path and os.path.exists(txt_path) and os.path.getsize(txt_path) > 0:
+    for paper_meta, txt_path in zip(cumulative_fetched_paper_metadata, initial_text_paths):
+        if txt_path:
+            paper_meta['local_txt_path'] = txt_path
             try:
-                with open(txt_path, 'r', encoding='utf-8') as f_text:
-                    text_content = f_text.read()
-                if text_content.strip():
-                    paper_detail = {
-                        'filename': os.path.basename(txt_path),
-                        'text': text_content,
-                        **paper_meta
-                    }
+                # Summarization works from the file; the text itself is only read on demand (Paper['text'])
+                if text_file_has_content(txt_path):
+                    paper_detail = Paper.from_mapping(paper_meta)
+                    paper_detail['filename'] = os.path.basename(txt_path)
                     papers_to_summarize_details_initial.append(paper_detail)
                 else:
                     _update_status(f"    Skipping empty text file: {txt_path}")
             except Exception as e_read_txt:
                 _update_status(f"    {RED}Error reading text file {txt_path}: {e_read_txt}{RESET}")
         else:
-            _update_status(f"    Skipping paper '{paper_meta.get('title', 'N/A')[:50]}...': Text file missing or empty at {txt_path}")
+            _update_status(f"    Skipping paper '{paper_meta.get('title', 'N/A')[:50]}...': Text file missing or empty at {paper_meta.get('local_txt_path')}")
 
     counts_for_reporting["NUMBER_RECORDS_SCREENED_FOR_SUMMARIZATION"] = len(papers_to_summarize_details_initial)
     if not papers_to_summarize_details_initial:
         _update_status(f"{RED}CRITICAL: No papers could be prepared for summarization (no valid text files). Aborting.{RESET}")
-        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
         return COULD_NOT_READ_RELEVANT_PAPERS, None, processing_summary_report_path
 
     # --- Phase 3: Summarization & Initial Relevance Filtering ---
@@ -3356,12 +5084,12 @@ def process_papers(
         )
         if isinstance(initial_papers_with_summaries, str) and initial_papers_with_summaries == LLM_API_CRITICAL_FAILURE_TOKEN:
             _update_status(f"{RED}CRITICAL: All paper summarizations failed due to LLM API errors. Aborting.{RESET}")
-            processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+            processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
             return LLM_API_CRITICAL_FAILURE_TOKEN, None, processing_summary_report_path
 
     except Exception as e_summarize:
         _update_status(f"  {RED}Error during initial summarization: {e_summarize}{RESET}")
-        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
         return NO_SUMMARIES_GENERATED, None, processing_summary_report_path
 
     # Ensure initial_papers_with_summaries is a list before proceeding
@@ -3372,9 +5100,9 @@ def process_papers(
         summary_text = paper_info_with_summary.get('summary_text', '')
         title_for_log = paper_info_with_summary.get('title', paper_info_with_summary.get('filename', 'Unknown Paper'))
 
-        if summary_text and not summary_text.startswith(LLM_ERROR_PREFIXES) and \
-           "Error summarizing paper" not in summary_text and \
-           "This paper does not appear to be relevant" not in summary_text.lower():
+        is_relevant = paper_judged_relevant(paper_info_with_summary)
+        relevance_assessments.append(relevance_assessment_record(paper_info_with_summary, "Initial", is_relevant))
+        if is_relevant:
             llm_confirmed_relevant_papers.append(paper_info_with_summary)
             _update_status(f"    RELEVANT (Initial): '{title_for_log[:60]}...'")
         else:
@@ -3418,19 +5146,25 @@ def process_papers(
                 source_title = source_paper_meta.get('title', 'Unknown Source Paper')
                 _update_status(f"    Processing source paper {source_paper_idx+1}/{len(current_snowball_source_papers)} for references: '{source_title[:50]}...'")
                 
-                source_text_path = source_paper_meta.get('local_txt_path')
-                if not source_text_path or not os.path.exists(source_text_path):
-                    _update_status(f"      Skipping snowballing from '{source_title[:50]}...': Text file not found at {source_text_path}")
-                    continue
-                
-                extracted_references = []
-                try:
-                    # Pass the _update_status function to extract_references_from_paper_text
-                    # The function now takes txt_file_path directly
-                    extracted_references = extract_references_from_paper_text(source_text_path, source_title, _update_status)
-                except Exception as e_extract_ref:
-                    _update_status(f"      Error extracting references from '{source_title[:50]}...': {e_extract_ref}")
-                    continue
+                # References returned by the combined analysis during summarization need no further LLM call
+                extracted_references = source_paper_meta.get('extracted_references')
+                if extracted_references is not None:
+                    _update_status(f"      Using {len(extracted_references)} references from the combined analysis of '{source_title[:50]}...'")
+                else:
+                    source_text_path = source_paper_meta.get('local_txt_path')
+                    if not source_text_path or not os.path.exists(source_text_path):
+                        _update_status(f"      Skipping snowballing from '{source_title[:50]}...': Text file not found at {source_text_path}")
+                        continue
+
+                    try:
+                        # Pass the _update_status function to extract_references_from_paper_text
+                        # The function now takes txt_file_path directly
+                        extracted_references = extract_references_from_paper_text(
+                            source_text_path, source_title, _update_status, pdf_path=source_paper_meta.get('local_pdf_path')
+                        )
+                    except Exception as e_extract_ref:
+                        _update_status(f"      Error extracting references from '{source_title[:50]}...': {e_extract_ref}")
+                        continue
 
                 if not extracted_references:
                     _update_status(f"      No references extracted from '{source_title[:50]}...'")
@@ -3459,7 +5193,8 @@ def process_papers(
                         arxiv_results_meta, arxiv_fetched_count, arxiv_status_msg = fetch_arxiv_papers(
                             search_query_str=ref_title_to_search, # Use raw title for search
                             year_range=year_range, num_papers=1, # Aim for 1 specific paper
-                            pdf_folder=pdf_folder, already_fetched_primary_ids=globally_fetched_primary_ids
+                            pdf_folder=pdf_folder, already_fetched_primary_ids=globally_fetched_primary_ids,
+                            download_pdfs=not LAZY_PDF_DOWNLOAD
                         )
                         _update_status(f"          ArXiv search for '{ref_title_to_search[:50]}...': {arxiv_status_msg}")
                         if arxiv_results_meta: # arxiv_results_meta is a list of dicts
@@ -3504,27 +5239,31 @@ def process_papers(
             # Process newly found papers from this snowball iteration
             if newly_found_metadata_this_iteration:
                 _update_status(f"    Found {len(newly_found_metadata_this_iteration)} potential new papers in snowball iteration {sb_iteration + 1}.")
-                
-                # Convert PDFs to text for these new papers
-                # batch_convert_pdfs_to_text works on the entire pdf_folder, so new ones will be picked up.
-                conversion_status_snow = batch_convert_pdfs_to_text(pdf_folder, txt_papers_folder_path)
-                _update_status(f"      PDF-to-Text for snowballed papers: {conversion_status_snow}")
+
+                newly_found_metadata_this_iteration = _apply_abstract_prescreen(newly_found_metadata_this_iteration, "Abstract pre-screen (Snowball)")
+                if LAZY_PDF_DOWNLOAD:
+                    newly_found_metadata_this_iteration = download_paper_pdfs(newly_found_metadata_this_iteration, globally_fetched_primary_ids)
+                if not newly_found_metadata_this_iteration:
+                    _update_status(f"    No snowballed papers passed the abstract pre-screen or could be downloaded in iteration {sb_iteration + 1}.")
+
+                # Convert PDFs to text for these new papers only
+                snow_text_paths = convert_papers_to_text(newly_found_metadata_this_iteration, txt_papers_folder_path)
+                _update_status(f"      PDF-to-Text for snowballed papers: text available for {sum(1 for t in snow_text_paths if t)} out of {len(snow_text_paths)}.")
 
                 snowball_papers_to_summarize_and_filter = []
-                for meta_snow in newly_found_metadata_this_iteration:
-                    txt_path_snow = meta_snow.get('local_txt_path')
-                    if txt_path_snow and os.path.exists(txt_path_snow) and os.path.getsize(txt_path_snow) > 0:
+                for meta_snow, txt_path_snow in zip(newly_found_metadata_this_iteration, snow_text_paths):
+                    if txt_path_snow:
+                        meta_snow['local_txt_path'] = txt_path_snow
                         try:
-                            with open(txt_path_snow, 'r', encoding='utf-8') as f_snow_txt:
-                                text_content_snow = f_snow_txt.read()
-                            if text_content_snow.strip():
-                                # Prepare detail dict for batch_summarize_papers
-                                paper_detail_for_summary = {'filename': os.path.basename(txt_path_snow), 'text': text_content_snow, **meta_snow}
+                            if text_file_has_content(txt_path_snow):
+                                # Prepare detail record for batch_summarize_papers
+                                paper_detail_for_summary = Paper.from_mapping(meta_snow)
+                                paper_detail_for_summary['filename'] = os.path.basename(txt_path_snow)
                                 snowball_papers_to_summarize_and_filter.append(paper_detail_for_summary)
                         except Exception as e_read_snow_txt:
                             _update_status(f"        Error reading text file for snowballed paper {txt_path_snow}: {e_read_snow_txt}")
                     else:
-                         _update_status(f"        Text file missing or empty for snowballed paper: {meta_snow.get('title', 'Unknown')[:50]} at {txt_path_snow}")
+                         _update_status(f"        Text file missing or empty for snowballed paper: {meta_snow.get('title', 'Unknown')[:50]} at {meta_snow.get('local_txt_path')}")
                 
                 if snowball_papers_to_summarize_and_filter:
                     _update_status(f"      Summarizing and filtering {len(snowball_papers_to_summarize_and_filter)} new snowballed papers...")
@@ -3547,7 +5286,9 @@ def process_papers(
                         title_snow_log = paper_info_snow_processed.get('title', paper_info_snow_processed.get('filename', 'Unknown Snowballed Paper'))
                         
                         # LLM relevance check based on summary content
-                        if summary_text_snow and "Error summarizing paper" not in summary_text_snow and "This paper does not appear to be relevant" not in summary_text_snow.lower():
+                        is_relevant = paper_judged_relevant(paper_info_snow_processed)
+                        relevance_assessments.append(relevance_assessment_record(paper_info_snow_processed, "Snowball", is_relevant))
+                        if is_relevant:
                             # Check if this paper (by primary ID) is already in the confirmed list
                             is_already_confirmed = any(p.get('id_primary') == paper_info_snow_processed.get('id_primary') for p in llm_confirmed_relevant_papers)
                             if not is_already_confirmed:
@@ -3610,7 +5351,7 @@ def process_papers(
             current_supplementary_fetch_detail["angle"] = supp_angle
             if supp_query == LLM_API_CRITICAL_FAILURE_TOKEN:
                 _update_status(f"{RED}CRITICAL: LLM API failure during supplementary query generation. Aborting.{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
                 return LLM_API_CRITICAL_FAILURE_TOKEN, None, processing_summary_report_path
 
             current_supplementary_fetch_detail["query"] = supp_query
@@ -3625,7 +5366,8 @@ def process_papers(
         current_supplementary_batch_metadata: List[Dict[str, any]] = []
         try:
             newly_fetched_meta_supp_arxiv, fetched_count_supp_arxiv, supp_fetch_status_arxiv = fetch_arxiv_papers(
-                supp_query, year_range, num_to_fetch_supp, pdf_folder, globally_fetched_primary_ids
+                supp_query, year_range, num_to_fetch_supp, pdf_folder, globally_fetched_primary_ids,
+                download_pdfs=not LAZY_PDF_DOWNLOAD
             )
             _update_status(f"  ArXiv Supplementary: {supp_fetch_status_arxiv}")
             counts_for_reporting["NUMBER_RECORDS_IDENTIFIED_ARXIV"] += fetched_count_supp_arxiv
@@ -3648,7 +5390,8 @@ def process_papers(
             current_scopus_supp_titles = []
             try:
                 newly_fetched_meta_supp_scopus, fetched_count_supp_scopus, supp_fetch_status_scopus = fetch_scopus_papers_and_process(
-                    supp_query, year_range, num_to_fetch_supp, pdf_folder, txt_papers_folder_path, globally_fetched_primary_ids, scopus_api_key
+                    supp_query, year_range, num_to_fetch_supp, pdf_folder, txt_papers_folder_path, globally_fetched_primary_ids, scopus_api_key,
+                    download_pdfs=not LAZY_PDF_DOWNLOAD
                 )
                 _update_status(f"  Scopus Supplementary: {supp_fetch_status_scopus}")
                 counts_for_reporting["NUMBER_RECORDS_IDENTIFIED_SCOPUS"] += fetched_count_supp_scopus
@@ -3670,23 +5413,30 @@ def process_papers(
             _update_status("  No new supplementary papers found in this iteration.")
             continue
 
-        conversion_status_supp = batch_convert_pdfs_to_text(pdf_folder, txt_papers_folder_path)
-        _update_status(f"    PDF-to-Text for supplementary papers: {conversion_status_supp}")
+        current_supplementary_batch_metadata = _apply_abstract_prescreen(current_supplementary_batch_metadata, "Abstract pre-screen (Supplementary)")
+        if LAZY_PDF_DOWNLOAD:
+            current_supplementary_batch_metadata = download_paper_pdfs(current_supplementary_batch_metadata, globally_fetched_primary_ids)
+            download_scopus_paper_pdfs(current_supplementary_batch_metadata, pdf_folder, txt_papers_folder_path, scopus_api_key)
+        if not current_supplementary_batch_metadata:
+            _update_status("  No supplementary papers passed the abstract pre-screen or could be downloaded in this iteration.")
+            continue
+
+        supp_text_paths = convert_papers_to_text(current_supplementary_batch_metadata, txt_papers_folder_path)
+        _update_status(f"    PDF-to-Text for supplementary papers: text available for {sum(1 for t in supp_text_paths if t)} out of {len(supp_text_paths)}.")
 
         papers_to_summarize_details_supp = []
-        for meta_item_supp in current_supplementary_batch_metadata:
-            txt_path_supp = meta_item_supp.get('local_txt_path')
-            if txt_path_supp and os.path.exists(txt_path_supp) and os.path.getsize(txt_path_supp) > 0:
+        for meta_item_supp, txt_path_supp in zip(current_supplementary_batch_metadata, supp_text_paths):
+            if txt_path_supp:
+                meta_item_supp['local_txt_path'] = txt_path_supp
                 try:
-                    with open(txt_path_supp, 'r', encoding='utf-8') as f_supp_txt:
-                        text_content_supp = f_supp_txt.read()
-                    if text_content_supp.strip():
-                        paper_detail_supp = {'filename': os.path.basename(txt_path_supp), 'text': text_content_supp, **meta_item_supp}
+                    if text_file_has_content(txt_path_supp):
+                        paper_detail_supp = Paper.from_mapping(meta_item_supp)
+                        paper_detail_supp['filename'] = os.path.basename(txt_path_supp)
                         papers_to_summarize_details_supp.append(paper_detail_supp)
                 except Exception as e_read_txt_supp:
                      _update_status(f"      {RED}Error reading text file for supplementary paper {txt_path_supp}: {e_read_txt_supp}{RESET}")
             else:
-                _update_status(f"      Text file missing or empty for supplementary paper: {meta_item_supp.get('title', 'Unknown')[:50]} at {txt_path_supp}")
+                _update_status(f"      Text file missing or empty for supplementary paper: {meta_item_supp.get('title', 'Unknown')[:50]} at {meta_item_supp.get('local_txt_path')}")
 
 
         if not papers_to_summarize_details_supp:
@@ -3707,8 +5457,9 @@ def process_papers(
         for paper_info_supp_processed in supplementary_papers_with_summaries:
             summary_text_supp = paper_info_supp_processed.get('summary_text', '')            
             title_for_log_supp = paper_info_supp_processed.get('title', paper_info_supp_processed.get('filename', 'Unknown Supp. Paper'))
-            if summary_text_supp and "Error summarizing paper" not in summary_text_supp and \
-               "This paper does not appear to be relevant" not in summary_text_supp.lower():
+            is_relevant = paper_judged_relevant(paper_info_supp_processed)
+            relevance_assessments.append(relevance_assessment_record(paper_info_supp_processed, "Supplementary", is_relevant))
+            if is_relevant:
                 if not any(p.get('id_primary') == paper_info_supp_processed.get('id_primary') for p in llm_confirmed_relevant_papers):
                     llm_confirmed_relevant_papers.append(paper_info_supp_processed)
                     newly_confirmed_supp_count +=1
@@ -3730,37 +5481,54 @@ def process_papers(
         _update_status(f"{RED}CRITICAL: No papers passed relevance filter after all fetching and snowballing attempts. Aborting.{RESET}")
         last_query_info = all_queries_ever_used_for_supplementary[-1][1] if all_queries_ever_used_for_supplementary else \
                           (all_angles_and_queries[-1][1] if all_angles_and_queries else "NO_QUERY_ATTEMPTED")
-        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
         return f"PROCESS_INCOMPLETE_LAST_QUERY_INFO:{last_query_info}", None, processing_summary_report_path
     
     _update_status(f"Total LLM-confirmed relevant papers for SLR: {len(llm_confirmed_relevant_papers)}")
 
     # --- Phase 4: Final SLR Document Preparation ---
     _update_status("Phase 4: Preparing for Final SLR Document Generation...")
+    papers_for_sections = [p for p in llm_confirmed_relevant_papers if paper_judged_relevant(p)]
     final_summaries_text_for_sections = "\n\n---\n\n".join(
-        [p['summary_text'] for p in llm_confirmed_relevant_papers if p.get('summary_text') and \
-         "This paper does not appear to be relevant" not in p['summary_text'].lower() and \
-         "Error summarizing paper" not in p['summary_text']]
+        [p['summary_text'] for p in papers_for_sections]
     ).strip()
 
     if not final_summaries_text_for_sections: # Corrected variable name here
         _update_status(f"{RED}CRITICAL: No valid summaries available from relevant papers for SLR generation. Aborting.{RESET}")
-        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+        processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
         return NO_SUMMARIES_GENERATED, None, processing_summary_report_path
 
-    final_metadata_for_biblio = [
-        {k: v for k, v in p.items() if k not in ['text', 'summary_text', 'summary_filepath', 'llm_relevance_judgment', 'llm_relevance_reason', 'score']}
-        for p in llm_confirmed_relevant_papers
-    ]
+    # create_bibliometric reads only the bibliographic fields, so the Paper records are passed as they are
+    final_metadata_for_biblio = llm_confirmed_relevant_papers
+
+    section_summaries: Dict[str, str] = {}
+    if MAP_REDUCE_SYNTHESIS_ENABLED and len(papers_for_sections) >= MAP_REDUCE_MIN_PAPERS:
+        # Large reviews: every section reduces the same thematic partial syntheses
+        phase_start_time_synthesis = datetime.now()
+        _update_status(f"Synthesizing {len(papers_for_sections)} summaries in thematic clusters (map-reduce)...")
+        synthesized_summaries = map_reduce_summary_synthesis([p['summary_text'] for p in papers_for_sections], natural_language_paper_goal)
+        phase_timings['Map-Reduce Summary Synthesis'] = datetime.now() - phase_start_time_synthesis
+        if synthesized_summaries.startswith(LLM_ERROR_PREFIXES):
+            _update_status(f"  {YELLOW}Summary synthesis failed ({synthesized_summaries[:100]}). Falling back to packed summaries.{RESET}")
+        else:
+            section_summaries = {section_key: synthesized_summaries for section_key in SECTION_CONTEXT_FOCUS}
+
+    # Otherwise each section prompt gets the summaries that fit SECTION_SUMMARIES_TOKEN_BUDGET, best-ranked first
+    if not section_summaries:
+        for section_key, section_focus in SECTION_CONTEXT_FOCUS.items():
+            section_summaries[section_key], dropped_papers = pack_summaries_for_section(papers_for_sections, natural_language_paper_goal, section_focus)
+            if dropped_papers:
+                dropped_titles = ", ".join(f"'{(p.get('title') or 'Unknown')[:40]}'" for p in dropped_papers[:5])
+                _update_status(f"  {YELLOW}{section_key}: {len(dropped_papers)} of {len(papers_for_sections)} summaries exceed the {SECTION_SUMMARIES_TOKEN_BUDGET}-token budget and are left out ({dropped_titles}{', ...' if len(dropped_papers) > 5 else ''}).{RESET}")
 
     phase_start_time_outline_gen = datetime.now()
     _update_status("Generating SLR Outline...")
     slr_outline = "% No SLR outline generated."
     try:
-        slr_outline_content = generate_slr_outline(natural_language_paper_goal, final_summaries_text_for_sections, natural_language_paper_goal)
+        slr_outline_content = generate_slr_outline(natural_language_paper_goal, section_summaries["Outline"], natural_language_paper_goal)
         if slr_outline_content.startswith(LLM_ERROR_PREFIXES):
             _update_status(f"{RED}CRITICAL: LLM API error during SLR Outline generation: {slr_outline_content}{RESET}")
-            processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+            processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
             return LLM_API_CRITICAL_FAILURE_TOKEN, None, processing_summary_report_path
         if slr_outline_content and not slr_outline_content.startswith(("% Error", "% No relevant")):
             slr_outline = slr_outline_content
@@ -3779,10 +5547,10 @@ def process_papers(
     _update_status("Generating Bibliometric Analysis (biblio.bib)...")
     bibliometric_content = "% No BibTeX content generated."
     try:
-        bib_content = create_bibliometric(final_metadata_for_biblio, final_summaries_text_for_sections)
+        bib_content = create_bibliometric(final_metadata_for_biblio, section_summaries["Bibliography"])
         if bib_content.startswith(LLM_ERROR_PREFIXES):
             _update_status(f"{RED}CRITICAL: LLM API error during BibTeX generation: {bib_content}{RESET}")
-            processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+            processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
             return LLM_API_CRITICAL_FAILURE_TOKEN, None, processing_summary_report_path
         if bib_content and not bib_content.startswith("% Error"):
             bibliometric_content = bib_content
@@ -3819,10 +5587,11 @@ def process_papers(
         style_paper_text_path = oldest_paper_for_style.get('local_txt_path')
         if style_paper_text_path and os.path.exists(style_paper_text_path):
             try:
+                max_style_text_len = 10000
+                # One character past the limit is enough to know the text must be truncated
                 with open(style_paper_text_path, 'r', encoding='utf-8') as f_style_oldest:
-                    oldest_paper_text_for_style = f_style_oldest.read()
+                    oldest_paper_text_for_style = f_style_oldest.read(max_style_text_len + 1)
                 
-                max_style_text_len = 10000
                 if len(oldest_paper_text_for_style) > max_style_text_len:
                     oldest_paper_text_for_style = oldest_paper_text_for_style[:max_style_text_len] + "\n[...text truncated for style example...]"
                     _update_status(f"  Truncated oldest paper text (from '{oldest_paper_for_style.get('title', 'Unknown')[:30]}...') for style inspiration.")
@@ -3837,6 +5606,17 @@ def process_papers(
         _update_status("  No relevant papers to pick for stylistic inspiration.")
 
     final_counts_for_placeholders = counts_for_reporting.copy()
+    # Section step -> (inputs fingerprint, output) from earlier cycles, for incremental refinement
+    section_reuse_cache: Optional[Dict[str, Tuple[str, str]]] = {} if INCREMENTAL_REFINEMENT else None
+    # Critique keys (see parse_critique) -> the step that regenerates that section
+    section_feedback_steps = {
+        "Related Works": 'Related Works Generation',
+        "Research Methods": 'Research Methods Generation',
+        "Background": 'Background Generation',
+        "Review Findings": 'Review Findings Generation',
+        "Discussion_Conclusion": 'Discussion & Conclusion Generation',
+        "Abstract_Intro_Keywords": 'Abstract, Keywords & Introduction Generation',
+    }
 
     for iteration in range(num_refinement_cycles + 1):
         _update_status(f"SLR DOCUMENT GENERATION CYCLE {iteration}/{num_refinement_cycles}")
@@ -3864,136 +5644,126 @@ def process_papers(
             discussion_conclusion_base_filename = "discussion_conclusion.tex"
             abstract_intro_keywords_base_filename = "abstract_intro_keywords.tex"
             
-            # Related Works
+            def _finish_section(section_tex: str) -> str:
+                if section_tex.startswith(LLM_ERROR_PREFIXES):
+                    return section_tex
+                return replace_placeholders_in_latex(section_tex, final_counts_for_placeholders)
+
+            def _related_works_step(inputs: Dict[str, str]) -> str:
+                return _finish_section(create_related_works(
+                    section_summaries["Related Works"], natural_language_paper_goal, bibliometric_content,
+                    reviewer_suggestions=get_suggestions_for_section("Related Works") if iteration > 0 else "",
+                    slr_outline=slr_outline,
+                    human_style_example_text=oldest_paper_text_for_style
+                ))
+
+            def _research_methods_step(inputs: Dict[str, str]) -> str:
+                return _finish_section(create_reshearch_methodes(
+                    related_works_content=inputs['Related Works Charting'],
+                    summaries=section_summaries["Research Methods"],
+                    subject=natural_language_paper_goal,
+                    Biblio_content=bibliometric_content,
+                    year_range_for_prompt=year_range,
+                    reviewer_suggestions=get_suggestions_for_section("Research Methods") if iteration > 0 else "",
+                    slr_outline=slr_outline,
+                    human_style_example_text=oldest_paper_text_for_style
+                ))
+
+            def _background_step(inputs: Dict[str, str]) -> str:
+                return _finish_section(create_background_string(
+                    "", inputs['Related Works Charting'], inputs['Research Methods Charting'], "",
+                    bibliometric_content,
+                    reviewer_suggestions=get_suggestions_for_section("Background") if iteration > 0 else "",
+                    slr_outline=slr_outline,
+                    human_style_example_text=oldest_paper_text_for_style
+                ))
+
+            def _review_findings_step(inputs: Dict[str, str]) -> str:
+                return _finish_section(create_review_findings(
+                    inputs['Research Methods Charting'], section_summaries["Review Findings"], natural_language_paper_goal, bibliometric_content,
+                    reviewer_suggestions=get_suggestions_for_section("Review Findings") if iteration > 0 else "",
+                    slr_outline=slr_outline,
+                    human_style_example_text=oldest_paper_text_for_style
+                ))
+
+            def _discussion_conclusion_step(inputs: Dict[str, str]) -> str:
+                return _finish_section(create_discussion_conclusion(
+                    inputs['Review Findings Charting'], section_summaries["Discussion_Conclusion"], natural_language_paper_goal, bibliometric_content,
+                    reviewer_suggestions=get_suggestions_for_section("Discussion_Conclusion") if iteration > 0 else "",
+                    slr_outline=slr_outline,
+                    human_style_example_text=oldest_paper_text_for_style
+                ))
+
+            def _abstract_intro_step(inputs: Dict[str, str]) -> str:
+                return _finish_section(create_abstract_intro(
+                    review_findings_content=inputs['Review Findings Charting'],
+                    related_works_content=inputs['Related Works Charting'],
+                    research_methodes_content=inputs['Research Methods Charting'],
+                    discussion_conclusion_content=inputs['Discussion & Conclusion Generation'],
+                    subject=natural_language_paper_goal,
+                    Biblio_content=bibliometric_content,
+                    reviewer_suggestions=get_suggestions_for_section("Abstract_Intro_Keywords") if iteration > 0 else "",
+                    slr_outline=slr_outline,
+                    human_style_example_text=oldest_paper_text_for_style
+                ))
+
+            def _report_section_step_start(step_name: str) -> None:
+                # Runs on this thread: status callbacks (e.g. Streamlit) cannot be used from section workers
+                if step_name.endswith(' Generation'):
+                    _update_status(f"    Generating {step_name[:-len(' Generation')]}...")
+
+            def _charts_step(base_filename: str, chart_label: str) -> Callable[[Dict[str, str]], str]:
+                # create_charts reads the section file the generator just saved
+                return lambda inputs: create_charts(os.path.join(results_folder_path, base_filename), f"{chart_label}_Iter{iteration}")
+
+            # Each step lists the steps whose output it takes; Background runs alongside
+            # Review Findings -> Discussion & Conclusion once Research Methods is charted.
+            section_steps = {
+                'Related Works Generation': ((), _related_works_step),
+                'Related Works Charting': (('Related Works Generation',), _charts_step(related_works_base_filename, "Related_Works")),
+                'Research Methods Generation': (('Related Works Charting',), _research_methods_step),
+                'Research Methods Charting': (('Research Methods Generation',), _charts_step(research_methodes_base_filename, "Research_Methods")),
+                'Background Generation': (('Related Works Charting', 'Research Methods Charting'), _background_step),
+                'Review Findings Generation': (('Research Methods Charting',), _review_findings_step),
+                'Review Findings Charting': (('Review Findings Generation',), _charts_step(review_findings_base_filename, "Review_Findings")),
+                'Discussion & Conclusion Generation': (('Review Findings Charting',), _discussion_conclusion_step),
+                'Abstract, Keywords & Introduction Generation': (
+                    ('Review Findings Charting', 'Related Works Charting', 'Research Methods Charting', 'Discussion & Conclusion Generation'),
+                    _abstract_intro_step
+                ),
+            }
+            # Sections with feedback of their own are regenerated, and so is everything downstream
+            # whose inputs change as a result; the rest are reused. General suggestions are part of
+            # every section's feedback, so they regenerate all sections, as does a cycle with nothing
+            # section-specific (the critique failed or could not be parsed).
+            sections_with_feedback = [
+                section_feedback_steps[section_key]
+                for section_key, suggestions in current_parsed_critique_data.get("suggestions_by_section", {}).items()
+                if suggestions and section_key in section_feedback_steps
+            ] if iteration > 0 else []
+            if iteration > 0 and (not sections_with_feedback or current_parsed_critique_data.get("general_suggestions")):
+                sections_with_feedback = list(section_feedback_steps.values())
             section_start_time = datetime.now()
-            _update_status(f"    Generating Related Works...")
-            related_works_tex_content = create_related_works(
-                final_summaries_text_for_sections, natural_language_paper_goal, bibliometric_content,
-                reviewer_suggestions=get_suggestions_for_section("Related Works") if iteration > 0 else "",
-                slr_outline=slr_outline,
-                human_style_example_text=oldest_paper_text_for_style
+            section_outputs, section_step_timings, failed_section_step = run_section_graph(
+                section_steps, reuse_cache=section_reuse_cache, changed_steps=sections_with_feedback,
+                on_start=_report_section_step_start
             )
-            if related_works_tex_content.startswith(LLM_ERROR_PREFIXES):
-                _update_status(f"{RED}CRITICAL: LLM API error during Related Works generation: {related_works_tex_content}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
+            reused_section_steps = [name for name in section_steps if name in section_outputs and name not in section_step_timings]
+            if reused_section_steps:
+                _update_status(f"    Reused unchanged from the previous cycle: {', '.join(reused_section_steps)}")
+            current_cycle_section_timings.update(section_step_timings)
+            current_cycle_section_timings['Section Generation (wall clock)'] = datetime.now() - section_start_time
+            if failed_section_step:
+                _update_status(f"{RED}CRITICAL: LLM API error during {failed_section_step}: {section_outputs[failed_section_step]}{RESET}")
+                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path, relevance_assessments)
                 return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path # refinement_report_path might be None
-            related_works_tex_content = replace_placeholders_in_latex(related_works_tex_content, final_counts_for_placeholders)
-            current_cycle_section_timings['Related Works Generation'] = datetime.now() - section_start_time
-            # create_related_works saves to Results/related_works.tex
-            related_works_input_path = os.path.join(results_folder_path, related_works_base_filename)
-            section_start_time = datetime.now()
-            related_works_enhanced_tex = create_charts(related_works_input_path, f"Related_Works_Iter{iteration}")
-            current_cycle_section_timings['Related Works Charting'] = datetime.now() - section_start_time
-            if related_works_enhanced_tex.startswith(LLM_ERROR_PREFIXES): # Check chart enhancement too
-                _update_status(f"{RED}CRITICAL: LLM API error during Related Works chart enhancement: {related_works_enhanced_tex}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
-                return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path
-
-            # Research Methods
-            section_start_time = datetime.now()
-            _update_status(f"    Generating Research Methods...")
-            research_methodes_tex_content = create_reshearch_methodes(
-                related_works_content=related_works_enhanced_tex,
-                summaries=final_summaries_text_for_sections,
-                subject=natural_language_paper_goal,
-                Biblio_content=bibliometric_content,
-                year_range_for_prompt=year_range,
-                reviewer_suggestions=get_suggestions_for_section("Research Methods") if iteration > 0 else "",
-                slr_outline=slr_outline,
-                human_style_example_text=oldest_paper_text_for_style
-            )
-            if research_methodes_tex_content.startswith(LLM_ERROR_PREFIXES):
-                _update_status(f"{RED}CRITICAL: LLM API error during Research Methods generation: {research_methodes_tex_content}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
-                return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path
-            research_methodes_tex_content = replace_placeholders_in_latex(research_methodes_tex_content, final_counts_for_placeholders)
-            current_cycle_section_timings['Research Methods Generation'] = datetime.now() - section_start_time
-            research_methodes_input_path = os.path.join(results_folder_path, research_methodes_base_filename)
-            section_start_time = datetime.now()
-            research_methodes_enhanced_tex = create_charts(research_methodes_input_path, f"Research_Methods_Iter{iteration}")
-            current_cycle_section_timings['Research Methods Charting'] = datetime.now() - section_start_time
-            if research_methodes_enhanced_tex.startswith(LLM_ERROR_PREFIXES):
-                _update_status(f"{RED}CRITICAL: LLM API error during Research Methods chart enhancement: {research_methodes_enhanced_tex}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
-                return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path
-
-            # Background
-            section_start_time = datetime.now()
-            _update_status(f"    Generating Background...")
-            background_tex_content = create_background_string(
-                "", related_works_enhanced_tex, research_methodes_enhanced_tex, "",
-                bibliometric_content,
-                reviewer_suggestions=get_suggestions_for_section("Background") if iteration > 0 else "",
-                slr_outline=slr_outline,
-                human_style_example_text=oldest_paper_text_for_style
-            )
-            if background_tex_content.startswith(LLM_ERROR_PREFIXES):
-                _update_status(f"{RED}CRITICAL: LLM API error during Background generation: {background_tex_content}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
-                return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path
-            background_tex_content = replace_placeholders_in_latex(background_tex_content, final_counts_for_placeholders)
-            current_cycle_section_timings['Background Generation'] = datetime.now() - section_start_time
-
-            # Review Findings
-            section_start_time = datetime.now()
-            _update_status(f"    Generating Review Findings...")
-            review_findings_tex_content = create_review_findings(
-                research_methodes_enhanced_tex, final_summaries_text_for_sections, natural_language_paper_goal, bibliometric_content,
-                reviewer_suggestions=get_suggestions_for_section("Review Findings") if iteration > 0 else "",
-                slr_outline=slr_outline,
-                human_style_example_text=oldest_paper_text_for_style
-            )
-            if review_findings_tex_content.startswith(LLM_ERROR_PREFIXES):
-                _update_status(f"{RED}CRITICAL: LLM API error during Review Findings generation: {review_findings_tex_content}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
-                return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path
-            review_findings_tex_content = replace_placeholders_in_latex(review_findings_tex_content, final_counts_for_placeholders)
-            current_cycle_section_timings['Review Findings Generation'] = datetime.now() - section_start_time
-            review_findings_input_path = os.path.join(results_folder_path, review_findings_base_filename)
-            section_start_time = datetime.now()
-            review_findings_enhanced_tex = create_charts(review_findings_input_path, f"Review_Findings_Iter{iteration}")
-            current_cycle_section_timings['Review Findings Charting'] = datetime.now() - section_start_time
-            if review_findings_enhanced_tex.startswith(LLM_ERROR_PREFIXES):
-                _update_status(f"{RED}CRITICAL: LLM API error during Review Findings chart enhancement: {review_findings_enhanced_tex}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
-                return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path
-
-            # Discussion & Conclusion
-            section_start_time = datetime.now()
-            _update_status(f"    Generating Discussion & Conclusion...")
-            discussion_conclusion_tex_content = create_discussion_conclusion(
-                review_findings_enhanced_tex, final_summaries_text_for_sections, natural_language_paper_goal, bibliometric_content,
-                reviewer_suggestions=get_suggestions_for_section("Discussion_Conclusion") if iteration > 0 else "",
-                slr_outline=slr_outline,
-                human_style_example_text=oldest_paper_text_for_style
-            )
-            if discussion_conclusion_tex_content.startswith(LLM_ERROR_PREFIXES):
-                _update_status(f"{RED}CRITICAL: LLM API error during Discussion/Conclusion generation: {discussion_conclusion_tex_content}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
-                return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path
-            discussion_conclusion_tex_content = replace_placeholders_in_latex(discussion_conclusion_tex_content, final_counts_for_placeholders)
-            current_cycle_section_timings['Discussion & Conclusion Generation'] = datetime.now() - section_start_time
-
-            # Abstract, Keywords & Introduction
-            section_start_time = datetime.now()
-            _update_status(f"    Generating Abstract, Keywords & Introduction...")
-            abstract_intro_keywords_tex_content = create_abstract_intro(
-                review_findings_content=review_findings_enhanced_tex,
-                related_works_content=related_works_enhanced_tex,
-                research_methodes_content=research_methodes_enhanced_tex,
-                discussion_conclusion_content=discussion_conclusion_tex_content,
-                subject=natural_language_paper_goal,
-                Biblio_content=bibliometric_content,
-                reviewer_suggestions=get_suggestions_for_section("Abstract_Intro_Keywords") if iteration > 0 else "",
-                slr_outline=slr_outline,
-                human_style_example_text=oldest_paper_text_for_style
-            )
-            if abstract_intro_keywords_tex_content.startswith(LLM_ERROR_PREFIXES):
-                _update_status(f"{RED}CRITICAL: LLM API error during Abstract/Intro generation: {abstract_intro_keywords_tex_content}{RESET}")
-                processing_summary_report_path = generate_final_processing_report(overall_start_time, datetime.now(), phase_timings, section_generation_timings_per_cycle, counts_for_reporting, iteration_fetch_details, manual_papers_added_details, all_snowballed_papers_added_details, natural_language_paper_goal, results_folder_path)
-                return LLM_API_CRITICAL_FAILURE_TOKEN, refinement_report_path, processing_summary_report_path
-            abstract_intro_keywords_tex_content = replace_placeholders_in_latex(abstract_intro_keywords_tex_content, final_counts_for_placeholders)
-            current_cycle_section_timings['Abstract, Keywords & Introduction Generation'] = datetime.now() - section_start_time
+
+            related_works_enhanced_tex = section_outputs['Related Works Charting']
+            research_methodes_enhanced_tex = section_outputs['Research Methods Charting']
+            background_tex_content = section_outputs['Background Generation']
+            review_findings_enhanced_tex = section_outputs['Review Findings Charting']
+            discussion_conclusion_tex_content = section_outputs['Discussion & Conclusion Generation']
+            abstract_intro_keywords_tex_content = section_outputs['Abstract, Keywords & Introduction Generation']
 
             _update_status(f"  Assembling Full LaTeX Document (Cycle {iteration})...")
             
@@ -4047,9 +5817,11 @@ def process_papers(
                 
                 critique_output_text = generate_critique(current_slr_latex_content, previous_critique_raw_text_for_llm, natural_language_paper_goal)
                 if critique_output_text.startswith(LLM_ERROR_PREFIXES): # Check if critique generation itself failed
-                    _update_status(f"{RED}CRITICAL: LLM API error during critique generation: {critique_output_text}. Continuing without this critique.{RESET}")
+                    _update_status(f"{RED}CRITICAL: LLM API error during critique generation: {critique_output_text}. Continuing without this critique; all sections will be regenerated.{RESET}")
                     # Don't halt the whole process for a failed critique, but log it.
-                    # The loop will continue, and the next iteration will use an empty/previous critique.
+                    # The parsed critique has no section suggestions, so the next cycle regenerates every section.
+                elif not critique_output_text.strip():
+                    _update_status(f"{YELLOW}Warning: Critique for cycle {iteration} was empty. All sections will be regenerated.{RESET}")
                 current_cycle_section_timings['Critique Generation'] = datetime.now() - section_start_time
                 
                 critique_filename = os.path.join(results_folder_path, f"raw_critique_cycle_{iteration}.txt")
@@ -4130,7 +5902,8 @@ def process_papers(
         manual_papers_added_details,
         all_snowballed_papers_added_details,
         natural_language_paper_goal,
-        results_folder_path
+        results_folder_path,
+        relevance_assessments
     )
 
     if iter_output_filename and os.path.exists(iter_output_filename):
@@ -4151,7 +5924,8 @@ def generate_final_processing_report(
     manual_papers_details: List[Dict[str, str]],
     snowballed_papers_details: List[Dict[str, str]],
     slr_goal: str,
-    results_folder: str
+    results_folder: str,
+    relevance_assessments: Optional[List[Dict[str, any]]] = None
 ) -> Optional[str]:
     report_lines = []
     report_lines.append(f"SLR Processing Summary Report for: {slr_goal}")
@@ -4228,6 +6002,17 @@ def generate_final_processing_report(
                 report_lines.append(f"      (Searched for reference: '{detail.get('searched_reference_title', 'N/A Ref Title')[:70]}...')")
         report_lines.append("-" * 40)
 
+    if relevance_assessments:
+        report_lines.append("Relevance Verdicts (score threshold: {:.2f}):".format(RELEVANCE_SCORE_THRESHOLD))
+        for assessment in relevance_assessments:
+            score = assessment.get('relevance_score')
+            score_str = f"{score:.2f}" if score is not None else "n/a"
+            decision = "INCLUDED" if assessment.get('included') else "EXCLUDED"
+            report_lines.append(f"  - [{assessment.get('phase', 'N/A')}] {decision} score={score_str} label={assessment.get('relevance_label') or 'n/a'}: '{assessment.get('title', 'N/A')[:80]}'")
+            if assessment.get('relevance_reason'):
+                report_lines.append(f"      Reason: {assessment['relevance_reason'][:200]}")
+        report_lines.append("-" * 40)
+
     report_lines.append("PRISMA-like Counts / Other Metrics:")
     for key, value in prisma_counts.items():
         report_lines.append(f"  - {key.replace('_', ' ').title()}: {value}")
@@ -4405,8 +6190,6 @@ Return *only* the complete LaTeX code for the `\section{{Background}}`. Do not i
 """
     prompt_instructions += f"\n\n{LATEX_SAFETY_RULES}"
 
-    uploaded_files_map = {}
-    temp_files_paths = {}
     files_to_upload_content = {
         "review_findings_data.txt": review_findings,
         "related_works_data.txt": related_works,
@@ -4417,33 +6200,12 @@ Return *only* the complete LaTeX code for the `\section{{Background}}`. Do not i
     }
 
     try:
-        for name, content_str in files_to_upload_content.items():
-            if content_str and content_str.strip() and not content_str.startswith("% Error"):
-                with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".txt" if not name.endswith(".bib") else ".bib", encoding='utf-8') as tmp_f:
-                    tmp_f.write(content_str)
-                    temp_files_paths[name] = tmp_f.name
-                
-                mime_type = 'text/plain'
-                if name.endswith(".md"): mime_type = 'text/markdown'
-                elif name.endswith(".bib"): mime_type = 'text/plain' # BibTeX is plain text
-
-                uploaded_files_map[name] = genai.upload_file(
-                    path=temp_files_paths[name],
-                    mime_type=mime_type,
-                    display_name=name
-                )
-            else:
-                 # Create an empty placeholder if content is invalid/empty, so prompt references don't break
-                uploaded_files_map[name] = genai.upload_file(
-                    path=io.BytesIO(b"% This file was intentionally left empty due to invalid input content.\n"), # Upload empty content
-                    mime_type='text/plain',
-                    display_name=name
-                )
+        uploaded_context_files = upload_section_context_files(files_to_upload_content)
 
 
-        prompt_parts_for_llm = [prompt_instructions] + [f for f in uploaded_files_map.values() if f]
+        prompt_parts_for_llm = [prompt_instructions] + uploaded_context_files
         
-        response = summary_model.generate_content(
+        response = generate_with_rate_limit(
             prompt_parts_for_llm,
             generation_config=genai.types.GenerationConfig(temperature=0.7)
         )
@@ -4462,16 +6224,6 @@ Return *only* the complete LaTeX code for the `\section{{Background}}`. Do not i
     except Exception as e:
         print(f"{RED}Error in create_background_string: {e}{RESET}")
         return f"% Error generating background section: {e}"
-    finally:
-        for name, uploaded_file_obj in uploaded_files_map.items():
-            if uploaded_file_obj:
-                try:
-                    genai.delete_file(uploaded_file_obj.name)
-                except Exception as delete_err:
-                    print(f"{YELLOW}Warning: Could not delete uploaded file {name} in create_background_string: {delete_err}{RESET}")
-        for name, path in temp_files_paths.items():
-            if path and os.path.exists(path):
-                os.remove(path)
 def create_related_works(summaries: str,
                          subject: str,
                          Biblio_content:str, 
@@ -4519,8 +6271,10 @@ Instead, draw inspiration from the **narrative style, sentence flow, phrasing nu
 Before finalizing your response for this section, reread it and ask yourself: "Does this sound like a human wrote it, or does it have tell-tale signs of AI generation?" Adjust as needed.
 """
 
-    prompt = rf"""
+    prompt_instructions = rf"""
 Create a comprehensive **Related Works** section for a systematic literature review (SLR) on the subject: **{subject}**make sure it's detailed , academicale , and huminazed.
+The summaries of papers to be used are in the uploaded 'summaries_data.txt' file.
+The BibTeX bibliography for context is in the uploaded 'biblio_context.bib' file.
 
 {suggestions_addon}
 {outline_addon}
@@ -4529,7 +6283,7 @@ Create a comprehensive **Related Works** section for a systematic literature rev
 ### Requirements:
 1.  **Content and Structure**:
     *   Start with `\section{{Related Works}}`.
-    *   Analyze the provided paper summaries to identify themes, trends, compare methodologies, and discuss how they relate to `{subject}`. 
+    *   Analyze the paper summaries from the uploaded 'summaries_data.txt' to identify themes, trends, compare methodologies, and discuss how they relate to `{subject}`. 
     *   Present the existing research as if narrating what others have done in a review conversation. Use phrases like ‘Some researchers explored…’, ‘One study we found particularly insightful was…’, or ‘Unlike approach X, this work Y took a different path…’.
     *   Focus on papers that are highly relevant to `{subject}`. If summaries indicate irrelevance, they should be downplayed or omitted from detailed discussion.
     *   Synthesize information into a cohesive narrative. Avoid a simple list of summaries. Group related papers by theme or approach, guided by the SLR outline if provided.
@@ -4538,19 +6292,15 @@ Create a comprehensive **Related Works** section for a systematic literature rev
     *   Maintain a formal academic tone.
     *   Logically link paragraphs and ideas.
 3.  **Citations**:
-    *   Use `\cite{{bibtex_key}}` for all references to the summarized papers. Infer BibTeX keys from the provided Bibliography content (e.g., AuthorYear, or a key part of the title).
+    *   Use `\cite{{bibtex_key}}` for all references to the summarized papers. Infer BibTeX keys from the uploaded 'biblio_context.bib' (e.g., AuthorYear, or a key part of the title).
     *   Ensure every claim or piece of information derived from a summary is appropriately cited.
 4.  **LaTeX Formatting**:
     *   Output *only* Overleaf-compatible LaTeX code for this section.
     *   Do NOT include `\documentclass`, `\begin{{document}}`, `\end{{document}}`, or `\usepackage` commands.
-5.  **Bibliography for Context (DO NOT REPRODUCE IN OUTPUT, FOR CITATION KEY INFERENCE ONLY)**:
-    ```bibtex
-    {Biblio_content}
-    ```
+5.  **Bibliography for Context (DO NOT REPRODUCE IN OUTPUT, FOR CITATION KEY INFERENCE ONLY)**: uploaded 'biblio_context.bib'
 
 ### Input Data:
--   **Summaries of Papers**:
-    {summaries}
+-   **Summaries of Papers**: uploaded 'summaries_data.txt'
 -   **SLR Subject**: {subject}
 
 Return *only* the complete LaTeX code for the `\section{{Related Works}}`.
@@ -4561,7 +6311,37 @@ make sure you use the same kind of vocabulary , the same way of narratting, adn
 {Human_Text}
 --- END OF SAMPLE TEXT ---
 """
-    return generate_markdown(prompt + f"\n\n{LATEX_SAFETY_RULES}", 'Results/related_works.tex')
+    prompt_instructions += f"\n\n{LATEX_SAFETY_RULES}"
+
+    files_to_upload_content = {
+        "summaries_data.txt": summaries,
+        "biblio_context.bib": Biblio_content
+    }
+    try:
+        uploaded_context_files = upload_section_context_files(files_to_upload_content)
+
+        prompt_parts_for_llm = [prompt_instructions] + uploaded_context_files
+
+        response = generate_with_rate_limit(
+            prompt_parts_for_llm,
+            generation_config=genai.types.GenerationConfig(temperature=0.7)
+        )
+        generated_text = response.text.strip()
+        generated_text = re.sub(r'^```(?:latex)?\s*[\r\n]*', '', generated_text, flags=re.MULTILINE)
+        generated_text = re.sub(r'[\r\n]*```\s*$', '', generated_text, flags=re.MULTILINE)
+        generated_text = re.sub(r'\\cite\s*\{\s*([^}\s]+)\s*\}', r'\\cite{\1}', generated_text)
+        save_usage_metadata(response.usage_metadata, inspect.currentframe().f_code.co_name)
+        output_filename = 'Results/related_works.tex'
+        os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+        with open(output_filename, 'w', encoding='utf-8') as file:
+            file.write(generated_text)
+        print(f"Generated {output_filename}")
+        return generated_text
+
+    except Exception as e:
+        print(f"{RED}Error in create_related_works: {e}{RESET}")
+        return f"% Error generating related_works section: {e}"
+
 
 def create_reshearch_methodes(
     related_works_content: str,
@@ -4630,41 +6410,18 @@ Return *only* the complete LaTeX code for the `\section{{Research Methods}}`.
 """
     prompt_instructions += f"\n\n{LATEX_SAFETY_RULES}"
 
-    uploaded_files_map = {}
-    temp_files_paths = {}
     files_to_upload_content = {
         "related_works_data.txt": related_works_content,
         "summaries_data.txt": summaries,
         "biblio_context.bib": Biblio_content,
         "human_style_sample.txt": actual_human_style_text
     }
-    # ... (identical try/finally block for file upload and cleanup as in create_background_string) ...
     try:
-        for name, content_str in files_to_upload_content.items():
-            if content_str and content_str.strip() and not content_str.startswith("% Error"):
-                with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".txt" if not name.endswith(".bib") else ".bib", encoding='utf-8') as tmp_f:
-                    tmp_f.write(content_str)
-                    temp_files_paths[name] = tmp_f.name
-                
-                mime_type = 'text/plain'
-                if name.endswith(".md"): mime_type = 'text/markdown'
-                elif name.endswith(".bib"): mime_type = 'text/plain'
-
-                uploaded_files_map[name] = genai.upload_file(
-                    path=temp_files_paths[name],
-                    mime_type=mime_type,
-                    display_name=name
-                )
-            else:
-                uploaded_files_map[name] = genai.upload_file(
-                    path=io.BytesIO(b"% This file was intentionally left empty due to invalid input content.\n"),
-                    mime_type='text/plain',
-                    display_name=name
-                )
+        uploaded_context_files = upload_section_context_files(files_to_upload_content)
 
-        prompt_parts_for_llm = [prompt_instructions] + [f for f in uploaded_files_map.values() if f]
+        prompt_parts_for_llm = [prompt_instructions] + uploaded_context_files
         
-        response = summary_model.generate_content(
+        response = generate_with_rate_limit(
             prompt_parts_for_llm,
             generation_config=genai.types.GenerationConfig(temperature=0.7)
         )
@@ -4683,16 +6440,6 @@ Return *only* the complete LaTeX code for the `\section{{Research Methods}}`.
     except Exception as e:
         print(f"{RED}Error in create_reshearch_methodes: {e}{RESET}")
         return f"% Error generating research_methodes section: {e}"
-    finally:
-        for name, uploaded_file_obj in uploaded_files_map.items():
-            if uploaded_file_obj:
-                try:
-                    genai.delete_file(uploaded_file_obj.name)
-                except Exception as delete_err:
-                    print(f"{YELLOW}Warning: Could not delete uploaded file {name} in create_reshearch_methodes: {delete_err}{RESET}")
-        for name, path in temp_files_paths.items():
-            if path and os.path.exists(path):
-                os.remove(path)
 def create_review_findings(research_methodes_content: str, 
                            summaries: str, 
                            subject: str, 
@@ -4747,41 +6494,18 @@ Return *only* the complete LaTeX code for the `\section{{Review Findings}}`.
 """
     prompt_instructions += f"\n\n{LATEX_SAFETY_RULES}"
 
-    uploaded_files_map = {}
-    temp_files_paths = {}
     files_to_upload_content = {
         "research_methodes_data.txt": research_methodes_content,
         "summaries_data.txt": summaries,
         "biblio_context.bib": Biblio_content,
         "human_style_sample.txt": actual_human_style_text
     }
-    # ... (identical try/finally block for file upload and cleanup as in create_background_string) ...
     try:
-        for name, content_str in files_to_upload_content.items():
-            if content_str and content_str.strip() and not content_str.startswith("% Error"):
-                with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".txt" if not name.endswith(".bib") else ".bib", encoding='utf-8') as tmp_f:
-                    tmp_f.write(content_str)
-                    temp_files_paths[name] = tmp_f.name
-                
-                mime_type = 'text/plain'
-                if name.endswith(".md"): mime_type = 'text/markdown'
-                elif name.endswith(".bib"): mime_type = 'text/plain'
-
-                uploaded_files_map[name] = genai.upload_file(
-                    path=temp_files_paths[name],
-                    mime_type=mime_type,
-                    display_name=name
-                )
-            else:
-                uploaded_files_map[name] = genai.upload_file(
-                    path=io.BytesIO(b"% This file was intentionally left empty due to invalid input content.\n"),
-                    mime_type='text/plain',
-                    display_name=name
-                )
+        uploaded_context_files = upload_section_context_files(files_to_upload_content)
 
-        prompt_parts_for_llm = [prompt_instructions] + [f for f in uploaded_files_map.values() if f]
+        prompt_parts_for_llm = [prompt_instructions] + uploaded_context_files
         
-        response = summary_model.generate_content(
+        response = generate_with_rate_limit(
             prompt_parts_for_llm,
             generation_config=genai.types.GenerationConfig(temperature=0.7)
         )
@@ -4800,16 +6524,6 @@ Return *only* the complete LaTeX code for the `\section{{Review Findings}}`.
     except Exception as e:
         print(f"{RED}Error in create_review_findings: {e}{RESET}")
         return f"% Error generating review_findings section: {e}"
-    finally:
-        for name, uploaded_file_obj in uploaded_files_map.items():
-            if uploaded_file_obj:
-                try:
-                    genai.delete_file(uploaded_file_obj.name)
-                except Exception as delete_err:
-                    print(f"{YELLOW}Warning: Could not delete uploaded file {name} in create_review_findings: {delete_err}{RESET}")
-        for name, path in temp_files_paths.items():
-            if path and os.path.exists(path):
-                os.remove(path)
 def create_discussion_conclusion(review_findings_content: str, 
                                  summaries: str, 
                                  subject: str, 
@@ -4865,41 +6579,18 @@ Return *only* the complete LaTeX code for the `\section{{Discussion}}` and `\sec
 """
     prompt_instructions += f"\n\n{LATEX_SAFETY_RULES}"
 
-    uploaded_files_map = {}
-    temp_files_paths = {}
     files_to_upload_content = {
         "review_findings_data.txt": review_findings_content,
         "summaries_data.txt": summaries,
         "biblio_context.bib": Biblio_content,
         "human_style_sample.txt": actual_human_style_text
     }
-    # ... (identical try/finally block for file upload and cleanup as in create_background_string) ...
     try:
-        for name, content_str in files_to_upload_content.items():
-            if content_str and content_str.strip() and not content_str.startswith("% Error"):
-                with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".txt" if not name.endswith(".bib") else ".bib", encoding='utf-8') as tmp_f:
-                    tmp_f.write(content_str)
-                    temp_files_paths[name] = tmp_f.name
-                
-                mime_type = 'text/plain'
-                if name.endswith(".md"): mime_type = 'text/markdown'
-                elif name.endswith(".bib"): mime_type = 'text/plain'
-
-                uploaded_files_map[name] = genai.upload_file(
-                    path=temp_files_paths[name],
-                    mime_type=mime_type,
-                    display_name=name
-                )
-            else:
-                uploaded_files_map[name] = genai.upload_file(
-                    path=io.BytesIO(b"% This file was intentionally left empty due to invalid input content.\n"),
-                    mime_type='text/plain',
-                    display_name=name
-                )
+        uploaded_context_files = upload_section_context_files(files_to_upload_content)
 
-        prompt_parts_for_llm = [prompt_instructions] + [f for f in uploaded_files_map.values() if f]
+        prompt_parts_for_llm = [prompt_instructions] + uploaded_context_files
         
-        response = summary_model.generate_content(
+        response = generate_with_rate_limit(
             prompt_parts_for_llm,
             generation_config=genai.types.GenerationConfig(temperature=0.7)
         )
@@ -4918,16 +6609,6 @@ Return *only* the complete LaTeX code for the `\section{{Discussion}}` and `\sec
     except Exception as e:
         print(f"{RED}Error in create_discussion_conclusion: {e}{RESET}")
         return f"% Error generating discussion_conclusion section: {e}"
-    finally:
-        for name, uploaded_file_obj in uploaded_files_map.items():
-            if uploaded_file_obj:
-                try:
-                    genai.delete_file(uploaded_file_obj.name)
-                except Exception as delete_err:
-                    print(f"{YELLOW}Warning: Could not delete uploaded file {name} in create_discussion_conclusion: {delete_err}{RESET}")
-        for name, path in temp_files_paths.items():
-            if path and os.path.exists(path):
-                os.remove(path)
 
 def create_abstract_intro(review_findings_content: str, 
                           related_works_content:str, 
@@ -4983,8 +6664,6 @@ Return *only* the LaTeX code for the Abstract (within `\begin{{abstract}}...\end
 """
     prompt_instructions += f"\n\n{LATEX_SAFETY_RULES}"
 
-    uploaded_files_map = {}
-    temp_files_paths = {}
     files_to_upload_content = {
         "review_findings_data.txt": review_findings_content,
         "related_works_data.txt": related_works_content,
@@ -4993,33 +6672,12 @@ Return *only* the LaTeX code for the Abstract (within `\begin{{abstract}}...\end
         "biblio_context.bib": Biblio_content,
         "human_style_sample.txt": actual_human_style_text
     }
-    # ... (identical try/finally block for file upload and cleanup as in create_background_string) ...
     try:
-        for name, content_str in files_to_upload_content.items():
-            if content_str and content_str.strip() and not content_str.startswith("% Error"):
-                with tempfile.NamedTemporaryFile(mode="w+", delete=False, suffix=".txt" if not name.endswith(".bib") else ".bib", encoding='utf-8') as tmp_f:
-                    tmp_f.write(content_str)
-                    temp_files_paths[name] = tmp_f.name
-                
-                mime_type = 'text/plain'
-                if name.endswith(".md"): mime_type = 'text/markdown'
-                elif name.endswith(".bib"): mime_type = 'text/plain'
-
-                uploaded_files_map[name] = genai.upload_file(
-                    path=temp_files_paths[name],
-                    mime_type=mime_type,
-                    display_name=name
-                )
-            else:
-                uploaded_files_map[name] = genai.upload_file(
-                    path=io.BytesIO(b"% This file was intentionally left empty due to invalid input content.\n"),
-                    mime_type='text/plain',
-                    display_name=name
-                )
+        uploaded_context_files = upload_section_context_files(files_to_upload_content)
 
-        prompt_parts_for_llm = [prompt_instructions] + [f for f in uploaded_files_map.values() if f]
+        prompt_parts_for_llm = [prompt_instructions] + uploaded_context_files
         
-        response = summary_model.generate_content(
+        response = generate_with_rate_limit(
             prompt_parts_for_llm,
             generation_config=genai.types.GenerationConfig(temperature=0.7)
         )
@@ -5038,13 +6696,3 @@ Return *only* the LaTeX code for the Abstract (within `\begin{{abstract}}...\end
     except Exception as e:
         print(f"{RED}Error in create_abstract_intro: {e}{RESET}")
         return f"% Error generating abstract_intro_keywords section: {e}"
-    finally:
-        for name, uploaded_file_obj in uploaded_files_map.items():
-            if uploaded_file_obj:
-                try:
-                    genai.delete_file(uploaded_file_obj.name)
-                except Exception as delete_err:
-                    print(f"{YELLOW}Warning: Could not delete uploaded file {name} in create_abstract_intro: {delete_err}{RESET}")
-        for name, path in temp_files_paths.items():
-            if path and os.path.exists(path):
-                os.remove(path)
\ No newline at end of file
@@ -0,0 +1,69 @@
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterable, Iterator
+
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+ARXIV_NS = '{http://arxiv.org/schemas/atom}'
+ARXIV_FEED_CHUNK_SIZE = 16 * 1024 # Bytes fed to the streaming Atom parser at a time
+
+def iter_atom_entries(chunks: Iterable[bytes]) -> Iterator[ET.Element]:
+    """
+    Incrementally parses an arXiv Atom feed from byte chunks (e.g. response.iter_content())
+    and yields each <entry> element as soon as it closes. An entry is cleared from the tree
+    once the caller moves on, so memory stays flat however large the page is.
+    Raises ET.ParseError on malformed XML.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+
+    def _drain():
+        nonlocal root
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = elem
+            elif elem.tag == ATOM_NS + 'entry':
+                yield elem
+                root.clear()
+
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+            yield from _drain()
+    parser.close()
+    yield from _drain()
+
+
+def atom_entry_record(entry: ET.Element) -> Dict[str, Any]:
+    """Flattens one Atom <entry> into a plain dict in a single pass over its children."""
+    record = {'id_url': '', 'title': '', 'summary': '', 'published': '', 'authors': [],
+              'doi': '', 'journal_ref': '', 'pdf_link': ''}
+    for child in entry:
+        text = (child.text or '').strip()
+        if child.tag == ATOM_NS + 'id':
+            record['id_url'] = text
+        elif child.tag == ATOM_NS + 'title':
+            record['title'] = text
+        elif child.tag == ATOM_NS + 'summary':
+            record['summary'] = re.sub(r'\s+', ' ', text)
+        elif child.tag == ATOM_NS + 'published':
+            record['published'] = text
+        elif child.tag == ATOM_NS + 'author':
+            name = child.find(ATOM_NS + 'name')
+            if name is not None and name.text:
+                record['authors'].append(name.text)
+        elif child.tag == ATOM_NS + 'link' and child.get('title') == 'pdf':
+            record['pdf_link'] = child.get('href', '')
+        elif child.tag == ARXIV_NS + 'doi':
+            record['doi'] = text
+        elif child.tag == ARXIV_NS + 'journal_ref':
+            record['journal_ref'] = text
+    return record
+
+def iter_arxiv_atom_entries(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """
+    Streams an arXiv Atom feed through iter_atom_entries and yields one flat record
+    (atom_entry_record) per <entry>. Raises ET.ParseError on malformed XML.
+    """
+    for entry in iter_atom_entries(chunks):
+        yield atom_entry_record(entry)
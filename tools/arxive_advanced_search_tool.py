@@ -5,6 +5,10 @@ from datetime import datetime
 from typing import List, Dict, Tuple
 import time
 from langchain.tools import tool
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # noqa: E402
+from tools.arxiv_feed import ARXIV_FEED_CHUNK_SIZE, iter_arxiv_atom_entries
 
 
 def fetch_arxiv_papers(
@@ -37,62 +41,36 @@ def fetch_arxiv_papers(
         # Add delay to respect arXiv's rate limit (3 seconds between requests)
         time.sleep(3)
         
-        response = requests.get(query_url)
-        response.raise_for_status()
-        
-        # Parse the XML response
-        root = ET.fromstring(response.content)
-        
-        # Define XML namespaces used in arXiv's response
-        namespaces = {
-            'atom': 'http://www.w3.org/2005/Atom',
-            'arxiv': 'http://arxiv.org/schemas/atom'
-        }
-        
-        citation_number = 1  # Start citation numbering
-        
-        # Process each entry (paper)
-        for entry in root.findall('atom:entry', namespaces):
-            # Extract publication date and filter by year range
-            published_date = entry.find('atom:published', namespaces).text
-            published_year = int(published_date[:4])
-            if not (year_range[0] <= published_year <= year_range[1]):
-                continue
-            
-            # Extract authors
-            authors = []
-            for author in entry.findall('atom:author/atom:name', namespaces):
-                authors.append(author.text)
-            
-            # Get the main link to the paper
-            paper_link = ''
-            for link in entry.findall('atom:link', namespaces):
-                if link.get('type') == 'text/html':
-                    paper_link = link.get('href')
-                    break
-            
-            # Get PDF link
-            pdf_link = ''
-            for link in entry.findall('atom:link', namespaces):
-                if link.get('title') == 'pdf':
-                    pdf_link = link.get('href')
+        # The streamed connection is released when the block exits, including on errors
+        with requests.get(query_url, stream=True) as response:
+            response.raise_for_status()
+
+            # The XML response is parsed as it streams in (see iter_arxiv_atom_entries)
+            citation_number = 1  # Start citation numbering
+
+            # Process each entry (paper); each record's fields come from one pass over the entry
+            for entry in iter_arxiv_atom_entries(response.iter_content(chunk_size=ARXIV_FEED_CHUNK_SIZE)):
+                # Extract publication date and filter by year range
+                published_date = entry['published']
+                published_year = int(published_date[:4])
+                if not (year_range[0] <= published_year <= year_range[1]):
+                    continue
+
+                paper = {
+                    'citation_number': citation_number,
+                    'title': entry['title'],
+                    'abstract': entry['summary'],
+                    'published': published_date[:10],
+                    'pdf_url': entry['pdf_link']
+                }
+
+                papers.append(paper)
+                citation_number += 1  # Increment citation number
+
+                # Stop if we’ve collected enough papers
+                if len(papers) >= max_results:
                     break
             
-            paper = {
-                'citation_number': citation_number,
-                'title': entry.find('atom:title', namespaces).text.strip(),
-                'abstract': entry.find('atom:summary', namespaces).text.strip().replace('\n', ' '),
-                'published': published_date[:10],
-                'pdf_url': pdf_link
-            }
-            
-            papers.append(paper)
-            citation_number += 1  # Increment citation number
-            
-            # Stop if we’ve collected enough papers
-            if len(papers) >= max_results:
-                break
-            
     except requests.exceptions.RequestException as e:
         raise RuntimeError(f"Error fetching papers: {e}")
     except ET.ParseError as e:
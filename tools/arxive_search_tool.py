@@ -5,6 +5,10 @@ import time
 from datetime import datetime
 from typing import Tuple
 import pdfplumber  # Make sure to install pdfplumber via pip
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # noqa: E402
+from tools.arxiv_feed import ARXIV_FEED_CHUNK_SIZE, iter_arxiv_atom_entries
 
 def fetch_arxiv_papers(
     Keywords: str,
@@ -43,43 +47,28 @@ def fetch_arxiv_papers(
         # Add delay to respect arXiv's rate limit (3 seconds between requests)
         time.sleep(3)
         
-        response = requests.get(query_url)
-        response.raise_for_status()
-        
-        # Parse the XML response
-        root = ET.fromstring(response.content)
-        
-        # Define XML namespaces used in arXiv's response
-        namespaces = {
-            'atom': 'http://www.w3.org/2005/Atom',
-            'arxiv': 'http://arxiv.org/schemas/atom'
-        }
-        
+        # Entries are collected first so the streamed feed connection is released (also on
+        # errors) before any PDF is downloaded
+        with requests.get(query_url, stream=True) as response:
+            response.raise_for_status()
+            # The XML response is parsed as it streams in (see iter_arxiv_atom_entries)
+            entries = list(iter_arxiv_atom_entries(response.iter_content(chunk_size=ARXIV_FEED_CHUNK_SIZE)))
+
         # Process each entry (paper)
-        for entry in root.findall('atom:entry', namespaces):
+        for entry in entries:
             # Extract publication date and filter by year range
-            published_date = entry.find('atom:published', namespaces).text
+            published_date = entry['published']
             published_year = int(published_date[:4])
             if not (year_range[0] <= published_year <= year_range[1]):
                 continue
-            
-            # Extract authors
-            authors = []
-            for author in entry.findall('atom:author/atom:name', namespaces):
-                authors.append(author.text)
-            
-            # Get PDF link
-            pdf_link = ''
-            for link in entry.findall('atom:link', namespaces):
-                if link.get('title') == 'pdf':
-                    pdf_link = link.get('href')
-                    break
-            
+
+            authors = entry['authors']
+            pdf_link = entry['pdf_link']
+            paper_title = entry['title']
+
             # Construct the citation
-            citation = f"{', '.join(authors)}. \"{entry.find('atom:title', namespaces).text.strip()}\". arXiv:{entry.find('atom:id', namespaces).text.split('/')[-1]}. Published on {published_date[:10]}."
-            
-            paper_title = entry.find('atom:title', namespaces).text.strip()
-            
+            citation = f"{', '.join(authors)}. \"{paper_title}\". arXiv:{entry['id_url'].split('/')[-1]}. Published on {published_date[:10]}."
+
             # Download PDF file
             pdf_response = requests.get(pdf_link)
             if pdf_response.status_code == 200:
@@ -92,7 +81,7 @@ def fetch_arxiv_papers(
                     full_text = ""
                     for page in pdf.pages:
                         full_text += page.extract_text() + "\n"
-                
+
                 # Save extracted content to a text file named after the paper title
                 txt_filename = f"{paper_title.replace('/', '_')}.txt"
                 with open(txt_filename, 'w', encoding='utf-8') as txt_file:
@@ -100,7 +89,7 @@ def fetch_arxiv_papers(
                     txt_file.write(f"Citation: {citation}\n")
                     txt_file.write(f"Published Date: {published_date[:10]}\n")
                     txt_file.write(f"Full Text:\n{full_text}\n")
-                    
+
                 paper = {
                     'title': paper_title,
                     'citation': citation,
@@ -108,7 +97,7 @@ def fetch_arxiv_papers(
                     'pdf_url': pdf_link,
                     'txt_filename': txt_filename  # Save filename for reference
                 }
-                
+
                 papers.append(paper)
 
         return "Done: Successfully fetched and saved papers."
@@ -0,0 +1,57 @@
+import random
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- Constants for the shared HTTP session ---
+HTTP_POOL_CONNECTIONS = 10 # Number of hosts whose connection pools are kept alive
+HTTP_POOL_MAXSIZE_PER_HOST = 6 # Max simultaneous connections to one host; extra requests wait for a free one
+HTTP_MAX_RETRIES = 4 # Retries for connection errors and HTTP_RETRY_STATUS_CODES
+HTTP_BACKOFF_FACTOR = 1.0 # Exponential backoff base in seconds (1, 2, 4, 8...)
+HTTP_BACKOFF_JITTER = 1.0 # Up to this many random seconds are added to each backoff
+HTTP_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class JitteredRetry(Retry):
+    """Retry policy adding random jitter to urllib3's exponential backoff. A Retry-After header still takes precedence."""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        return backoff + random.uniform(0, HTTP_BACKOFF_JITTER)
+
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the process-wide requests.Session used by every fetcher (ArXiv, Scopus, PDF downloads).
+    Connections are kept alive and pooled per host, and 429/5xx responses and connection
+    errors are retried with jittered exponential backoff, honouring Retry-After.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            retry_policy = JitteredRetry(
+                total=HTTP_MAX_RETRIES,
+                backoff_factor=HTTP_BACKOFF_FACTOR,
+                status_forcelist=HTTP_RETRY_STATUS_CODES,
+                allowed_methods=frozenset(["GET", "HEAD"]),
+                respect_retry_after_header=True,
+                raise_on_status=False # Callers inspect the final response themselves
+            )
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE_PER_HOST,
+                pool_block=True,
+                max_retries=retry_policy
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
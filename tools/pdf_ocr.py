@@ -0,0 +1,79 @@
+import os
+from typing import Dict
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+
+import pytesseract # type: ignore
+from pdf2image import convert_from_path, pdfinfo_from_path # type: ignore
+
+# Optional: If tesseract is not in PATH
+# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# --- Constants for OCR ---
+OCR_DPI = 200 # Rasterization resolution; 200 is enough for Tesseract on body text
+OCR_GRAYSCALE = True # Grayscale pages use a third of the memory of RGB
+OCR_MAX_WORKERS = os.cpu_count() or 1 # Pages rasterized and OCRed in parallel; 1 disables the pool
+OCR_MAX_IN_FLIGHT_PAGES = 2 * OCR_MAX_WORKERS # Bounds memory: pages queued or being processed at once
+
+def ocr_pdf_page(pdf_path: str, page_number: int, dpi: int = OCR_DPI, grayscale: bool = OCR_GRAYSCALE) -> str:
+    """
+    Rasterizes and OCRs a single (1-based) page of a PDF.
+    Runs in a worker process; only this page's image is ever held in memory.
+    """
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number, grayscale=grayscale)
+    return pytesseract.image_to_string(images[0]) if images else ""
+
+def convert_pdf_to_text_ocr(
+    pdf_path: str,
+    txt_out_path: str,
+    dpi: int = OCR_DPI,
+    grayscale: bool = OCR_GRAYSCALE,
+    max_workers: int = OCR_MAX_WORKERS,
+    max_in_flight_pages: int = OCR_MAX_IN_FLIGHT_PAGES
+) -> bool:
+    """
+    Converts a PDF to text using OCR (Tesseract), for image-based PDFs such as Scopus downloads.
+    Pages are rasterized and OCRed in a process pool with at most max_in_flight_pages
+    queued at once, and page text is streamed to the output file in page order as
+    pages finish.
+    """
+    partial_path = txt_out_path + ".part"
+    try:
+        # Ensure output directory for the .txt file exists
+        os.makedirs(os.path.dirname(txt_out_path) or ".", exist_ok=True)
+        page_count = int(pdfinfo_from_path(pdf_path)["Pages"])
+
+        with open(partial_path, "w", encoding="utf-8") as out_file:
+            def _write_page(page_number: int, text: str) -> None:
+                separator = "" if page_number == 1 else "\n\n"
+                out_file.write(f"{separator}--- Page {page_number} ---\n{text.strip()}")
+
+            if max_workers <= 1 or page_count <= 1:
+                for page_number in range(1, page_count + 1):
+                    _write_page(page_number, ocr_pdf_page(pdf_path, page_number, dpi, grayscale))
+            else:
+                finished_pages: Dict[int, str] = {}
+                next_page_to_submit = 1
+                next_page_to_write = 1
+                with ProcessPoolExecutor(max_workers=min(max_workers, page_count)) as executor:
+                    in_flight: Dict[Future, int] = {}
+                    while next_page_to_write <= page_count:
+                        while next_page_to_submit <= page_count and len(in_flight) + len(finished_pages) < max(1, max_in_flight_pages):
+                            future = executor.submit(ocr_pdf_page, pdf_path, next_page_to_submit, dpi, grayscale)
+                            in_flight[future] = next_page_to_submit
+                            next_page_to_submit += 1
+                        done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                        for future in done:
+                            finished_pages[in_flight.pop(future)] = future.result()
+                        # Pages finishing out of order wait here until the gap before them is filled
+                        while next_page_to_write in finished_pages:
+                            _write_page(next_page_to_write, finished_pages.pop(next_page_to_write))
+                            next_page_to_write += 1
+
+        os.replace(partial_path, txt_out_path)
+        print(f"    OCR Success: Saved {txt_out_path}")
+        return True
+    except Exception as e:
+        print(f"    [!] OCR failed for {pdf_path}: {e}")
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return False
@@ -1,12 +1,11 @@
 import os
 import re
-import requests
-import tempfile
+import sys
 from typing import Dict, List
 
-import pytesseract
-from pdf2image import convert_from_path
-from PIL import Image
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # noqa: E402
+from tools.http_session import get_http_session
+from tools.pdf_ocr import convert_pdf_to_text_ocr
 
 API_KEY = "df21b06b13dd1a95c37ba72e5c47fab5"
 SCOPUS_SEARCH_URL = "https://api.elsevier.com/content/search/scopus"
@@ -15,9 +14,6 @@ SCOPUS_ARTICLE_BASE = "https://api.elsevier.com/content/article/doi/"
 SCOPUS_FOLDER = "scopus"
 TXT_OUTPUT_FOLDER = r"C:\Users\user\Documents\slr-auto\tools\txt_papers"
 
-# Optional: If tesseract is not in PATH
-# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
 def sanitize_filename(name: str) -> str:
     name = name.strip().replace(" ", "_")
     return re.sub(r"(?u)[^\-\w.]", "", name)
@@ -41,24 +37,6 @@ def save_abstract(entry: Dict, out_folder: str) -> bool:
         f.write(abstract.strip())
     return True
 
-def convert_pdf_to_text(pdf_path: str, txt_out_path: str) -> bool:
-    try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            images = convert_from_path(pdf_path, output_folder=temp_dir)
-            full_text = ""
-            for i, img in enumerate(images):
-                text = pytesseract.image_to_string(img)
-                full_text += f"\n\n--- Page {i + 1} ---\n{text}"
-
-        os.makedirs(os.path.dirname(txt_out_path), exist_ok=True)
-        with open(txt_out_path, "w", encoding="utf-8") as f:
-            f.write(full_text.strip())
-
-        return True
-    except Exception as e:
-        print(f"    [!] OCR failed for {pdf_path}: {e}")
-        return False
-
 def download_pdf_by_doi(doi: str, out_folder: str) -> bool:
     if not doi:
         return False
@@ -74,13 +52,13 @@ def download_pdf_by_doi(doi: str, out_folder: str) -> bool:
     params = {"httpAccept": "application/pdf"}
     url = SCOPUS_ARTICLE_BASE + doi
 
-    resp = requests.get(url, headers=headers, params=params, stream=True)
+    resp = get_http_session().get(url, headers=headers, params=params, stream=True, timeout=60)
     if resp.status_code == 200:
         with open(pdf_path, "wb") as f:
             for chunk in resp.iter_content(chunk_size=8192):
                 f.write(chunk)
 
-        if convert_pdf_to_text(pdf_path, txt_path):
+        if convert_pdf_to_text_ocr(pdf_path, txt_path):
             print(f"    • PDF converted to TXT: {txt_path}")
             return True
         else:
@@ -99,7 +77,7 @@ def fetch_scopus_batch(query: str, start: int, count: int) -> List[Dict]:
         "start": start,
         "count": count
     }
-    resp = requests.get(SCOPUS_SEARCH_URL, headers=headers, params=params)
+    resp = get_http_session().get(SCOPUS_SEARCH_URL, headers=headers, params=params, timeout=30)
     if resp.status_code != 200:
         raise RuntimeError(f"Error fetching Scopus batch: {resp.status_code} — {resp.text}")
     data = resp.json()